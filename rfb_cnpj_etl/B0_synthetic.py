@@ -0,0 +1,234 @@
+#
+# B0: Gera uma base sintética no formato dos arquivos .zip da RFB (para testes e benchmarks sem acesso à internet).
+#
+#   --scale 1.0 corresponde aproximadamente ao volume real (~60 milhões de empresas).
+#
+
+OUTPUT_ROOT = ".bench"
+
+EMPRESAS_SCALE_1 = 60_000_000
+FILE_COUNT = 10
+SEED = 42
+
+
+#
+# Functions
+#
+
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import join
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import random
+
+
+CNAES = [
+    (1113502, "Fabricação de cervejas e chopes"),
+    (4711302, "Comércio varejista de mercadorias em geral, com predominância de produtos alimentícios - supermercados"),
+    (4712100, "Comércio varejista de mercadorias em geral, com predominância de produtos alimentícios - minimercados, mercearias e armazéns"),
+    (4721102, "Padaria e confeitaria com predominância de revenda"),
+    (4781400, "Comércio varejista de artigos do vestuário e acessórios"),
+    (5611201, "Restaurantes e similares"),
+    (5611203, "Lanchonetes, casas de chá, de sucos e similares"),
+    (6201501, "Desenvolvimento de programas de computador sob encomenda"),
+    (7319002, "Promoção de vendas"),
+    (8219999, "Preparação de documentos e serviços especializados de apoio administrativo não especificados anteriormente"),
+    (9492800, "Atividades de organizações políticas"),
+    (9602501, "Cabeleireiros, manicure e pedicure"),
+]
+
+MUNICIPIOS = [(7107, "SAO PAULO", "SP"), (6001, "RIO DE JANEIRO", "RJ"), (4123, "BELO HORIZONTE", "MG"), (9701, "BRASILIA", "DF"), (7535, "PORTO ALEGRE", "RS")]
+MOTIVOS = [(0, "SEM MOTIVO"), (1, "EXTINÇÃO POR ENCERRAMENTO LIQUIDAÇÃO VOLUNTÁRIA"), (21, "PEDIDO DE BAIXA INDEFERIDA")]
+NATUREZAS = [(2062, "Sociedade Empresária Limitada"), (2135, "Empresário (Individual)"), (2305, "Empresa Individual de Responsabilidade Limitada")]
+PAISES = [(105, "BRASIL"), (249, "ESTADOS UNIDOS"), (607, "PORTUGAL")]
+QUALIFICACOES = [(5, "Administrador"), (16, "Presidente"), (49, "Sócio-Administrador"), (50, "Empresário")]
+
+PALAVRAS = ["PADARIA", "SÃO", "JOÃO", "COMÉRCIO", "SERVIÇOS", "AÇOUGUE", "CONFECÇÕES", "INFORMÁTICA", "ESTAÇÃO", "ÁGUA", "LTDA", "ME", "BRASIL", "NORDESTE", "PÃO"]
+TRIBUTACOES = ["LUCRO REAL", "LUCRO PRESUMIDO", "LUCRO ARBITRADO", "IMUNE DO IRPJ", "ISENTA DO IRPJ"]
+
+# Arquivos do regime tributário: alguns com cabeçalho e ',' como separador, outros sem cabeçalho e com ';'.
+REGIME_FILES = [("Imunes e isentas", True), ("Lucro Arbitrado", False), ("Lucro Presumido 1", False), ("Lucro Real", True)]
+
+
+def cnpj_dv(cnpj_base: int, cnpj_ordem: int):
+    digits = [int(c) for c in f"{cnpj_base:08d}{cnpj_ordem:04d}"]
+    for weights in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        r = sum(d * w for d, w in zip(digits, weights)) % 11
+        digits.append(0 if r < 2 else 11 - r)
+    return digits[-2] * 10 + digits[-1]
+
+
+def csv_line(values, delimiter=";", quote=True):
+    values = ["" if v is None else str(v) for v in values]
+    if quote:
+        values = [f'"{v}"' for v in values]
+    return delimiter.join(values) + "\n"
+
+
+def write_zip(output_path: str, zip_name: str, member_name: str, lines):
+    with ZipFile(join(output_path, zip_name), "w", ZIP_DEFLATED) as zip_ref:
+        with zip_ref.open(member_name, "w") as f:
+            for line in lines:
+                f.write(line.encode("latin1"))
+
+
+def random_date(rng: random.Random):
+    return f"{rng.randint(1970, 2023)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+
+
+def random_name(rng: random.Random):
+    return " ".join(rng.choices(PALAVRAS, k=rng.randint(2, 4)))
+
+
+def iter_cnpjs_base(seed: int, empresa_count: int, file_index: int):
+    # Bases distribuídas uniformemente em [0, 10^8), sem manter a lista toda em memória.
+    rng = random.Random(seed)
+    stride = 100_000_000 // empresa_count
+    for i in range(file_index, empresa_count, FILE_COUNT):
+        yield i * stride + rng.randrange(stride)
+
+
+def generate_empresas(rng: random.Random, cnpjs_base):
+    for cnpj_base in cnpjs_base:
+        capital = f"{rng.randint(0, 1_000_000)},{rng.randint(0, 99):02d}"
+        yield csv_line([f"{cnpj_base:08d}", random_name(rng), rng.choice(NATUREZAS)[0], rng.choice(QUALIFICACOES)[0], capital, rng.choice(["01", "03", "05"]), ""])
+
+
+def generate_estabelecimentos(rng: random.Random, cnpjs_base, invalid_rate: float, regime):
+    for cnpj_base in cnpjs_base:
+        # A maioria das empresas tem apenas um estabelecimento.
+        for cnpj_ordem in range(1, 2 + int(rng.expovariate(3))):
+            dv = cnpj_dv(cnpj_base, cnpj_ordem)
+            if rng.random() < invalid_rate:
+                dv = (dv + 1) % 100
+            if rng.random() < 0.05:
+                regime.append((cnpj_base, cnpj_ordem, dv))
+
+            municipio, _, uf = rng.choice(MUNICIPIOS)
+            cnae = rng.choice(CNAES)[0]
+            cnaes_secundarios = ",".join(str(c[0]) for c in rng.sample(CNAES, rng.randint(0, 3)) if c[0] != cnae)
+            yield csv_line(
+                [
+                    f"{cnpj_base:08d}",
+                    f"{cnpj_ordem:04d}",
+                    f"{dv:02d}",
+                    1 if cnpj_ordem == 1 else 2,
+                    random_name(rng) if rng.random() < 0.5 else "",
+                    rng.choice(["02", "02", "02", "04", "08"]),
+                    random_date(rng),
+                    f"{rng.choice(MOTIVOS)[0]:02d}",
+                    "",
+                    "",
+                    random_date(rng),
+                    cnae,
+                    cnaes_secundarios,
+                    "RUA",
+                    random_name(rng),
+                    rng.choice(["S/N", str(rng.randint(1, 9999))]),
+                    rng.choice(["", "SALA 1", "APTO 101"]),
+                    "CENTRO",
+                    f"{rng.randint(1000000, 99999999):08d}",
+                    uf,
+                    f"{municipio:04d}",
+                    f"{rng.randint(11, 99)}",
+                    f"{rng.randint(20000000, 99999999)}",
+                    "",
+                    "",
+                    "",
+                    "",
+                    f"contato{cnpj_base}@exemplo.com.br" if rng.random() < 0.3 else "",
+                    "",
+                    "",
+                ]
+            )
+
+
+def generate_simples(rng: random.Random, cnpjs_base):
+    for cnpj_base in cnpjs_base:
+        if rng.random() < 0.45:
+            mei = rng.random() < 0.3
+            yield csv_line(
+                [f"{cnpj_base:08d}", "S", random_date(rng), "00000000", "S" if mei else "N", random_date(rng) if mei else "00000000", "00000000"]
+            )
+
+
+def generate_socios(rng: random.Random, cnpjs_base, pessoas: int):
+    # Sócios sorteados de um conjunto limitado de pessoas (CPF mascarado, como na RFB), para que empresas compartilhem sócios.
+    #   Algumas empresas têm outra empresa (pessoa jurídica) como sócia.
+    for cnpj_base in cnpjs_base:
+        for _ in range(1 + int(rng.expovariate(1.5))):
+            if rng.random() < 0.05:
+                socio_base = rng.randrange(100_000_000)
+                socio = [1, f"{random_name(rng)} LTDA", f"{socio_base:08d}0001{cnpj_dv(socio_base, 1):02d}", 49, 0]
+            else:
+                pessoa = rng.randrange(pessoas)
+                socio = [2, f"PESSOA {pessoa}", f"***{pessoa % 1_000_000:06d}**", rng.choice(QUALIFICACOES)[0], rng.randint(1, 9)]
+            yield csv_line([f"{cnpj_base:08d}", *socio[:4], random_date(rng), "", "***000000**", "", "00", socio[4]])
+
+
+def generate_regime(rng: random.Random, cnpjs, header: bool):
+    if header:
+        yield "ano,cnpj,cnpj_da_scp,forma_de_tributacao,qtde_de_escrituracoes\n"
+    for cnpj_base, cnpj_ordem, cnpj_dv in cnpjs:
+        digits = f"{cnpj_base:08d}"
+        cnpj = f"{digits[:2]}.{digits[2:5]}.{digits[5:]}/{cnpj_ordem:04d}-{cnpj_dv:02d}"
+        for ano in sorted(rng.sample(range(2019, 2024), rng.randint(1, 3))):
+            yield csv_line([ano, cnpj, "", rng.choice(TRIBUTACOES), 1], delimiter="," if header else ";", quote=not header)
+
+
+def generate(output_root: str, scale: float, invalid_rate: float = 0.01, seed: int = SEED):
+    output_path = join(output_root, ".data", "L0-zip")
+    makedirs(output_path, exist_ok=True)
+    rng = random.Random(seed)
+
+    # Tabelas auxiliares
+    write_zip(output_path, "Cnaes.zip", "F.K03200$Z.D40309.CNAECSV", (csv_line([f"{c:07d}", d]) for c, d in CNAES))
+    write_zip(output_path, "Municipios.zip", "F.K03200$Z.D40309.MUNICCSV", (csv_line([f"{c:04d}", d]) for c, d, _ in MUNICIPIOS))
+    write_zip(output_path, "Motivos.zip", "F.K03200$Z.D40309.MOTICSV", (csv_line([f"{c:02d}", d]) for c, d in MOTIVOS))
+    write_zip(output_path, "Naturezas.zip", "F.K03200$Z.D40309.NATJUCSV", (csv_line([f"{c:04d}", d]) for c, d in NATUREZAS))
+    write_zip(output_path, "Paises.zip", "F.K03200$Z.D40309.PAISCSV", (csv_line([f"{c:03d}", d]) for c, d in PAISES))
+    write_zip(output_path, "Qualificacoes.zip", "F.K03200$Z.D40309.QUALSCSV", (csv_line([f"{c:02d}", d]) for c, d in QUALIFICACOES))
+
+    # Empresas, estabelecimentos e Simples
+    empresa_count = max(FILE_COUNT, int(EMPRESAS_SCALE_1 * scale))
+    cnpjs_base = lambda i: iter_cnpjs_base(seed + i, empresa_count, i)
+
+    regime = []
+    for i in range(FILE_COUNT):
+        write_zip(output_path, f"Empresas{i}.zip", f"K3241.K03200Y{i}.D40309.EMPRECSV", generate_empresas(rng, cnpjs_base(i)))
+        write_zip(output_path, f"Estabelecimentos{i}.zip", f"K3241.K03200Y{i}.D40309.ESTABELE", generate_estabelecimentos(rng, cnpjs_base(i), invalid_rate, regime))
+
+    simples = (line for i in range(FILE_COUNT) for line in generate_simples(rng, cnpjs_base(i)))
+    write_zip(output_path, "Simples.zip", "F.K03200$W.SIMPLES.CSV.D40309", simples)
+
+    # Regime tributário
+    for i, (name, header) in enumerate(REGIME_FILES):
+        write_zip(output_path, f"{name}.zip", f"{name}.csv", generate_regime(rng, regime[i :: len(REGIME_FILES)], header))
+
+    # Sócios
+    for i in range(FILE_COUNT):
+        write_zip(output_path, f"Socios{i}.zip", f"K3241.K03200Y{i}.D40309.SOCIOCSV", generate_socios(rng, cnpjs_base(i), empresa_count // 2))
+
+    return output_path
+
+
+#
+# Main
+#
+
+
+def main():
+    parser = ArgumentParser(description="B0: Gera uma base sintética no formato dos arquivos da RFB.")
+    parser.add_argument("--output-root", default=OUTPUT_ROOT, help="pasta raiz (os arquivos são gerados em '<pasta>/.data/L0-zip')")
+    parser.add_argument("--scale", type=float, default=0.001, help="fator de escala (1.0 ~ volume real)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    print("B0: Generating files...")
+    output_path = generate(args.output_root, args.scale, seed=args.seed)
+    print(f"B0: Files ready in '{output_path}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#
+# B1: Executa as etapas L1 -> L3 e as consultas sobre a base sintética (B0) e registra o desempenho de cada etapa.
+#
+#   O resultado é acrescentado (uma linha JSON por etapa) ao arquivo '<pasta>/benchmark.jsonl'.
+#
+
+OUTPUT_ROOT = ".bench"
+REPORT_FILE = "benchmark.jsonl"
+
+
+#
+# Functions
+#
+
+from argparse import ArgumentParser
+from datetime import datetime
+from os import environ, pathsep
+from os.path import abspath, dirname, isdir, join
+from shutil import rmtree
+from subprocess import Popen
+from time import perf_counter
+
+import duckdb
+import json
+import os
+import sys
+
+from rfb_cnpj_etl.B0_synthetic import generate
+from rfb_cnpj_etl.config import connect
+from rfb_cnpj_etl.exporter import to_reader
+from rfb_cnpj_etl.metrics import folder_size
+from rfb_cnpj_etl.queries import by_cnae, by_cnpj, by_cnpj_file, by_nome, by_rede_socios
+
+
+STAGE_FOLDERS = {
+    "L1_extract": ".data/L1-csv",
+    "L2_load": ".data/L2-silver",
+    "L3_refine": ".data/L3-gold",
+}
+
+
+def table_rows(db_file: str):
+    with duckdb.connect(db_file, read_only=True) as con:
+        tables = [r[0] for r in con.sql("SELECT table_name FROM duckdb_tables WHERE schema_name = 'main'").fetchall()]
+        return sum(con.sql(f"SELECT count(*) FROM {t}").fetchone()[0] for t in tables)
+
+
+def run_stage(root: str, module: str, args: list[str], run_id: str = None):
+    # Executa a etapa num processo separado (com a pasta da base sintética como diretório atual).
+    #   Os passos de cada etapa ficam em '<pasta>/.data/reports/report.jsonl', com o mesmo 'run' do benchmark.
+    env = dict(environ)
+    if run_id:
+        env["RFB_RUN_ID"] = run_id
+    env["PYTHONPATH"] = pathsep.join(p for p in [dirname(dirname(abspath(__file__))), env.get("PYTHONPATH")] if p)
+
+    started = perf_counter()
+    process = Popen([sys.executable, "-m", f"rfb_cnpj_etl.{module}", *args], cwd=root, env=env)
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss: KB no Linux, bytes no macOS.
+        peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    else:
+        returncode, peak_rss = process.wait(), None
+    seconds = perf_counter() - started
+
+    if returncode != 0:
+        raise RuntimeError(f"Stage '{module}' failed with exit code {returncode}.")
+    return seconds, peak_rss
+
+
+def record(results: list, stage: str, seconds: float, rows: int = None, input_bytes: int = None, output_bytes: int = None, peak_rss: int = None):
+    result = {
+        "stage": stage,
+        "seconds": round(seconds, 3),
+        "rows": rows,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "rows_per_second": round(rows / seconds) if rows and seconds else None,
+        "mb_per_second": round(input_bytes / seconds / 1024 / 1024, 1) if input_bytes and seconds else None,
+        "peak_rss": peak_rss,
+    }
+    results.append(result)
+    print(f"  {stage: <20} {seconds:8.2f}s  {result['rows_per_second'] or '-': >10} rows/s  {result['mb_per_second'] or '-': >8} MB/s")
+
+
+def time_query(data):
+    started = perf_counter()
+    rows = sum(batch.num_rows for batch in to_reader(data))
+    return perf_counter() - started, rows
+
+
+def benchmark(root: str, from_zip: bool = False, run_id: str = None):
+    results = []
+    zip_folder = join(root, ".data/L0-zip")
+
+    # Sempre recria as saídas das etapas (as etapas são idempotentes e pulariam o trabalho já feito).
+    for folder in STAGE_FOLDERS.values():
+        rmtree(join(root, folder), ignore_errors=True)
+
+    stages = [("L2_load", ["--from-zip"])] if from_zip else [("L1_extract", []), ("L2_load", [])]
+    stages.append(("L3_refine", ["--search-index"]))
+
+    input_folder = zip_folder
+    for module, args in stages:
+        input_bytes = folder_size(input_folder)
+        seconds, peak_rss = run_stage(root, module, args, run_id)
+
+        output_folder = join(root, STAGE_FOLDERS[module])
+        rows = table_rows(join(output_folder, "rfb-cnpj.duckdb")) if module != "L1_extract" else None
+        record(results, module, seconds, rows, input_bytes, folder_size(output_folder), peak_rss)
+        input_folder = output_folder
+
+    # Consultas
+    with connect(join(root, STAGE_FOLDERS["L3_refine"], "rfb-cnpj.duckdb"), read_only=True) as con:
+        cnae = con.sql("SELECT cnae FROM estabelecimento_cnae GROUP BY cnae ORDER BY count(*) DESC LIMIT 1").fetchone()[0]
+        record(results, "Q1_by_cnae", *time_query(by_cnae(con, str(cnae))))
+
+        cnpjs_base = [r[0] for r in con.sql("SELECT cnpj_base FROM empresa USING SAMPLE 11 ROWS").fetchall()]
+        record(results, "Q2_by_cnpj", *time_query(by_cnpj(con, cnpjs_base)))
+
+        # Consulta em lote com 10% das empresas: amostra com número fixo de linhas (a amostra 'system' é por grupo de
+        #   linhas e pode vir vazia em bases pequenas).
+        input_file = join(root, "Q3_input.csv")
+        sample_rows = max(1, con.sql("SELECT count(*) FROM empresa").fetchone()[0] // 10)
+        con.sql(f"COPY (SELECT cnpj_base FROM empresa USING SAMPLE reservoir({sample_rows} ROWS) REPEATABLE (42)) TO '{input_file}' (HEADER)")
+        if con.sql(f"SELECT count(*) FROM read_csv('{input_file}', header = true)").fetchone()[0] == 0:
+            raise ValueError(f"{input_file}: empty Q3 sample (table 'empresa' has no rows).")
+        record(results, "Q3_by_cnpj_file", *time_query(by_cnpj_file(con, input_file)))
+
+        # Busca por nome: termo exato + prefixo.
+        razao_social = con.sql("SELECT razao_social FROM empresa USING SAMPLE 1 ROWS").fetchone()[0]
+        nome = " ".join(w if i == 0 else w[:4] for i, w in enumerate(razao_social.split()[:2]))
+        record(results, "Q4_by_nome", *time_query(by_nome(con, nome)))
+
+        # Rede de sócios (2 saltos) a partir das empresas amostradas.
+        record(results, "Q5_rede_socios", *time_query(by_rede_socios(con, cnpjs_base)))
+
+    return results
+
+
+#
+# Main
+#
+
+
+def main():
+    parser = ArgumentParser(description="B1: Mede o desempenho de cada etapa sobre a base sintética.")
+    parser.add_argument("--output-root", default=OUTPUT_ROOT, help="pasta raiz da base sintética")
+    parser.add_argument("--scale", type=float, default=0.001, help="fator de escala, se a base sintética precisar ser gerada")
+    parser.add_argument("--from-zip", action="store_true", help="carrega os .zip diretamente (L2 --from-zip, sem L1)")
+    args = parser.parse_args()
+
+    root = args.output_root
+    if not isdir(join(root, ".data/L0-zip")):
+        print("B1: Generating synthetic data...")
+        generate(root, args.scale)
+
+    print("B1: Running benchmark...")
+    run_id = datetime.now().isoformat(timespec="seconds")
+    results = benchmark(root, args.from_zip, run_id)
+
+    run = {"run": run_id, "from_zip": args.from_zip, "zip_bytes": folder_size(join(root, ".data/L0-zip"))}
+    with open(join(root, REPORT_FILE), "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps({**run, **result}) + "\n")
+
+    print(f"B1: Report written to '{join(root, REPORT_FILE)}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,13 @@
 
 ROOT_URL = "https://dados.rfb.gov.br/CNPJ/"
 OUTPUT_FOLDER = ".data/L0-zip"
+MANIFEST_FILE = "manifest.json"
 
-# Todos arquivos a baixar (exceto Socios) -- Mar/2024
+# A lista de arquivos é obtida do índice do diretório remoto (e das subpastas abaixo).
+SOURCE_FOLDERS = ["regime_tributario/"]
+EXCLUDE_FILES = []
+
+# Lista usada caso o índice do diretório não esteja disponível -- Mar/2024
 SOURCE_FILES = [
     "Cnaes.zip",
     "Empresas0.zip",
@@ -34,6 +39,16 @@ SOURCE_FILES = [
     "Paises.zip",
     "Qualificacoes.zip",
     "Simples.zip",
+    "Socios0.zip",
+    "Socios1.zip",
+    "Socios2.zip",
+    "Socios3.zip",
+    "Socios4.zip",
+    "Socios5.zip",
+    "Socios6.zip",
+    "Socios7.zip",
+    "Socios8.zip",
+    "Socios9.zip",
     "regime_tributario/Imunes e isentas.zip",
     "regime_tributario/Lucro Arbitrado.zip",
     "regime_tributario/Lucro Presumido 1.zip",
@@ -45,18 +60,36 @@ SOURCE_FILES = [
 # Functions
 #
 
-from os import makedirs
+from fnmatch import fnmatch
+from os import makedirs, remove, replace
 from os.path import basename, getsize, isfile, join
-from shutil import move
-from tempfile import NamedTemporaryFile
-from urllib.parse import urljoin
+from shutil import copyfileobj
+from urllib.parse import unquote, urljoin
+
+import json
+import re
 
-from httpx import AsyncClient
+from httpx import AsyncClient, HTTPError, Limits, Timeout
 from tqdm import tqdm
 
+from rfb_cnpj_etl.metrics import step
+
 import asyncio
 
 
+MAX_CONCURRENT_DOWNLOADS = 8
+MAX_CONNECTIONS = 16
+
+# Arquivos grandes são baixados em partes (HTTP Range) usando várias conexões.
+MAX_SEGMENTS_PER_FILE = 4
+MIN_SEGMENT_SIZE = 64 * 1024 * 1024
+
+MAX_RETRIES = 5
+RETRY_DELAY = 2
+
+BAR_FORMAT = "{desc: <25} {percentage:3.0f}% {bar} [{remaining}, {rate_fmt}]"
+
+
 # asyncio.gather limited to 'n' concurrent tasks -- https://stackoverflow.com/a/61478547/33244
 async def gather_with_semaphore(n, *tasks):
     semaphore = asyncio.Semaphore(n)
@@ -68,58 +101,240 @@ async def gather_with_semaphore(n, *tasks):
     return await asyncio.gather(*(wrapped_task(c) for c in tasks))
 
 
-# Download multiple files concurrently
-async def download_files_async(root_url, files, output_path):
-    BAR_FORMAT = "{desc: <25} {percentage:3.0f}% {bar} [{remaining}, {rate_fmt}]"
-    MAX_CONCURRENT_DOWNLOADS = 8
-
-    async def download_file_async(root_url, file_name, target_path, position):
-        full_url = urljoin(root_url, file_name)
-        full_target_file = join(target_path, basename(file_name))
-        if isfile(full_target_file):
-            # File already exists: Just update progress to 100%.
-            total = getsize(full_target_file)
-            with tqdm(
-                desc=f"  {file_name}",
-                total=total,
-                leave=False,
-                unit="B",
-                unit_scale=True,
-                unit_divisor=1024,
-                bar_format=BAR_FORMAT,
-                position=position,
-                dynamic_ncols=True,
-            ) as progress:
-                progress.update(total)
+def create_client():
+    # Um único pool de conexões compartilhado por todos os downloads.
+    return AsyncClient(
+        limits=Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        timeout=Timeout(60, pool=None),
+        follow_redirects=True,
+    )
+
+
+def create_progress(file_name, total, position):
+    return tqdm(
+        desc=f"  {file_name}",
+        total=total,
+        leave=False,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        bar_format=BAR_FORMAT,
+        position=position,
+        dynamic_ncols=True,
+    )
+
+
+def split_segments(total, accept_ranges):
+    # Retorna a lista de intervalos [start, end] (inclusivos) a baixar.
+    if not accept_ranges or total < 2 * MIN_SEGMENT_SIZE:
+        return [(0, total - 1)]
+
+    count = min(MAX_SEGMENTS_PER_FILE, total // MIN_SEGMENT_SIZE)
+    size = -(-total // count)
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def part_file_name(full_target_file, segment):
+    return f"{full_target_file}.part{segment}"
+
+
+def part_size(part_file):
+    return getsize(part_file) if isfile(part_file) else 0
+
+
+async def download_segment_async(client: AsyncClient, full_url, part_file, start, end, accept_ranges, progress):
+    for attempt in range(MAX_RETRIES + 1):
+        offset = part_size(part_file)
+        if start + offset > end:
             return
 
-        with NamedTemporaryFile(delete=False) as temp_file:
-            async with AsyncClient() as client:
-                async with client.stream("GET", full_url) as response:
-                    total = int(response.headers["Content-Length"])
-
-                    with tqdm(
-                        desc=f"  {file_name}",
-                        total=total,
-                        leave=False,
-                        unit="B",
-                        unit_scale=True,
-                        unit_divisor=1024,
-                        bar_format=BAR_FORMAT,
-                        position=position,
-                        dynamic_ncols=True,
-                    ) as progress:
+        headers = {}
+        if accept_ranges:
+            # Retoma a partir do último byte já gravado no arquivo .part
+            headers["Range"] = f"bytes={start + offset}-{end}"
+        elif offset:
+            # Servidor sem suporte a Range: recomeça do início.
+            progress.update(-offset)
+            remove(part_file)
+
+        try:
+            async with client.stream("GET", full_url, headers=headers) as response:
+                response.raise_for_status()
+                if accept_ranges and response.status_code != 206:
+                    raise HTTPError(f"Range not honored for '{full_url}' (status {response.status_code}).")
+
+                with open(part_file, "ab") as f:
+                    num_bytes_downloaded = response.num_bytes_downloaded
+                    async for chunk in response.aiter_bytes():
+                        f.write(chunk)
+                        progress.update(response.num_bytes_downloaded - num_bytes_downloaded)
                         num_bytes_downloaded = response.num_bytes_downloaded
-                        async for chunk in response.aiter_bytes():
-                            temp_file.write(chunk)
-                            progress.update(response.num_bytes_downloaded - num_bytes_downloaded)
-                            num_bytes_downloaded = response.num_bytes_downloaded
+        except HTTPError:
+            if attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(RETRY_DELAY * (attempt + 1))
+
+
+def merge_segments(full_target_file, segment_count):
+    # Concatena as partes no primeiro arquivo e o renomeia para o nome final.
+    first_part_file = part_file_name(full_target_file, 0)
+    with open(first_part_file, "ab") as t:
+        for segment in range(1, segment_count):
+            part_file = part_file_name(full_target_file, segment)
+            with open(part_file, "rb") as s:
+                copyfileobj(s, t, 1024 * 1024)
+            remove(part_file)
+
+    replace(first_part_file, full_target_file)
+
+
+def load_manifest(output_path):
+    manifest_file = join(output_path, MANIFEST_FILE)
+    if not isfile(manifest_file):
+        return {}
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(output_path, manifest):
+    manifest_file = join(output_path, MANIFEST_FILE)
+    with open(f"{manifest_file}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    replace(f"{manifest_file}.tmp", manifest_file)
 
-        move(temp_file.name, full_target_file)
 
-    tasks = [download_file_async(root_url, file, output_path, i) for i, file in enumerate(files)]
-    await gather_with_semaphore(MAX_CONCURRENT_DOWNLOADS, *tasks)
-    return len(files)
+def get_validators(response):
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_length": int(response.headers["Content-Length"]),
+    }
+
+
+def same_validators(a, b):
+    if a is None or b is None:
+        return False
+    if a["content_length"] != b["content_length"]:
+        return False
+    if a["etag"] and b["etag"]:
+        return a["etag"] == b["etag"]
+    return a["last_modified"] is not None and a["last_modified"] == b["last_modified"]
+
+
+async def fetch_validators_async(client: AsyncClient, full_url, known):
+    response = await client.head(full_url)
+    if response.status_code not in (405, 501):
+        response.raise_for_status()
+        return get_validators(response), response.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+    # Servidor sem suporte a HEAD: usa um GET condicional e descarta o conteúdo.
+    headers = {}
+    if known and known["etag"]:
+        headers["If-None-Match"] = known["etag"]
+    if known and known["last_modified"]:
+        headers["If-Modified-Since"] = known["last_modified"]
+
+    async with client.stream("GET", full_url, headers=headers) as response:
+        if response.status_code == 304:
+            return known, known.get("accept_ranges", False)
+        response.raise_for_status()
+        return get_validators(response), response.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+
+async def discover_files_async(client: AsyncClient, root_url, folder=""):
+    # Lê os links '.zip' do índice do diretório (Apache autoindex).
+    response = await client.get(urljoin(root_url, folder))
+    response.raise_for_status()
+
+    files = []
+    for href in re.findall(r'href="([^"?#:]+)"', response.text):
+        name = folder + unquote(href)
+        if href.endswith("/") and name in SOURCE_FOLDERS:
+            files += await discover_files_async(client, root_url, name)
+        elif href.endswith(".zip") and not any(fnmatch(basename(name), p) for p in EXCLUDE_FILES):
+            files.append(name)
+
+    return sorted(set(files))
+
+
+def check_local_names(files):
+    # Os arquivos são gravados sem a subpasta remota (ex. 'regime_tributario/'), como esperam as etapas seguintes:
+    #   dois arquivos remotos com o mesmo nome se sobrescreveriam.
+    local_names = {}
+    for file_name in files:
+        other = local_names.setdefault(basename(file_name), file_name)
+        if other != file_name:
+            raise ValueError(f"Remote files '{other}' and '{file_name}' would both be saved as '{basename(file_name)}'.")
+    return files
+
+
+async def list_files_async(client: AsyncClient, root_url):
+    # Arquivos do índice remoto ou, se indisponível, a lista fixa.
+    try:
+        files = await discover_files_async(client, root_url)
+    except HTTPError:
+        files = []
+    return check_local_names(files or SOURCE_FILES)
+
+
+async def download_file_async(client: AsyncClient, root_url, file_name, target_path, position, manifest):
+    full_url = urljoin(root_url, file_name)
+    full_target_file = join(target_path, basename(file_name))
+    known = manifest.get(file_name)
+
+    with step("L0", file_name, concurrent=True) as record:
+        validators, accept_ranges = await fetch_validators_async(client, full_url, known)
+        total = validators["content_length"]
+
+        if isfile(full_target_file) and known is not None and known.get("complete") and same_validators(known, validators):
+            # File already exists and did not change: Just update progress to 100%.
+            with create_progress(file_name, total, position) as progress:
+                progress.update(total)
+            record.update(skipped=True, output_bytes=total)
+            return False
+
+        segments = split_segments(total, accept_ranges)
+        part_files = [part_file_name(full_target_file, i) for i in range(len(segments))]
+        if not same_validators(known, validators):
+            # Arquivo remoto mudou: descarta partes de downloads anteriores.
+            for part_file in part_files:
+                if isfile(part_file):
+                    remove(part_file)
+            manifest[file_name] = {**validators, "accept_ranges": accept_ranges, "complete": False}
+            save_manifest(target_path, manifest)
+
+        with create_progress(file_name, total, position) as progress:
+            resumed = sum(part_size(f) for f in part_files)
+            progress.update(resumed)
+
+            tasks = [
+                download_segment_async(client, full_url, part_file, start, end, accept_ranges, progress)
+                for part_file, (start, end) in zip(part_files, segments)
+            ]
+            await asyncio.gather(*tasks)
+
+        downloaded = sum(part_size(f) for f in part_files)
+        if downloaded != total:
+            raise HTTPError(f"Incomplete download for '{full_url}': {downloaded} of {total} bytes.")
+
+        merge_segments(full_target_file, len(segments))
+
+        manifest[file_name]["complete"] = True
+        save_manifest(target_path, manifest)
+        # 'input_bytes': bytes transferidos nesta execução (desconta as partes retomadas).
+        record.update(input_bytes=total - resumed, output_bytes=total, segments=len(segments))
+        return True
+
+
+# Download multiple files concurrently
+async def download_files_async(root_url, files, output_path):
+    manifest = load_manifest(output_path)
+    async with create_client() as client:
+        files = await list_files_async(client, root_url) if files is None else check_local_names(files)
+
+        tasks = [download_file_async(client, root_url, file, output_path, i, manifest) for i, file in enumerate(files)]
+        downloaded = await gather_with_semaphore(MAX_CONCURRENT_DOWNLOADS, *tasks)
+    return len(files), sum(downloaded)
 
 
 #
@@ -131,9 +346,11 @@ async def main_async():
     makedirs(OUTPUT_FOLDER, exist_ok=True)
     print("L0: Downloading files...")
 
-    file_count = await download_files_async(ROOT_URL, SOURCE_FILES, OUTPUT_FOLDER)
+    with step("L0", "total") as record:
+        file_count, downloaded_count = await download_files_async(ROOT_URL, None, OUTPUT_FOLDER)
+        record.update(files=file_count, downloaded=downloaded_count)
 
-    print(f"\rL0: {file_count} files ready.")
+    print(f"\rL0: {file_count} files ready ({downloaded_count} downloaded).")
 
 
 def main():
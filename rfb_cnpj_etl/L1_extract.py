@@ -1,6 +1,9 @@
 #
 # L1: Extrai os arquivos .csv e converte de 'latin1' para 'utf-8'. (19.6 GB, ~3 min)
 #
+#   Cada .csv é gravado num arquivo temporário e renomeado ao final. Um .csv só é extraído novamente se o membro de origem
+#   mudou (CRC-32 e tamanho registrados no manifesto, ver manifest.py) ou se o arquivo gravado foi alterado.
+#
 
 INPUT_FOLDER = ".data/L0-zip"
 OUTPUT_FOLDER = ".data/L1-csv"
@@ -10,30 +13,69 @@ OUTPUT_FOLDER = ".data/L1-csv"
 # Functions
 #
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from glob import glob
-from io import TextIOWrapper
-from os import makedirs
-from os.path import isfile, join
-from shutil import copyfileobj
+from os import cpu_count, makedirs
+from os.path import basename, isfile, join
 from zipfile import ZipFile
 
+from rfb_cnpj_etl.manifest import atomic_write, read_file_manifest, write_file_manifest
+from rfb_cnpj_etl.metrics import file_size, step
+
+
+BLOCK_SIZE = 16 * 1024 * 1024
+MAX_WORKERS = cpu_count()
+
+
+def transcode(source, target):
+    # latin1 -> utf-8, em blocos grandes. Blocos só com ASCII são copiados sem conversão. Retorna o número de linhas.
+    lines = 0
+    while block := source.read(BLOCK_SIZE):
+        target.write(block if block.isascii() else block.decode("latin1").encode("utf-8"))
+        lines += block.count(b"\n")
+    return lines
+
+
+def member_source(zip_ref: ZipFile, member_name: str):
+    # Origem de um .csv: CRC-32 (do conteúdo descompactado) e tamanho, lidos do índice do .zip.
+    info = zip_ref.getinfo(member_name)
+    return {"zip_file": basename(zip_ref.filename), "member": member_name, "crc": info.CRC, "size": info.file_size}
+
+
+def extract_member(zip_file, member_name, output_path):
+    target_file = join(output_path, member_name)
+    with step("L1", member_name, zip_file=zip_file) as record:
+        with ZipFile(zip_file, "r") as zip_ref:
+            source = member_source(zip_ref, member_name)
+            manifest = read_file_manifest(target_file)
+            if isfile(target_file) and manifest == {**source, "output_bytes": file_size(target_file)}:
+                record["skipped"] = True
+            else:
+                record["input_bytes"] = source["size"]
+                with zip_ref.open(member_name) as s:
+                    with atomic_write(target_file) as t:
+                        record["rows"] = transcode(s, t)
+                write_file_manifest(target_file, {**source, "output_bytes": file_size(target_file)})
+        record["output_bytes"] = file_size(target_file)
+
+    return target_file
+
 
 def extract_files(input_files, output_path):
-    file_count = 0
+    members = []
     for zip_file in input_files:
         with ZipFile(zip_file, "r") as zip_ref:
-            names = zip_ref.namelist()
-            for n in names:
-                member = zip_ref.getinfo(n)
+            members += [(zip_file, m.filename, m.file_size) for m in zip_ref.infolist()]
 
-                target_file = join(output_path, member.filename)
-                if not isfile(target_file):
-                    with zip_ref.open(member) as s:
-                        with open(target_file, "w", encoding="utf-8") as t:
-                            copyfileobj(TextIOWrapper(s, encoding="latin1"), t)
+    # Maiores primeiro, para equilibrar a carga entre os processos.
+    members.sort(key=lambda m: m[2], reverse=True)
 
-                print(f"    {target_file}")
-                file_count += 1
+    file_count = 0
+    with ProcessPoolExecutor(MAX_WORKERS) as executor:
+        futures = [executor.submit(extract_member, zip_file, member_name, output_path) for zip_file, member_name, _ in members]
+        for future in as_completed(futures):
+            print(f"    {future.result()}")
+            file_count += 1
 
     return file_count
 
@@ -48,7 +90,9 @@ def main():
     print("L1: Extracting files...")
 
     all_zip_files = glob(join(INPUT_FOLDER, "*.zip"))
-    file_count = extract_files(all_zip_files, OUTPUT_FOLDER)
+    with step("L1", "total") as record:
+        file_count = extract_files(all_zip_files, OUTPUT_FOLDER)
+        record.update(files=file_count, input_bytes=file_size(*all_zip_files))
 
     print(f"L1: {file_count} files ready.")
 
@@ -1,8 +1,12 @@
 #
 # L2: Carrega os arquivos .csv para um banco DuckDB. (5.5 GB, ~1.5 min)
 #
+#   Cada tabela é criada numa transação, junto com a sua impressão digital no manifesto (ver manifest.py): schema, consulta e
+#   CRC-32/tamanho de cada arquivo de entrada. Uma tabela só é carregada novamente se a impressão digital mudou.
+#
 
 INPUT_FOLDER = ".data/L1-csv"
+ZIP_FOLDER = ".data/L0-zip"
 OUTPUT_FOLDER = ".data/L2-silver"
 
 
@@ -10,11 +14,170 @@ OUTPUT_FOLDER = ".data/L2-silver"
 # Functions
 #
 
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
 from glob import glob
 from os import makedirs
-from os.path import abspath, join
+from os.path import abspath, basename, getmtime, join
+from zipfile import ZipFile
 
 import duckdb
+import pyarrow as pa
+import pyarrow.csv
+
+from rfb_cnpj_etl.cnpj import register_macros
+from rfb_cnpj_etl.config import connect
+from rfb_cnpj_etl.manifest import create_manifest_table, fingerprint, read_file_manifest, set_table_fingerprint, table_fingerprint
+from rfb_cnpj_etl.metrics import database_size, file_size, profiling, step, table_rows
+
+
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Tabelas carregadas simultaneamente (cada uma com um cursor próprio): as tabelas pequenas são carregadas
+#   enquanto 'estabelecimento' e 'empresa' ainda estão em andamento.
+LOAD_WORKERS = 4
+
+UInt32 = "UINTEGER"
+UInt16 = "USMALLINT"
+UInt8 = "UTINYINT"
+Utf8 = "VARCHAR"
+
+SCHEMA_CNAE = {"codigo": UInt32, "descricao": Utf8}
+
+SCHEMA_SATELITES = {"codigo": UInt16, "descricao": Utf8}
+
+SCHEMA_EMPRESA = {
+    "cnpj_base": UInt32,
+    "razao_social": Utf8,
+    "natureza_juridica": UInt16,
+    "qualificacao_responsavel": UInt8,
+    "capital_social_str": Utf8,
+    "porte_empresa": UInt8,
+    "ente_federativo_responsavel": Utf8,
+}
+
+SCHEMA_ESTABELECIMENTO = {
+    "cnpj_base": UInt32,
+    "cnpj_ordem": UInt16,
+    "cnpj_dv": UInt8,
+    "matriz": UInt8,
+    "nome_fantasia": Utf8,
+    "situacao_cadastral": UInt8,
+    "data_situacao_cadastral": Utf8,
+    "motivo_situacao_cadastral": UInt8,
+    "nome_cidade_exterior": Utf8,
+    "pais": Utf8,
+    "data_inicio_atividades": Utf8,
+    "cnae": Utf8,
+    "cnae_secundario": Utf8,
+    "tipo_logradouro": Utf8,
+    "logradouro": Utf8,
+    "numero": Utf8,
+    "complemento": Utf8,
+    "bairro": Utf8,
+    "cep": Utf8,
+    "uf": Utf8,
+    "municipio": UInt16,
+    "ddd1": Utf8,
+    "telefone1": Utf8,
+    "ddd2": Utf8,
+    "telefone2": Utf8,
+    "ddd_fax": Utf8,
+    "fax": Utf8,
+    "correio_eletronico": Utf8,
+    "situacao_especial": Utf8,
+    "data_situacao_especial": Utf8,
+}
+
+SCHEMA_SIMPLES = {
+    "cnpj_base": UInt32,
+    "opcao_simples": Utf8,
+    "data_opcao_simples": Utf8,
+    "data_exclusao_simples": Utf8,
+    "opcao_mei": Utf8,
+    "data_opcao_mei": Utf8,
+    "data_exclusao_mei": Utf8,
+}
+
+SCHEMA_SOCIO = {
+    "cnpj_base": UInt32,
+    "identificador_socio": UInt8,
+    "nome_socio": Utf8,
+    "cnpj_cpf_socio": Utf8,
+    "qualificacao_socio": UInt8,
+    "data_entrada_sociedade": Utf8,
+    "pais": Utf8,
+    "representante_legal": Utf8,
+    "nome_representante": Utf8,
+    "qualificacao_representante_legal": UInt8,
+    "faixa_etaria": UInt8,
+}
+
+# Tabelas: (nome, padrão dos arquivos, schema). O regime de tributação tem tratamento especial.
+TABLES = [
+    ("cnae", "*.CNAECSV", SCHEMA_CNAE),
+    ("motivo", "*.MOTICSV", SCHEMA_SATELITES),
+    ("municipio", "*.MUNICCSV", SCHEMA_SATELITES),
+    ("natureza_juridica", "*.NATJUCSV", SCHEMA_SATELITES),
+    ("pais", "*.PAISCSV", SCHEMA_SATELITES),
+    ("qualificacao", "*.QUALSCSV", SCHEMA_SATELITES),
+    ("empresa", "*.EMPRECSV", SCHEMA_EMPRESA),
+    ("estabelecimento", "*.ESTABELE", SCHEMA_ESTABELECIMENTO),
+    ("simples", "*.SIMPLES.CSV.*", SCHEMA_SIMPLES),
+    ("socio", "*.SOCIOCSV", SCHEMA_SOCIO),
+]
+REGIME_TRIBUTACAO_TABLE = ("regime_tributacao", "*.csv")
+
+REGIME_TRIBUTACAO_SCHEMA = {"ano": "USMALLINT", "cnpj": "VARCHAR", "cnpj_scp": "VARCHAR", "tributacao": "VARCHAR", "qtd": "UTINYINT"}
+
+REGIME_TRIBUTACAO_DDL = r"""
+    CREATE TABLE {table_name} (
+        ano USMALLINT,
+        cnpj_base UINTEGER,
+        cnpj_ordem USMALLINT,
+        cnpj_dv UTINYINT,
+        cnpj VARCHAR,
+        cnpj_scp VARCHAR,
+        tributacao VARCHAR,
+        qtd UTINYINT,
+        row_hash UBIGINT
+    );
+"""
+
+# O CNPJ vem formatado ('00.000.000/0000-00'). Converte para as mesmas chaves numéricas de 'estabelecimento' (ver cnpj.py).
+#   O texto original ('cnpj') é mantido apenas nas linhas com CNPJ inválido (NULL nas demais), que vão para 'regime_tributacao_rejeitado'.
+REGIME_TRIBUTACAO_SELECT = r"""
+    SELECT
+        ano,
+        cnpj_base,
+        cnpj_ordem,
+        cnpj_dv,
+        CASE WHEN NOT coalesce(cnpj_is_valid(cnpj_base, cnpj_ordem, cnpj_dv), false) THEN cnpj END AS cnpj,
+        cnpj_scp,
+        tributacao,
+        qtd,
+        hash(ano, cnpj, cnpj_scp, tributacao, qtd) AS row_hash
+    FROM (
+        SELECT
+            *,
+            CAST(cnpj_key // 1000000 AS UINTEGER) AS cnpj_base,
+            CAST(cnpj_key // 100 % 10000 AS USMALLINT) AS cnpj_ordem,
+            CAST(cnpj_key % 100 AS UTINYINT) AS cnpj_dv
+        FROM (
+            SELECT *, cnpj_parse(cnpj) AS cnpj_key FROM csv
+        )
+    )
+"""
+
+DEFAULT_SELECT = "SELECT * FROM csv"
+
+# Tabelas atualizadas incrementalmente pelo L3 (ver L3_refine.INCREMENTAL_SOURCES): cada linha recebe 'row_hash', o hash de
+#   todas as colunas do arquivo. O L3 compara apenas as chaves e 'row_hash' com os da atualização anterior.
+ROW_HASH_TABLES = ["empresa", "simples", "estabelecimento", "regime_tributacao"]
+
+# Tabelas com CNPJ completo: linhas com CNPJ ausente ou com dígitos verificadores inválidos são movidas para '<tabela>_rejeitado'.
+CNPJ_TABLES = ["estabelecimento", "regime_tributacao"]
 
 
 def has_table(con: duckdb.DuckDBPyConnection, table_name: str):
@@ -22,51 +185,253 @@ def has_table(con: duckdb.DuckDBPyConnection, table_name: str):
     return r.fetchone() is not None
 
 
-def csv_to_duckdb(con: duckdb.DuckDBPyConnection, table_name: str, glob_pattern: str, schema, select=None):
-    if not has_table(con, table_name):
-        input_files = glob(join(INPUT_FOLDER, glob_pattern))
-        csv = con.read_csv(
-            input_files,
-            header=False,
-            delimiter=";",
-            names=list(schema.keys()),
-            dtype=list(schema.values()),
-            encoding="utf-8",
-            parallel=True,
-            date_format="%Y%m%d",
-        )
-        select = "SELECT * FROM csv" if select is None else select
-        con.sql(f"CREATE TABLE {table_name} AS {select}")
+def csv_files_inputs(csv_files: list[str]):
+    # Entradas de uma tabela (arquivos do L1): CRC-32 e tamanho do membro de origem, do manifesto do L1.
+    #   Arquivos sem manifesto (ou alterados depois da extração): tamanho e data de modificação.
+    inputs = {}
+    for csv_file in sorted(csv_files):
+        entry = read_file_manifest(csv_file)
+        if entry and entry["output_bytes"] == file_size(csv_file):
+            inputs[basename(csv_file)] = {"crc": entry["crc"], "size": entry["size"]}
+        else:
+            inputs[basename(csv_file)] = {"bytes": file_size(csv_file), "mtime": getmtime(csv_file)}
+    return inputs
+
+
+def zip_members_inputs(glob_pattern):
+    # Entradas de uma tabela (membros dos .zip): CRC-32 e tamanho, lidos do índice de cada .zip.
+    inputs = {}
+    for zip_file in glob(join(ZIP_FOLDER, "*.zip")):
+        with ZipFile(zip_file, "r") as zip_ref:
+            inputs.update({m.filename: {"crc": m.CRC, "size": m.file_size} for m in zip_ref.infolist() if fnmatch(m.filename, glob_pattern)})
+    return dict(sorted(inputs.items()))
+
+
+def table_select(table_name: str, select: str = None):
+    # Consulta de carga de uma tabela (sobre a relação 'csv'), com 'row_hash' nas tabelas de ROW_HASH_TABLES.
+    select = DEFAULT_SELECT if select is None else select
+    return f"SELECT s.*, hash(s) AS row_hash FROM ({select}) s" if table_name in ROW_HASH_TABLES else select
+
+
+def load_fingerprint(schema, inputs: dict, select: str = None):
+    # Impressão digital de uma tabela: definição (schema e consulta) e entradas. Igual para os modos .csv e .zip.
+    #   Schema None: regime de tributação.
+    if schema is None:
+        return fingerprint(REGIME_TRIBUTACAO_SCHEMA, REGIME_TRIBUTACAO_SELECT, inputs)
+    return fingerprint(schema, select or DEFAULT_SELECT, inputs)
+
+
+def is_loaded(con: duckdb.DuckDBPyConnection, table_name: str, digest: str):
+    return has_table(con, table_name) and table_fingerprint(con, table_name) == digest
+
+
+def reject_invalid_cnpj(con: duckdb.DuckDBPyConnection, table_name: str, source_table: str = None):
+    # Move as linhas com CNPJ inválido de 'source_table' (padrão: a própria tabela) para '<table_name>_rejeitado'.
+    #   A validação (cnpj_is_valid) é aritmética sobre as três colunas inteiras da chave: não relê os demais campos.
+    #   Retorna a quantidade de linhas rejeitadas.
+    source_table = table_name if source_table is None else source_table
+    invalid = "NOT coalesce(cnpj_is_valid(cnpj_base, cnpj_ordem, cnpj_dv), false)"
+    con.sql(f"CREATE OR REPLACE TABLE {table_name}_rejeitado AS SELECT * FROM {source_table} WHERE {invalid}")
+    rejected = table_rows(con, f"{table_name}_rejeitado")
+    if rejected:
+        con.sql(f"DELETE FROM {source_table} WHERE {invalid}")
+    return rejected
+
+
+def read_csv(con: duckdb.DuckDBPyConnection, input_files, schema):
+    return con.read_csv(
+        input_files,
+        header=False,
+        delimiter=";",
+        names=list(schema.keys()),
+        dtype=list(schema.values()),
+        encoding="utf-8",
+        parallel=True,
+        date_format="%Y%m%d",
+    )
+
 
-    print(f"    {table_name}")
+def has_regime_tributacao_header(csv_file: str):
+    # Alguns arquivos do regime de tributacao possuem cabeçalho e usam ',' como separador.
+    with open(csv_file, "r", encoding="utf-8") as f:
+        return f.readline().startswith("ano,cnpj")
 
 
-def regime_tributacao_csv_to_duckdb(con: duckdb.DuckDBPyConnection, table_name: str, glob_pattern: str):
-    if not has_table(con, table_name):
-        ddl = rf"""
-            CREATE TABLE {table_name} (
-                ano USMALLINT,
-                cnpj VARCHAR,
-                cnpj_scp VARCHAR,
-                tributacao VARCHAR,
-                qtd UTINYINT
-            );
-        """
-        con.sql(ddl)
+def read_regime_tributacao_csv(con: duckdb.DuckDBPyConnection, csv_files: list[str], header: bool):
+    # Todos os arquivos devem ter o mesmo formato (com ou sem cabeçalho).
+    return con.read_csv(
+        csv_files,
+        header=header,
+        delimiter="," if header else ";",
+        names=list(REGIME_TRIBUTACAO_SCHEMA.keys()),
+        dtype=list(REGIME_TRIBUTACAO_SCHEMA.values()),
+        encoding="utf-8",
+    )
+
 
+def csv_to_duckdb(con: duckdb.DuckDBPyConnection, table_name: str, glob_pattern: str, schema, select=None, concurrent=False):
+    with step("L2", table_name, concurrent=concurrent) as record:
+        input_files = glob(join(INPUT_FOLDER, glob_pattern))
+        inputs = csv_files_inputs(input_files)
+        select = table_select(table_name, select)
+        digest = load_fingerprint(schema, inputs, select)
+        if is_loaded(con, table_name, digest):
+            record["skipped"] = True
+        else:
+            record["input_bytes"] = file_size(*input_files)
+            db_size = database_size(con)
+
+            csv = read_csv(con, input_files, schema)
+            con.begin()
+            with profiling(con, record):
+                con.sql(f"CREATE OR REPLACE TABLE {table_name} AS {select}")
+            if table_name in CNPJ_TABLES:
+                record["rejected"] = reject_invalid_cnpj(con, table_name)
+            set_table_fingerprint(con, table_name, digest, inputs)
+            con.commit()
+
+            record["output_bytes"] = database_size(con) - db_size
+        record["rows"] = table_rows(con, table_name)
+
+
+def regime_tributacao_csv_to_duckdb(con: duckdb.DuckDBPyConnection, table_name: str, glob_pattern: str, concurrent=False):
+    with step("L2", table_name, concurrent=concurrent) as record:
         input_files = glob(abspath(join(INPUT_FOLDER, glob_pattern)))
-        for csv_file in input_files:
-            # Lê primeira linha do arquivo
-            with open(csv_file, "r", encoding="utf-8") as f:
-                first_line = f.readline()
+        inputs = csv_files_inputs(input_files)
+        digest = load_fingerprint(None, inputs)
+        if is_loaded(con, table_name, digest):
+            record["skipped"] = True
+        else:
+            con.begin()
+            con.sql(f"DROP TABLE IF EXISTS {table_name}")
+            con.sql(REGIME_TRIBUTACAO_DDL.format(table_name=table_name))
+
+            record["input_bytes"] = file_size(*input_files)
+            db_size = database_size(con)
+
+            # Uma leitura (de vários arquivos) para cada formato.
+            for header in (True, False):
+                csv_files = [f for f in input_files if has_regime_tributacao_header(f) == header]
+                if csv_files:
+                    csv = read_regime_tributacao_csv(con, csv_files, header)
+                    with profiling(con, record):
+                        con.sql(f"INSERT INTO {table_name} {REGIME_TRIBUTACAO_SELECT}")
+
+            record["rejected"] = reject_invalid_cnpj(con, table_name)
+            set_table_fingerprint(con, table_name, digest, inputs)
+            con.commit()
+
+            record["output_bytes"] = database_size(con) - db_size
+        record["rows"] = table_rows(con, table_name)
 
-            # Alguns arquivos do regime de tributacao possuem cabeçalho e usam ',' como separador.
-            if first_line.startswith("ano,cnpj"):
-                con.sql(f"COPY {table_name} FROM '{csv_file}' (FORMAT CSV, DELIMITER ',', HEADER)")
-            else:
-                con.sql(f"COPY {table_name} FROM '{csv_file}' (FORMAT CSV, DELIMITER ';')")
 
-    print(f"    {table_name}")
+#
+# Leitura direta dos arquivos .zip (sem a etapa L1)
+#
+
+
+def iter_zip_members(glob_pattern):
+    # Retorna um stream (ainda em 'latin1') para cada membro dos .zip que corresponde ao padrão.
+    for zip_file in sorted(glob(join(ZIP_FOLDER, "*.zip"))):
+        with ZipFile(zip_file, "r") as zip_ref:
+            for member in zip_ref.infolist():
+                if fnmatch(member.filename, glob_pattern):
+                    with zip_ref.open(member) as s:
+                        yield s
+
+
+def zip_members_size(glob_pattern):
+    # Tamanho (descompactado) dos membros dos .zip que correspondem ao padrão.
+    total = 0
+    for zip_file in glob(join(ZIP_FOLDER, "*.zip")):
+        with ZipFile(zip_file, "r") as zip_ref:
+            total += sum(m.file_size for m in zip_ref.infolist() if fnmatch(m.filename, glob_pattern))
+    return total
+
+
+def read_csv_batches(stream, names, delimiter=";", header=False):
+    # Todas as colunas são lidas como texto; a conversão de tipos fica a cargo do DuckDB.
+    return pyarrow.csv.open_csv(
+        stream,
+        read_options=pyarrow.csv.ReadOptions(column_names=names, skip_rows=1 if header else 0, encoding="latin1", block_size=BLOCK_SIZE),
+        parse_options=pyarrow.csv.ParseOptions(delimiter=delimiter),
+        convert_options=pyarrow.csv.ConvertOptions(column_types={n: pa.string() for n in names}, strings_can_be_null=True),
+    )
+
+
+def batches_to_relation(con: duckdb.DuckDBPyConnection, batches, schema):
+    arrow_schema = pa.schema([(n, pa.string()) for n in schema.keys()])
+    reader = pa.RecordBatchReader.from_batches(arrow_schema, batches)
+    casts = ", ".join(f"CAST({n} AS {t}) AS {n}" for n, t in schema.items())
+    return con.from_arrow(reader).project(casts)
+
+
+def zip_to_duckdb(con: duckdb.DuckDBPyConnection, table_name: str, glob_pattern: str, schema, select=None, concurrent=False):
+    with step("L2", table_name, concurrent=concurrent, from_zip=True) as record:
+        inputs = zip_members_inputs(glob_pattern)
+        select = table_select(table_name, select)
+        digest = load_fingerprint(schema, inputs, select)
+        if is_loaded(con, table_name, digest):
+            record["skipped"] = True
+        else:
+            record["input_bytes"] = zip_members_size(glob_pattern)
+            db_size = database_size(con)
+
+            names = list(schema.keys())
+            batches = (batch for s in iter_zip_members(glob_pattern) for batch in read_csv_batches(s, names))
+            csv = batches_to_relation(con, batches, schema)
+            con.begin()
+            with profiling(con, record):
+                con.sql(f"CREATE OR REPLACE TABLE {table_name} AS {select}")
+            if table_name in CNPJ_TABLES:
+                record["rejected"] = reject_invalid_cnpj(con, table_name)
+            set_table_fingerprint(con, table_name, digest, inputs)
+            con.commit()
+
+            record["output_bytes"] = database_size(con) - db_size
+        record["rows"] = table_rows(con, table_name)
+
+
+def regime_tributacao_zip_to_duckdb(con: duckdb.DuckDBPyConnection, table_name: str, glob_pattern: str, concurrent=False):
+    with step("L2", table_name, concurrent=concurrent, from_zip=True) as record:
+        inputs = zip_members_inputs(glob_pattern)
+        digest = load_fingerprint(None, inputs)
+        if is_loaded(con, table_name, digest):
+            record["skipped"] = True
+        else:
+            con.begin()
+            con.sql(f"DROP TABLE IF EXISTS {table_name}")
+            con.sql(REGIME_TRIBUTACAO_DDL.format(table_name=table_name))
+            record["input_bytes"] = zip_members_size(glob_pattern)
+            db_size = database_size(con)
+
+            names = list(REGIME_TRIBUTACAO_SCHEMA.keys())
+
+            def batches():
+                for s in iter_zip_members(glob_pattern):
+                    # Alguns arquivos do regime de tributacao possuem cabeçalho e usam ',' como separador.
+                    if s.peek(8).startswith(b"ano,cnpj"):
+                        yield from read_csv_batches(s, names, delimiter=",", header=True)
+                    else:
+                        yield from read_csv_batches(s, names)
+
+            csv = batches_to_relation(con, batches(), REGIME_TRIBUTACAO_SCHEMA)
+            with profiling(con, record):
+                con.sql(f"INSERT INTO {table_name} {REGIME_TRIBUTACAO_SELECT}")
+            record["rejected"] = reject_invalid_cnpj(con, table_name)
+            set_table_fingerprint(con, table_name, digest, inputs)
+            con.commit()
+
+            record["output_bytes"] = database_size(con) - db_size
+        record["rows"] = table_rows(con, table_name)
+
+
+def load_concurrently(con: duckdb.DuckDBPyConnection, load, table_name: str, *args):
+    # Executado numa thread: carrega uma tabela com um cursor próprio (transação independente das demais tabelas).
+    #   Retorna o nome da tabela, exibido pela thread principal (ver main()).
+    with register_macros(con.cursor()) as cursor:
+        load(cursor, table_name, *args, concurrent=True)
+    return table_name
 
 
 #
@@ -75,92 +440,36 @@ def regime_tributacao_csv_to_duckdb(con: duckdb.DuckDBPyConnection, table_name:
 
 
 def main():
-    UInt32 = "UINTEGER"
-    UInt16 = "USMALLINT"
-    UInt8 = "UTINYINT"
-    Utf8 = "VARCHAR"
-
-    schema_cnae = {"codigo": UInt32, "descricao": Utf8}
-
-    schema_satelites = {"codigo": UInt16, "descricao": Utf8}
-
-    schema_empresa = {
-        "cnpj_base": UInt32,
-        "razao_social": Utf8,
-        "natureza_juridica": UInt16,
-        "qualificacao_responsavel": UInt8,
-        "capital_social_str": Utf8,
-        "porte_empresa": UInt8,
-        "ente_federativo_responsavel": Utf8,
-    }
-
-    schema_estabelecimento = {
-        "cnpj_base": UInt32,
-        "cnpj_ordem": UInt16,
-        "cnpj_dv": UInt8,
-        "matriz": UInt8,
-        "nome_fantasia": Utf8,
-        "situacao_cadastral": UInt8,
-        "data_situacao_cadastral": Utf8,
-        "motivo_situacao_cadastral": UInt8,
-        "nome_cidade_exterior": Utf8,
-        "pais": Utf8,
-        "data_inicio_atividades": Utf8,
-        "cnae": Utf8,
-        "cnae_secundario": Utf8,
-        "tipo_logradouro": Utf8,
-        "logradouro": Utf8,
-        "numero": Utf8,
-        "complemento": Utf8,
-        "bairro": Utf8,
-        "cep": Utf8,
-        "uf": Utf8,
-        "municipio": UInt16,
-        "ddd1": Utf8,
-        "telefone1": Utf8,
-        "ddd2": Utf8,
-        "telefone2": Utf8,
-        "ddd_fax": Utf8,
-        "fax": Utf8,
-        "correio_eletronico": Utf8,
-        "situacao_especial": Utf8,
-        "data_situacao_especial": Utf8,
-    }
-
-    schema_simples = {
-        "cnpj_base": UInt32,
-        "opcao_simples": Utf8,
-        "data_opcao_simples": Utf8,
-        "data_exclusao_simples": Utf8,
-        "opcao_mei": Utf8,
-        "data_opcao_mei": Utf8,
-        "data_exclusao_mei": Utf8,
-    }
+    parser = ArgumentParser(description="L2: Carrega os arquivos .csv para um banco DuckDB.")
+    parser.add_argument("--from-zip", action="store_true", help=f"lê diretamente os arquivos .zip de '{ZIP_FOLDER}' (dispensa a etapa L1)")
+    parser.add_argument("--workers", type=int, default=LOAD_WORKERS, help="tabelas carregadas simultaneamente")
+    args = parser.parse_args()
+
+    if args.from_zip:
+        load_table, load_regime_tributacao = zip_to_duckdb, regime_tributacao_zip_to_duckdb
+    else:
+        load_table, load_regime_tributacao = csv_to_duckdb, regime_tributacao_csv_to_duckdb
 
     makedirs(OUTPUT_FOLDER, exist_ok=True)
     print("L2: Creating database...")
 
     db_file = join(OUTPUT_FOLDER, "rfb-cnpj.duckdb")
-    con = duckdb.connect(db_file)
+    con = connect(db_file)
     con.sql("SET preserve_insertion_order = false")
+    create_manifest_table(con)
 
-    csv_to_duckdb(con, "cnae", "*.CNAECSV", schema_cnae)
-    csv_to_duckdb(con, "motivo", "*.MOTICSV", schema_satelites)
-    csv_to_duckdb(con, "municipio", "*.MUNICCSV", schema_satelites)
-    csv_to_duckdb(con, "natureza_juridica", "*.NATJUCSV", schema_satelites)
-    csv_to_duckdb(con, "pais", "*.PAISCSV", schema_satelites)
-
-    csv_to_duckdb(con, "empresa", "*.EMPRECSV", schema_empresa)
-    csv_to_duckdb(
-        con,
-        "estabelecimento",
-        "*.ESTABELE",
-        schema_estabelecimento,
-    )
-    csv_to_duckdb(con, "simples", "*.SIMPLES.CSV.*", schema_simples)
-
+    loads = [(load_table, table_name, glob_pattern, schema) for table_name, glob_pattern, schema in TABLES]
     # Tratamento especial para arquivos do regime de tributação.
-    regime_tributacao_csv_to_duckdb(con, "regime_tributacao", "*.csv")
+    loads.append((load_regime_tributacao, *REGIME_TRIBUTACAO_TABLE))
+
+    # As maiores tabelas começam primeiro: o tempo total fica limitado pela carga de 'estabelecimento'.
+    input_size = zip_members_size if args.from_zip else lambda glob_pattern: file_size(*glob(join(INPUT_FOLDER, glob_pattern)))
+    loads.sort(key=lambda load: input_size(load[2]), reverse=True)
+
+    with ThreadPoolExecutor(args.workers) as pool:
+        futures = [pool.submit(load_concurrently, con, *load) for load in loads]
+        for future in as_completed(futures):
+            print(f"    {future.result()}")
 
     print(f"L2: Database ready.")
 
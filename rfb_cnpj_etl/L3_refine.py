@@ -4,47 +4,686 @@
 
 INPUT_FOLDER = ".data/L2-silver"
 OUTPUT_FOLDER = ".data/L3-gold"
+PARQUET_FOLDER = ".data/L3-gold/parquet"
+
+# Exportação em Parquet: faixas de 10 milhões de cnpj_base (10 partições) e row groups
+#   pequenos o suficiente para que as estatísticas (min/max) permitam pular dados na leitura.
+CNPJ_BASE_BUCKET_SIZE = 10_000_000
+PARQUET_ROW_GROUP_SIZE = 100_000
+
+# Tipos gravados no Parquet no lugar dos inteiros sem sinal: leitores baseados em Arrow (pyarrow, Polars) não usam as
+#   estatísticas (min/max) de colunas UINT32 gravadas pelo DuckDB. Os códigos da RFB têm no máximo 9 dígitos (cabem em INTEGER);
+#   um valor maior interrompe a exportação (erro de conversão).
+PARQUET_SIGNED_TYPES = {"UTINYINT": "SMALLINT", "USMALLINT": "INTEGER", "UINTEGER": "INTEGER"}
+
+# Limite (exclusivo) de cnpj_base: 8 dígitos.
+CNPJ_BASE_LIMIT = 100_000_000
+
+# Ordem física das tabelas grandes (chave de acesso principal): as estatísticas (min/max) de cada row group do DuckDB
+#   passam a cobrir faixas estreitas de cnpj_base, e uma consulta por CNPJ lê apenas os row groups da sua faixa.
+CLUSTER_KEYS = {
+    "empresa": ["cnpj_base"],
+    "estabelecimento": ["cnpj_base", "cnpj_ordem", "cnpj_dv"],
+}
+
+# Dependências de cada tabela: tabelas do L2 ('input.<tabela>') e do próprio L3. Uma tabela é refeita apenas se a sua consulta
+#   ou a impressão digital de alguma dependência (tabela '_manifest' de cada banco, ver manifest.py) mudou.
+DEPENDENCIES = {
+    "empresa": ["input.empresa", "input.simples"],
+    "estabelecimento": ["input.estabelecimento", "input.regime_tributacao"],
+    "estabelecimento_cnae": ["estabelecimento"],
+    "cnae": ["input.cnae"],
+    "motivo": ["input.motivo"],
+    "municipio": ["input.municipio"],
+    "natureza_juridica": ["input.natureza_juridica"],
+    "pais": ["input.pais"],
+    "qualificacao": ["input.qualificacao"],
+    "socio_pessoa": ["input.socio"],
+    "socio": ["input.socio", "socio_pessoa"],
+    "empresa_socios": ["socio"],
+    "socio_empresas": ["socio"],
+    "resumo_cnae_municipio": ["estabelecimento_cnae", "estabelecimento", "empresa"],
+    "resumo_cnae_uf": ["resumo_cnae_municipio"],
+    "resumo_cnae": ["resumo_cnae_municipio"],
+    "resumo_municipio": ["estabelecimento", "empresa"],
+    "resumo_uf": ["resumo_municipio"],
+    "nome_token": ["empresa", "estabelecimento"],
+    "nome_token_df": ["nome_token"],
+    "enum_desconhecido": ["input.empresa", "input.estabelecimento"],
+}
+
+# Atualização incremental (--incremental): tabelas do L2 de que depende cada tabela atualizada por chave. A linha de cada chave
+#   depende apenas das linhas com a mesma chave nessas tabelas, que trazem o hash de cada linha ('row_hash', ver L2_load.ROW_HASH_TABLES).
+#   O L3 guarda o hash por chave aplicado na última atualização ('entrada_<tabela do L2>') e refaz apenas as chaves cujo hash mudou.
+#   Os hashes são gravados apenas com --incremental; sem ele, são excluídos (não ocupam espaço em bancos sempre recriados).
+INCREMENTAL_SOURCES = {
+    "empresa": ["empresa", "simples"],
+    "estabelecimento": ["estabelecimento", "regime_tributacao"],
+}
+
+# Colunas cujas estatísticas por row group são registradas na tabela 'estatistica_row_group' (se a tabela existir).
+ROW_GROUP_STATS_COLUMNS = {
+    "empresa": ["cnpj_base"],
+    "estabelecimento": ["cnpj_base", "uf", "municipio"],
+    "estabelecimento_cnae": ["cnae"],
+    "socio": ["cnpj_base"],
+    "empresa_socios": ["cnpj_base"],
+    "socio_empresas": ["socio_id"],
+    "nome_token": ["token"],
+}
+
+# Tipos ENUM das colunas categóricas com códigos fixos da RFB: {valor no arquivo da RFB: rótulo}.
+#   Valores desconhecidos viram NULL e são registrados na tabela 'enum_desconhecido' (ver ENUM_COLUMNS): acrescente-os aqui.
+#   O regime de tributação (texto livre, de outro conjunto de dados da RFB) fica como VARCHAR: o DuckDB já o comprime por dicionário.
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA", "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO", "EX"]
+ENUM_TYPES = {
+    "tipo_uf": {uf: uf for uf in UFS},
+    "tipo_situacao_cadastral": {1: "Nula", 2: "Ativa", 3: "Suspensa", 4: "Inapta", 8: "Baixada"},
+    "tipo_porte_empresa": {0: "Não informado", 1: "Micro empresa", 3: "Empresa de pequeno porte", 5: "Demais"},
+}
+
+# Colunas ENUM: (tabela do L2, coluna, tipo). A coluna tem o mesmo nome no L2 e no L3; texto vazio equivale a NULL.
+ENUM_COLUMNS = [
+    ("empresa", "porte_empresa", "tipo_porte_empresa"),
+    ("estabelecimento", "situacao_cadastral", "tipo_situacao_cadastral"),
+    ("estabelecimento", "uf", "tipo_uf"),
+]
+
+# Histórico (--history): banco separado com as versões de cada chave ao longo das releases mensais da RFB (ver queries.HISTORY_COLUMNS).
+#   A cada release, grava apenas as chaves incluídas, alteradas (nas colunas do histórico) ou excluídas, com 'valid_from' = data da release;
+#   a versão anterior recebe 'valid_to'. Exclusões são gravadas como versões com 'excluido' (e colunas NULL).
+HISTORY_DB_FILE = "rfb-cnpj-historico.duckdb"
+
+# Data da release (padrão): data mais recente dos arquivos dentro dos .zip de estabelecimentos baixados pelo L0.
+ZIP_FOLDER = ".data/L0-zip"
+RELEASE_ZIP_FILES = "Estabelecimentos*.zip"
 
 
 #
 # Functions
 #
 
-from os import makedirs
-from os.path import abspath, join
+from argparse import ArgumentParser
+from datetime import date
+from glob import glob
+from os import makedirs, rename
+from os.path import abspath, isdir, join
+from shutil import rmtree
+from zipfile import ZipFile
 
 import duckdb
+import polars as pl
+import pyarrow as pa
+import pyarrow.dataset as ds
+import re
+
+from rfb_cnpj_etl.config import PROFILE, connect
+from rfb_cnpj_etl.manifest import (
+    create_manifest_table,
+    database_copy,
+    fingerprint,
+    remove_database,
+    remove_table_fingerprint,
+    replace_database,
+    set_table_fingerprint,
+    table_fingerprint,
+    table_inputs,
+)
+from rfb_cnpj_etl.metrics import database_size, folder_size, profiling, step, table_rows
+from rfb_cnpj_etl.queries import HISTORY_COLUMNS, HISTORY_KEYS, NOME_TOKEN_MIN_LENGTH, NOME_TOKENS, RESUMOS
 
 
 #
 # Main
 #
-def create_table_from_sql(con: duckdb.DuckDBPyConnection, table_name: str, sql: str = None):
+def has_table(con: duckdb.DuckDBPyConnection, table_name: str):
+    sql = "SELECT 1 FROM duckdb_tables WHERE database_name = current_database() AND schema_name = 'main' AND table_name = ?"
+    return con.sql(sql, params=[table_name]).fetchone() is not None
+
+
+def sql_literal(value):
+    return str(value) if isinstance(value, int) else "'" + str(value).replace("'", "''") + "'"
+
+
+def create_enum_types(con: duckdb.DuckDBPyConnection):
+    sql = "SELECT 1 FROM duckdb_types() WHERE database_name = current_database() AND type_name = ?"
+    for type_name, values in ENUM_TYPES.items():
+        if con.sql(sql, params=[type_name]).fetchone() is None:
+            con.sql(f"CREATE TYPE {type_name} AS ENUM ({', '.join(sql_literal(v) for v in values.values())})")
+
+
+def to_enum(expression: str, type_name: str):
+    # Converte 'expression' para o ENUM 'type_name'. Valores fora de ENUM_TYPES viram NULL (ver unknown_enum_sql()).
+    whens = " ".join(f"WHEN {expression} = {sql_literal(k)} THEN {sql_literal(v)}" for k, v in ENUM_TYPES[type_name].items())
+    return f"CAST(CASE {whens} END AS {type_name})"
+
+
+def unknown_enum_sql():
+    # Valores das colunas ENUM_COLUMNS (nas tabelas do L2) fora de ENUM_TYPES, com a quantidade de linhas de cada um.
+    selects = [
+        f"""
+        SELECT '{table_name}' AS tabela, '{column}' AS coluna, CAST({column} AS VARCHAR) AS valor, count(*) AS linhas
+        FROM input.{table_name}
+        WHERE NULLIF(CAST({column} AS VARCHAR), '') IS NOT NULL AND {column} NOT IN ({", ".join(sql_literal(k) for k in ENUM_TYPES[type_name])})
+        GROUP BY ALL"""
+        for table_name, column, type_name in ENUM_COLUMNS
+    ]
+    return f"{' UNION ALL '.join(selects)} ORDER BY ALL"
+
+
+def cnpj_base_ranges(passes: int):
+    # Faixas [início, fim) de cnpj_base, uma por passada.
+    size = -(-CNPJ_BASE_LIMIT // passes)
+    return [(start, start + size) for start in range(0, CNPJ_BASE_LIMIT, size)]
+
+
+def filter_cnpj_base(sql: str, start: int, end: int):
+    # O DuckDB propaga o filtro para as leituras (e agregações) de 'sql': cada passada processa apenas uma faixa.
+    return f"SELECT * FROM ({sql}) WHERE cnpj_base >= {start} AND cnpj_base < {end}"
+
+
+def clustered(table_name: str, sql: str):
+    # Ordena 'sql' pela chave de CLUSTER_KEYS da tabela (se houver).
+    keys = CLUSTER_KEYS.get(table_name)
+    return f"SELECT * FROM ({sql}) ORDER BY {', '.join(keys)}" if keys else sql
+
+
+def sql_fingerprint(con: duckdb.DuckDBPyConnection, table_name: str, sql: str, **overrides):
+    # Impressão digital de uma tabela: consulta e impressões digitais das dependências (DEPENDENCIES).
+    #   'overrides': impressões digitais a usar para algumas dependências (ex.: a versão anterior de uma tabela).
+    inputs = {}
+    for dependency in DEPENDENCIES[table_name]:
+        database, _, name = dependency.rpartition(".")
+        inputs[dependency] = table_fingerprint(con, name, database or None)
+    inputs.update(overrides)
+    return fingerprint(clustered(table_name, sql), inputs), inputs
+
+
+def is_current(con: duckdb.DuckDBPyConnection, table_name: str, digest: str):
+    return has_table(con, table_name) and table_fingerprint(con, table_name) == digest
+
+
+def create_table_from_sql(con: duckdb.DuckDBPyConnection, table_name: str, sql: str = None, passes: int = 1):
+    # Cria (ou recria, se a impressão digital mudou) a tabela, numa transação junto com o manifesto.
+    #   Com 'passes' > 1, a tabela é criada em várias passadas (faixas de cnpj_base), limitando o pico de memória
+    #   dos joins e agregações. As passadas são gravadas numa tabela parcial, que substitui a tabela ao final.
+    #   Tabelas em CLUSTER_KEYS são gravadas ordenadas (as passadas seguem a ordem das faixas de cnpj_base).
     sql = f"SELECT * from input.{table_name}" if sql is None else sql
-    con.sql(f"CREATE TABLE IF NOT EXISTS {table_name} AS {sql}")
+    digest, inputs = sql_fingerprint(con, table_name, sql)
+    with step("L3", table_name, passes=passes) as record:
+        if is_current(con, table_name, digest):
+            record["skipped"] = True
+        elif passes == 1:
+            db_size = database_size(con)
+            con.begin()
+            with profiling(con, record):
+                con.sql(f"CREATE OR REPLACE TABLE {table_name} AS {clustered(table_name, sql)}")
+            set_table_fingerprint(con, table_name, digest, inputs)
+            con.commit()
+            record["output_bytes"] = database_size(con) - db_size
+        else:
+            db_size = database_size(con)
+            staging = f"{table_name}_parcial"
+            for i, (start, end) in enumerate(cnpj_base_ranges(passes)):
+                with profiling(con, record):
+                    if i == 0:
+                        con.sql(f"CREATE OR REPLACE TABLE {staging} AS {clustered(table_name, filter_cnpj_base(sql, start, end))}")
+                    else:
+                        con.sql(f"INSERT INTO {staging} {clustered(table_name, filter_cnpj_base(sql, start, end))}")
+            con.begin()
+            con.sql(f"DROP TABLE IF EXISTS {table_name}")
+            con.sql(f"ALTER TABLE {staging} RENAME TO {table_name}")
+            set_table_fingerprint(con, table_name, digest, inputs)
+            con.commit()
+            record["output_bytes"] = database_size(con) - db_size
+        record["rows"] = table_rows(con, table_name)
     print(f"    {table_name}")
 
 
-def main():
+def same_columns(con: duckdb.DuckDBPyConnection, table_name: str, sql: str):
+    # A tabela existe com as mesmas colunas (nomes e tipos) de 'sql' (ex.: um tipo mudou de ENUM para VARCHAR): senão, o delta
+    #   não pode ser aplicado e a tabela é recriada. A consulta é apenas analisada, não executada.
+    if not has_table(con, table_name):
+        return False
+    rel = con.sql(sql)
+    return list(zip(rel.columns, map(str, rel.types))) == list(zip(con.table(table_name).columns, map(str, con.table(table_name).types)))
+
+
+def restrict_sql(sql: str, tables: list[str], keys_table: str, keys: list[str]):
+    # Limita as leituras de 'tables' em 'sql' (FROM/JOIN <tabela> ou input.<tabela>) às chaves de 'keys_table'.
+    #   Os filtros ficam abaixo dos joins e agregações da consulta: apenas as linhas dessas chaves são processadas.
+    pattern = rf"\b(FROM|JOIN)\s+((?:input\.)?({'|'.join(tables)}))\b(?!\.)"
+    return re.sub(pattern, lambda m: f"{m[1]} (SELECT * FROM {m[2]} SEMI JOIN {keys_table} USING ({', '.join(keys)})) AS {m[3]}", sql)
+
+
+def delta_sql(new_sql: str, old_sql: str, keys: list[str]):
+    # Chaves cujas linhas diferem (hash da linha inteira) entre 'new_sql' e 'old_sql'.
+    key_columns = ", ".join(keys)
+    return f"""
+        SELECT
+            {key_columns},
+            o.hash IS NULL AS incluido,
+            n.hash IS NULL AS excluido
+        FROM
+            (SELECT {key_columns}, hash(n) AS hash FROM ({new_sql}) n) n
+            FULL JOIN (SELECT {key_columns}, hash(o) AS hash FROM ({old_sql}) o) o USING ({key_columns})
+        WHERE
+            n.hash IS DISTINCT FROM o.hash
+    """
+
+
+def apply_delta(con: duckdb.DuckDBPyConnection, table_name: str, sql: str, keys: list[str], delta_table: str):
+    # Remove todas as chaves alteradas e reinsere (a partir de 'sql') as que não foram excluídas.
+    #   As linhas reinseridas ficam no fim da tabela (ordenadas entre si): uma nova carga completa restaura a ordem física.
+    on = " AND ".join(f"t.{k} = d.{k}" for k in keys)
+    con.sql(f"DELETE FROM {table_name} t USING {delta_table} d WHERE {on}")
+    delta_sql = f"SELECT t.* FROM ({sql}) t SEMI JOIN (SELECT * FROM {delta_table} WHERE NOT excluido) d ON {on}"
+    con.sql(f"INSERT INTO {table_name} {clustered(table_name, delta_sql)}")
+
+
+def input_hashes_sql(source: str, keys: list[str], keys_table: str = None):
+    # Hash por chave das linhas de uma tabela do L2 (soma dos 'row_hash': independe da ordem e das linhas repetidas).
+    key_columns = ", ".join(keys)
+    source_sql = f"input.{source}" if keys_table is None else f"(SELECT * FROM input.{source} SEMI JOIN {keys_table} USING ({key_columns}))"
+    return f"SELECT {key_columns}, hash(sum(row_hash)) AS hash FROM {source_sql} GROUP BY {key_columns}"
+
+
+def has_input_hashes(con: duckdb.DuckDBPyConnection, table_name: str):
+    # Tabelas do L2 carregadas com 'row_hash' (bancos L2 anteriores não têm a coluna).
+    sql = "SELECT count(*) FROM duckdb_columns WHERE database_name = 'input' AND table_name = ? AND column_name = 'row_hash'"
+    return all(con.sql(sql, params=[source]).fetchone()[0] for source in INCREMENTAL_SOURCES[table_name])
+
+
+def save_input_hashes(con: duckdb.DuckDBPyConnection, table_name: str, keys: list[str]):
+    # Grava o hash por chave das tabelas do L2 das quais 'table_name' foi criada ('entrada_<tabela do L2>'), com a mesma
+    #   impressão digital da tabela. Mantido em dia por refresh_table_from_sql; recriado após uma comparação completa.
+    digest = table_fingerprint(con, table_name)
+    if not has_input_hashes(con, table_name):
+        return
+    for source in INCREMENTAL_SOURCES[table_name]:
+        hashes_table = f"entrada_{source}"
+        if not (has_table(con, hashes_table) and table_fingerprint(con, hashes_table) == digest):
+            with step("L3", hashes_table):
+                con.begin()
+                con.sql(f"CREATE OR REPLACE TABLE {hashes_table} AS {input_hashes_sql(source, keys)} ORDER BY ALL")
+                set_table_fingerprint(con, hashes_table, digest, {table_name: digest})
+                con.commit()
+
+
+def drop_input_hashes(con: duckdb.DuckDBPyConnection, table_name: str):
+    # Sem --incremental: exclui os hashes por chave de 'table_name' gravados por uma atualização incremental anterior.
+    for source in INCREMENTAL_SOURCES[table_name]:
+        hashes_table = f"entrada_{source}"
+        if has_table(con, hashes_table):
+            con.begin()
+            con.sql(f"DROP TABLE {hashes_table}")
+            remove_table_fingerprint(con, hashes_table)
+            con.commit()
+
+
+def changed_input_keys(con: duckdb.DuckDBPyConnection, table_name: str, sql: str, keys: list[str]):
+    # Chaves cujas linhas no L2 mudaram desde a última atualização (tabela temporária 'chaves_<tabela>').
+    #   None se não for possível limitar a atualização a elas: consulta alterada, tabela do L2 sem 'row_hash'
+    #   ou hashes da atualização anterior ausentes.
+    digest = table_fingerprint(con, table_name)
+    previous_inputs = table_inputs(con, table_name)
+    if previous_inputs is None or sql_fingerprint(con, table_name, sql, **previous_inputs)[0] != digest or not has_input_hashes(con, table_name):
+        return None
+    sources = INCREMENTAL_SOURCES[table_name]
+    if not all(has_table(con, f"entrada_{s}") and table_fingerprint(con, f"entrada_{s}") == digest for s in sources):
+        return None
+
+    key_columns = ", ".join(keys)
+    keys_table = f"chaves_{table_name}"
+    changed = " UNION ".join(
+        f"""
+        SELECT {key_columns}
+        FROM ({input_hashes_sql(source, keys)}) n FULL JOIN entrada_{source} o USING ({key_columns})
+        WHERE n.hash IS DISTINCT FROM o.hash"""
+        for source in sources
+    )
+    con.sql(f"CREATE OR REPLACE TEMP TABLE {keys_table} AS {changed}")
+    return keys_table
+
+
+def refresh_table_from_sql(con: duckdb.DuckDBPyConnection, table_name: str, sql: str, keys: list[str], passes: int = 1):
+    # Atualização incremental: aplica apenas as inclusões, alterações e exclusões (tabela temporária 'delta_<tabela>').
+    #   Refaz apenas as chaves cujas linhas no L2 mudaram (changed_input_keys): a consulta é executada apenas sobre elas e
+    #   comparada (hash de cada linha) com as linhas atuais dessas chaves. Se não for possível (ex.: a consulta mudou),
+    #   compara a tabela inteira (com 'passes' > 1, por faixas de cnpj_base). Retorna a quantidade de chaves alteradas.
+    if not same_columns(con, table_name, sql):
+        create_table_from_sql(con, table_name, sql, passes)
+        return None
+
+    digest, inputs = sql_fingerprint(con, table_name, sql)
+    key_columns = ", ".join(keys)
+    delta_table = f"delta_{table_name}"
+    with step("L3", table_name, mode="incremental", passes=passes) as record:
+        if is_current(con, table_name, digest):
+            record["skipped"] = True
+            incluidos = alterados = excluidos = 0
+        else:
+            keys_table = changed_input_keys(con, table_name, sql, keys)
+            if keys_table is not None:
+                new_table = f"novo_{table_name}"
+                with profiling(con, record):
+                    con.sql(f"CREATE OR REPLACE TEMP TABLE {new_table} AS {restrict_sql(sql, INCREMENTAL_SOURCES[table_name], keys_table, keys)}")
+                    old_sql = f"SELECT * FROM {table_name} SEMI JOIN {keys_table} USING ({key_columns})"
+                    con.sql(f"CREATE OR REPLACE TEMP TABLE {delta_table} AS {delta_sql(f'SELECT * FROM {new_table}', old_sql, keys)}")
+                record["chaves_entrada"] = table_rows(con, keys_table)
+                rows_sql = f"SELECT * FROM {new_table}"
+            else:
+                for i, (start, end) in enumerate(cnpj_base_ranges(passes)):
+                    old_sql = f"SELECT * FROM {table_name} WHERE cnpj_base >= {start} AND cnpj_base < {end}"
+                    sql_range = delta_sql(filter_cnpj_base(sql, start, end), old_sql, keys)
+                    with profiling(con, record):
+                        if i == 0:
+                            con.sql(f"CREATE OR REPLACE TEMP TABLE {delta_table} AS {sql_range}")
+                        else:
+                            con.sql(f"INSERT INTO {delta_table} {sql_range}")
+                rows_sql = sql
+
+            con.begin()
+            apply_delta(con, table_name, rows_sql, keys, delta_table)
+            set_table_fingerprint(con, table_name, digest, inputs)
+            if keys_table is not None:
+                # Hashes das chaves refeitas; os das demais continuam válidos.
+                for source in INCREMENTAL_SOURCES[table_name]:
+                    hashes_table = f"entrada_{source}"
+                    con.sql(f"DELETE FROM {hashes_table} USING {keys_table} k WHERE {' AND '.join(f'{hashes_table}.{k} = k.{k}' for k in keys)}")
+                    con.sql(f"INSERT INTO {hashes_table} {input_hashes_sql(source, keys, keys_table)}")
+                    set_table_fingerprint(con, hashes_table, digest, {table_name: digest})
+            con.commit()
+
+            incluidos, alterados, excluidos = con.sql(
+                f"SELECT count(*) FILTER (incluido), count(*) FILTER (NOT incluido AND NOT excluido), count(*) FILTER (excluido) FROM {delta_table}"
+            ).fetchone()
+        record.update(rows=table_rows(con, table_name), incluidos=incluidos, alterados=alterados, excluidos=excluidos)
+    print(f"    {table_name} (+{incluidos} ~{alterados} -{excluidos})")
+    return incluidos + alterados + excluidos
+
+
+def refresh_derived_table_from_sql(con: duckdb.DuckDBPyConnection, table_name: str, sql: str, keys: list[str], source_fingerprints: dict):
+    # Tabela derivada de tabelas atualizadas por refresh_table_from_sql ('source_fingerprints': tabela -> impressão digital
+    #   anterior à atualização). Refaz apenas as chaves ('keys', presentes nas origens) alteradas nas origens (delta_<origem>),
+    #   lendo das origens apenas essas chaves. O delta só é suficiente se a tabela estava atualizada em relação às versões
+    #   anteriores das origens e se as origens alteradas têm delta (não foram recriadas); caso contrário, a tabela é recriada.
+    if not same_columns(con, table_name, sql):
+        create_table_from_sql(con, table_name, sql)
+        return
+
+    digest, inputs = sql_fingerprint(con, table_name, sql)
+    previous_digest, _ = sql_fingerprint(con, table_name, sql, **source_fingerprints)
+    current = table_fingerprint(con, table_name)
+    changed = [s for s, fingerprint in source_fingerprints.items() if table_fingerprint(con, s) != fingerprint]
+    has_delta = "SELECT 1 FROM duckdb_tables WHERE temporary AND table_name = ?"
+    if (current != digest and current != previous_digest) or any(con.sql(has_delta, params=[f"delta_{s}"]).fetchone() is None for s in changed):
+        create_table_from_sql(con, table_name, sql)
+        return
+
+    with step("L3", table_name, mode="incremental") as record:
+        if current == digest:
+            record["skipped"] = True
+        else:
+            # Chaves alteradas: união dos deltas das origens que mudaram nesta execução.
+            key_columns = ", ".join(keys)
+            keys_table = f"chaves_{table_name}"
+            con.sql(f"CREATE OR REPLACE TEMP TABLE {keys_table} AS {' UNION '.join(f'SELECT {key_columns} FROM delta_{s}' for s in changed)}")
+            con.sql(f"CREATE OR REPLACE TEMP TABLE delta_{table_name} AS SELECT *, false AS excluido FROM {keys_table}")
+            con.begin()
+            with profiling(con, record):
+                apply_delta(con, table_name, restrict_sql(sql, list(source_fingerprints), keys_table, keys), keys, f"delta_{table_name}")
+            set_table_fingerprint(con, table_name, digest, inputs)
+            con.commit()
+            record["chaves"] = table_rows(con, keys_table)
+        record["rows"] = table_rows(con, table_name)
+    print(f"    {table_name}")
+
+
+def create_row_group_stats(con: duckdb.DuckDBPyConnection):
+    # Estatísticas (min/max) de cada row group nas colunas de ROW_GROUP_STATS_COLUMNS, lidas de pragma_storage_info:
+    #   são elas que permitem ao DuckDB pular row groups numa consulta por faixa ou por valor.
+    #   'row_groups_por_valor': média de row groups cuja faixa contém o menor valor de cada row group (1.0 = sem sobreposição).
+    selects = [
+        rf"""
+        SELECT '{table_name}' AS tabela, column_name AS coluna, CAST(row_group_id AS UINTEGER) AS row_group, max(count) AS linhas,
+            min(regexp_extract(stats, '\[Min: (.*), Max: ', 1)) AS minimo,
+            max(regexp_extract(stats, ', Max: (.*)\]\[', 1)) AS maximo
+        FROM pragma_storage_info('{table_name}')
+        WHERE column_name IN ({", ".join(sql_literal(c) for c in columns)}) AND segment_type <> 'VALIDITY'
+        GROUP BY ALL"""
+        for table_name, columns in ROW_GROUP_STATS_COLUMNS.items()
+        if has_table(con, table_name)
+    ]
+    with step("L3", "estatistica_row_group") as record:
+        con.sql(f"CREATE OR REPLACE TABLE estatistica_row_group AS {' UNION ALL '.join(selects)} ORDER BY tabela, coluna, row_group")
+
+        # Valores numéricos são comparados como números; os demais (ex.: token, uf), como texto.
+        summary = con.sql(
+            r"""
+            WITH z AS (SELECT *, TRY_CAST(minimo AS DOUBLE) AS minimo_n, TRY_CAST(maximo AS DOUBLE) AS maximo_n FROM estatistica_row_group)
+            SELECT a.tabela, a.coluna, count(DISTINCT a.row_group) AS row_groups, round(count(*) / count(DISTINCT a.row_group), 1) AS row_groups_por_valor
+            FROM z a
+            JOIN z b
+              ON b.tabela = a.tabela AND b.coluna = a.coluna
+             AND CASE
+                    WHEN a.minimo_n IS NOT NULL AND b.minimo_n IS NOT NULL AND b.maximo_n IS NOT NULL THEN a.minimo_n BETWEEN b.minimo_n AND b.maximo_n
+                    ELSE a.minimo BETWEEN b.minimo AND b.maximo
+                 END
+            GROUP BY ALL
+            ORDER BY ALL
+        """
+        ).fetchall()
+        record["tables"] = {f"{t}.{c}": {"row_groups": n, "row_groups_por_valor": v} for t, c, n, v in summary}
+
+    print("    estatistica_row_group")
+    for t, c, n, v in summary:
+        print(f"      {t}.{c}: {n} row groups, {v} por valor")
+
+
+def parquet_column(column_name: str, column_type: str):
+    # ENUM -> VARCHAR; inteiros sem sinal (também em listas) -> PARQUET_SIGNED_TYPES.
+    if column_type.startswith("ENUM("):
+        column_type = "VARCHAR"
+    else:
+        column_type = re.sub(r"\b(U(?:TINYINT|SMALLINT|INTEGER))\b", lambda m: PARQUET_SIGNED_TYPES[m.group(1)], column_type)
+    return f"CAST({column_name} AS {column_type}) AS {column_name}"
+
+
+def parquet_select(con: duckdb.DuckDBPyConnection, table_name: str, partition_by: list[str]):
+    # Ordenada pelas partições e por cnpj_base: cada arquivo é gravado de uma vez, com row groups de faixas estreitas de cnpj_base.
+    columns = con.sql(f"SELECT column_name, column_type FROM (DESCRIBE {table_name})").fetchall()
+    return f"""
+        SELECT {", ".join(parquet_column(c, t) for c, t in columns)},
+               CAST(cnpj_base // {CNPJ_BASE_BUCKET_SIZE} AS INTEGER) AS faixa_cnpj_base
+        FROM {table_name}
+        ORDER BY {", ".join(partition_by)}, cnpj_base
+    """
+
+
+def write_parquet(con: duckdb.DuckDBPyConnection, sql: str, target_folder: str, partition_by: list[str]):
+    # Partições Hive ('uf=SP/faixa_cnpj_base=3/data_0.parquet'), um arquivo por partição. As colunas de partição ficam apenas
+    #   no caminho (o COPY ... PARTITION_BY do DuckDB 0.10 também as grava nos arquivos, o que impede a leitura pelo Polars/pyarrow).
+    #   Gravação em uma thread: preserva a ordem das linhas dentro de cada arquivo.
+    batches = con.sql(sql).record_batch(PARQUET_ROW_GROUP_SIZE)
+    partitioning = ds.partitioning(pa.schema([batches.schema.field(c) for c in partition_by]), flavor="hive")
+    ds.write_dataset(
+        batches,
+        target_folder,
+        format="parquet",
+        partitioning=partitioning,
+        basename_template="data_{i}.parquet",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        min_rows_per_group=PARQUET_ROW_GROUP_SIZE,
+        max_rows_per_group=PARQUET_ROW_GROUP_SIZE,
+        use_threads=False,
+    )
+
+
+def check_parquet(con: duckdb.DuckDBPyConnection, table_name: str, target_folder: str):
+    # Leitura de volta pelo pyarrow e pelo Polars (partições Hive): número de linhas e estatísticas (min/max) de cnpj_base
+    #   em todos os row groups, cobrindo o mínimo e o máximo da tabela.
+    rows, min_cnpj_base, max_cnpj_base = con.sql(f"SELECT count(*), min(cnpj_base), max(cnpj_base) FROM {table_name}").fetchone()
+
+    dataset = ds.dataset(target_folder, format="parquet", partitioning="hive")
+    polars_rows = pl.scan_parquet(join(target_folder, "**", "*.parquet"), hive_partitioning=True).select(pl.len()).collect().item()
+    if dataset.count_rows() != rows or polars_rows != rows:
+        raise ValueError(f"{target_folder}: {dataset.count_rows()} rows (pyarrow), {polars_rows} rows (Polars); expected {rows}.")
+
+    minimums, maximums = [], []
+    for fragment in dataset.get_fragments():
+        metadata = fragment.metadata
+        if metadata.num_rows == 0:
+            raise ValueError(f"{fragment.path}: empty file.")
+        column = metadata.schema.names.index("cnpj_base")
+        for i in range(metadata.num_row_groups):
+            statistics = metadata.row_group(i).column(column).statistics
+            if statistics is None or not statistics.has_min_max:
+                raise ValueError(f"{fragment.path}: row group {i} without min/max statistics for cnpj_base.")
+            minimums.append(statistics.min)
+            maximums.append(statistics.max)
+    if rows and (min(minimums), max(maximums)) != (min_cnpj_base, max_cnpj_base):
+        raise ValueError(f"{target_folder}: cnpj_base statistics {min(minimums)}..{max(maximums)}; expected {min_cnpj_base}..{max_cnpj_base}.")
+    return rows
+
+
+def table_to_parquet(con: duckdb.DuckDBPyConnection, table_name: str, partition_by: list[str]):
+    # Exportação refeita apenas se a tabela (impressão digital no manifesto) ou o particionamento mudaram.
+    target_folder = join(PARQUET_FOLDER, table_name)
+    export_name = f"{table_name}.parquet"
+    digest = fingerprint(table_fingerprint(con, table_name), partition_by, CNPJ_BASE_BUCKET_SIZE, PARQUET_ROW_GROUP_SIZE, PARQUET_SIGNED_TYPES)
+
+    if not (isdir(target_folder) and table_fingerprint(con, export_name) == digest):
+        # Grava numa pasta temporária e renomeia ao final: uma exportação interrompida não é considerada concluída.
+        temp_folder = f"{target_folder}.tmp"
+        rmtree(temp_folder, ignore_errors=True)
+        with step("L3", export_name) as record:
+            with profiling(con, record):
+                write_parquet(con, parquet_select(con, table_name, partition_by), temp_folder, partition_by)
+            record["rows"] = check_parquet(con, table_name, temp_folder)
+            rmtree(target_folder, ignore_errors=True)
+            rename(temp_folder, target_folder)
+            con.begin()
+            set_table_fingerprint(con, export_name, digest, {table_name: table_fingerprint(con, table_name)})
+            con.commit()
+            record["output_bytes"] = folder_size(target_folder)
+
+    print(f"    {target_folder}")
+
+
+def release_date():
+    # Arquivos sem data (1980-01-01, o mínimo do formato .zip) são ignorados; sem nenhuma data, usa a data atual.
+    dates = []
+    for zip_file in glob(join(ZIP_FOLDER, RELEASE_ZIP_FILES)):
+        with ZipFile(zip_file) as zip_ref:
+            dates += [date(*info.date_time[:3]) for info in zip_ref.infolist()]
+    return max((d for d in dates if d.year > 1980), default=date.today())
+
+
+def update_history(db_file: str, history_db_file: str, release: date):
+    # Acrescenta ao histórico as alterações do banco L3 ('db_file') em relação à versão atual de cada chave.
+    #   Releases são aplicadas em ordem: reaplicar a última não faz nada; uma release anterior à última é um erro.
+    #   As linhas de cada release são gravadas ordenadas pela chave, após as das releases anteriores: as estatísticas (min/max)
+    #   de 'valid_from' e da chave permitem às consultas ler apenas os row groups necessários.
+    temp_db_file = database_copy(history_db_file)
+    con = connect(temp_db_file)
+    con.sql(f"ATTACH '{abspath(db_file)}' AS gold (READ_ONLY)")
+    con.sql("CREATE TABLE IF NOT EXISTS release (data_release DATE PRIMARY KEY, aplicada_em TIMESTAMP)")
+
+    last = con.sql("SELECT max(data_release) FROM release").fetchone()[0]
+    if last is not None and release < last:
+        raise ValueError(f"Release {release} is older than the last release in the history ({last}).")
+
+    if release != last:
+        con.begin()
+        for table_name, columns in HISTORY_COLUMNS.items():
+            history_table = f"{table_name}_historico"
+            keys = HISTORY_KEYS[table_name]
+            key_columns = ", ".join(keys)
+
+            # ENUMs como texto: o histórico não depende dos tipos (ENUM_TYPES) vigentes em cada release.
+            types = dict(con.sql(f"SELECT column_name, data_type FROM duckdb_columns WHERE database_name = 'gold' AND table_name = '{table_name}'").fetchall())
+            values = ", ".join(f"CAST({c} AS VARCHAR) AS {c}" if types[c].startswith("ENUM") else c for c in columns)
+            sql = f"SELECT {key_columns}, {values} FROM gold.{table_name}"
+
+            with step("L3", history_table, release=str(release)) as record:
+                if not has_table(con, history_table):
+                    con.sql(
+                        f"""
+                        CREATE TABLE {history_table} AS
+                        SELECT {key_columns}, DATE '{release}' AS valid_from, CAST(NULL AS DATE) AS valid_to, false AS excluido, {", ".join(columns)}
+                        FROM ({sql})
+                        ORDER BY {key_columns}
+                    """
+                    )
+                    incluidos, alterados, excluidos = table_rows(con, history_table), 0, 0
+                else:
+                    # Versões atuais (valid_to NULL) comparadas com a release pelo hash das colunas; as excluídas não entram na comparação.
+                    on = " AND ".join(f"h.{k} = d.{k}" for k in keys)
+                    con.sql(
+                        f"""
+                        CREATE OR REPLACE TEMP TABLE delta_historico AS
+                        SELECT {key_columns}, o.hash IS NULL AS incluido, n.hash IS NULL AS excluido
+                        FROM
+                            (SELECT {key_columns}, hash(n) AS hash FROM ({sql}) n) n
+                            FULL JOIN (
+                                SELECT {key_columns}, hash(o) AS hash FROM (SELECT {key_columns}, {", ".join(columns)} FROM {history_table} WHERE valid_to IS NULL AND NOT excluido) o
+                            ) o USING ({key_columns})
+                        WHERE n.hash IS DISTINCT FROM o.hash
+                    """
+                    )
+                    con.sql(f"UPDATE {history_table} h SET valid_to = DATE '{release}' FROM delta_historico d WHERE h.valid_to IS NULL AND {on}")
+                    con.sql(
+                        f"""
+                        INSERT INTO {history_table}
+                        SELECT {", ".join(f"d.{k}" for k in keys)}, DATE '{release}', NULL, d.excluido, {", ".join(f"h.{c}" for c in columns)}
+                        FROM delta_historico d LEFT JOIN ({sql}) h ON {on}
+                        ORDER BY {", ".join(f"d.{k}" for k in keys)}
+                    """
+                    )
+                    incluidos, alterados, excluidos = con.sql(
+                        "SELECT count(*) FILTER (incluido), count(*) FILTER (NOT incluido AND NOT excluido), count(*) FILTER (excluido) FROM delta_historico"
+                    ).fetchone()
+                record.update(rows=table_rows(con, history_table), incluidos=incluidos, alterados=alterados, excluidos=excluidos)
+            print(f"    {history_table} ({release}: +{incluidos} ~{alterados} -{excluidos})")
+
+        con.sql(f"INSERT INTO release VALUES (DATE '{release}', current_timestamp)")
+        con.commit()
+        con.close()
+        replace_database(temp_db_file, history_db_file)
+    else:
+        print(f"    Release {release} already in the history.")
+        con.close()
+        remove_database(temp_db_file)
+
+
+def refine(incremental: bool = False, parquet: bool = False, passes: int = None, search_index: bool = False, history: bool = False, release: date = None):
+    # 'passes': passadas (faixas de cnpj_base) para 'empresa' e 'estabelecimento'; padrão do perfil de recursos (config.py).
+    passes = PROFILE["passes"] if passes is None else passes
+
     makedirs(OUTPUT_FOLDER, exist_ok=True)
     print("L3: Creating database...")
 
+    # Atualiza uma cópia do banco, que substitui o original ao final (ver manifest.py).
     db_file = join(OUTPUT_FOLDER, "rfb-cnpj.duckdb")
-    con = duckdb.connect(db_file)
+    temp_db_file = database_copy(db_file)
+    con = connect(temp_db_file)
     con.sql("SET preserve_insertion_order = false")
 
     input_db_file = abspath(join(INPUT_FOLDER, "rfb-cnpj.duckdb"))
     con.sql(f"ATTACH '{input_db_file}' AS input")
+    create_enum_types(con)
+    create_manifest_table(con)
 
     # Empresa
-    sql_empresa = r"""
+    sql_empresa = rf"""
         SELECT
             empresa.cnpj_base,
             empresa.razao_social,
             empresa.natureza_juridica,
             empresa.qualificacao_responsavel,
             NULLIF(TRY_CAST(replace(empresa.capital_social_str, ',', '.') AS NUMERIC), 0) AS capital_social,
-            empresa.porte_empresa,
+            {to_enum("empresa.porte_empresa", "tipo_porte_empresa")} AS porte_empresa,
             empresa.ente_federativo_responsavel,
             simples.opcao_simples = 'S' AS opcao_simples,
             CAST(try_strptime(simples.data_opcao_simples, '%Y%m%d') AS DATE) AS data_opcao_simples,
@@ -57,18 +696,26 @@ def main():
             LEFT JOIN input.simples
               ON simples.cnpj_base = empresa.cnpj_base
     """
-    create_table_from_sql(con, "empresa", sql_empresa)
+    # Impressões digitais anteriores: permitem aplicar às tabelas derivadas apenas o delta desta atualização.
+    previous_fingerprints = {"empresa": table_fingerprint(con, "empresa"), "estabelecimento": table_fingerprint(con, "estabelecimento")}
+    if incremental:
+        refresh_table_from_sql(con, "empresa", sql_empresa, ["cnpj_base"], passes)
+        save_input_hashes(con, "empresa", ["cnpj_base"])
+    else:
+        create_table_from_sql(con, "empresa", sql_empresa, passes)
+        drop_input_hashes(con, "empresa")
 
     # Estabelecimento
-    sql_estabelecimento = r"""
+    # Códigos numéricos (CNAE, país, CEP, DDD e telefones) como inteiros: valores inválidos ficam NULL.
+    sql_estabelecimento = rf"""
         WITH rt AS (
             -- Retorna o regime de tributacao do maior ano para cada cnpj.
             SELECT
-                cnpj, arg_max(tributacao, ano) AS regime_tributacao
+                cnpj_base, cnpj_ordem, cnpj_dv, arg_max(tributacao, ano) AS regime_tributacao
             FROM 
                 input.regime_tributacao
             GROUP BY 
-                cnpj
+                cnpj_base, cnpj_ordem, cnpj_dv
         )
         SELECT 
             estabelecimento.cnpj_base,
@@ -76,15 +723,16 @@ def main():
             estabelecimento.cnpj_dv,
             estabelecimento.matriz == 1 AS matriz,
             estabelecimento.nome_fantasia,
-            estabelecimento.situacao_cadastral,
+            {to_enum("estabelecimento.situacao_cadastral", "tipo_situacao_cadastral")} AS situacao_cadastral,
             CAST(try_strptime(estabelecimento.data_situacao_cadastral, '%Y%m%d') AS DATE) AS data_situacao_cadastral,
             estabelecimento.motivo_situacao_cadastral,
             estabelecimento.nome_cidade_exterior,
-            estabelecimento.pais,
+            TRY_CAST(estabelecimento.pais AS USMALLINT) AS pais,
             CAST(try_strptime(estabelecimento.data_inicio_atividades, '%Y%m%d') AS DATE) AS data_inicio_atividades,
-            data_inicio_atividades,
-            estabelecimento.cnae,
-            estabelecimento.cnae_secundario,
+            TRY_CAST(estabelecimento.cnae AS UINTEGER) AS cnae,
+            list_filter(
+                list_transform(string_split(estabelecimento.cnae_secundario, ','), c -> TRY_CAST(c AS UINTEGER)), c -> c IS NOT NULL
+            ) AS cnae_secundario,
             estabelecimento.tipo_logradouro,
             estabelecimento.logradouro,
             CASE
@@ -94,15 +742,15 @@ def main():
             END AS numero,
             estabelecimento.complemento,
             estabelecimento.bairro,
-            LPAD(NULLIF(estabelecimento.cep, '0'), 8, '0') AS cep,
-            estabelecimento.uf,
+            NULLIF(TRY_CAST(estabelecimento.cep AS UINTEGER), 0) AS cep,
+            {to_enum("NULLIF(estabelecimento.uf, '')", "tipo_uf")} AS uf,
             estabelecimento.municipio,
-            estabelecimento.ddd1,
-            estabelecimento.telefone1,
-            estabelecimento.ddd2,
-            estabelecimento.telefone2,
-            estabelecimento.ddd_fax,
-            estabelecimento.fax,
+            TRY_CAST(estabelecimento.ddd1 AS USMALLINT) AS ddd1,
+            CASE WHEN regexp_full_match(estabelecimento.telefone1, '[1-9][0-9]{{7,8}}') THEN CAST(estabelecimento.telefone1 AS UINTEGER) END AS telefone1,
+            TRY_CAST(estabelecimento.ddd2 AS USMALLINT) AS ddd2,
+            CASE WHEN regexp_full_match(estabelecimento.telefone2, '[1-9][0-9]{{7,8}}') THEN CAST(estabelecimento.telefone2 AS UINTEGER) END AS telefone2,
+            TRY_CAST(estabelecimento.ddd_fax AS USMALLINT) AS ddd_fax,
+            CASE WHEN regexp_full_match(estabelecimento.fax, '[1-9][0-9]{{7,8}}') THEN CAST(estabelecimento.fax AS UINTEGER) END AS fax,
             estabelecimento.correio_eletronico,
             estabelecimento.situacao_especial,
             CAST(try_strptime(estabelecimento.data_situacao_especial, '%Y%m%d') AS DATE) AS data_situacao_especial,
@@ -110,20 +758,189 @@ def main():
         FROM
             input.estabelecimento
             LEFT JOIN rt
-                   ON rt.cnpj = format('{:t.}/{:04d}-{:02d}', 100000000 + CAST(cnpj_base AS INTEGER), CAST(cnpj_ordem AS INTEGER), CAST(cnpj_dv AS INTEGER))[2:19]
+                   ON rt.cnpj_base = estabelecimento.cnpj_base
+                  AND rt.cnpj_ordem = estabelecimento.cnpj_ordem
+                  AND rt.cnpj_dv = estabelecimento.cnpj_dv
+    """
+    if incremental:
+        refresh_table_from_sql(con, "estabelecimento", sql_estabelecimento, ["cnpj_base", "cnpj_ordem", "cnpj_dv"], passes)
+        save_input_hashes(con, "estabelecimento", ["cnpj_base", "cnpj_ordem", "cnpj_dv"])
+    else:
+        create_table_from_sql(con, "estabelecimento", sql_estabelecimento, passes)
+        drop_input_hashes(con, "estabelecimento")
+
+    # CNAEs (primário e secundários) de cada estabelecimento, ordenados por cnae para consultas rápidas.
+    sql_estabelecimento_cnae = r"""
+        SELECT cnpj_base, cnpj_ordem, cnae, bool_or(primario) AS primario
+        FROM (
+            SELECT cnpj_base, cnpj_ordem, cnae, true AS primario
+            FROM estabelecimento
+            UNION ALL
+            SELECT cnpj_base, cnpj_ordem, unnest(cnae_secundario) AS cnae, false AS primario
+            FROM estabelecimento
+            WHERE cnae_secundario IS NOT NULL
+        )
+        WHERE cnae IS NOT NULL
+        GROUP BY cnpj_base, cnpj_ordem, cnae
+        ORDER BY cnae, cnpj_base, cnpj_ordem
     """
-    create_table_from_sql(con, "estabelecimento", sql_estabelecimento)
+    if incremental:
+        refresh_derived_table_from_sql(
+            con, "estabelecimento_cnae", sql_estabelecimento_cnae, ["cnpj_base", "cnpj_ordem"], {"estabelecimento": previous_fingerprints["estabelecimento"]}
+        )
+    else:
+        create_table_from_sql(con, "estabelecimento_cnae", sql_estabelecimento_cnae)
+
+    # Valores desconhecidos nas colunas ENUM (NULL no L3): registrados para que ENUM_TYPES seja atualizado, sem interromper o L3.
+    create_table_from_sql(con, "enum_desconhecido", unknown_enum_sql())
+    unknown = con.sql("SELECT count(*), sum(linhas) FROM enum_desconhecido").fetchone()
+    if unknown[0]:
+        print(f"      {unknown[0]} unknown ENUM values in {unknown[1]} rows, stored as NULL (see table 'enum_desconhecido' and ENUM_TYPES).")
 
+    # Tabelas auxiliares (pequenas): recriadas se a tabela do L2 mudou.
     create_table_from_sql(con, "cnae")
     create_table_from_sql(con, "motivo")
     create_table_from_sql(con, "municipio")
     create_table_from_sql(con, "natureza_juridica")
     create_table_from_sql(con, "pais")
+    create_table_from_sql(con, "qualificacao")
+
+    # Sócios: cada sócio distinto (tipo, CPF/CNPJ mascarado e nome) recebe um id inteiro ('socio_pessoa').
+    #   Listas de adjacência ordenadas, nos dois sentidos, para as consultas de rede (ver queries.rede_socios()):
+    #   'empresa_socios' (cnpj_base -> socio_ids) e 'socio_empresas' (socio_id -> cnpj_bases).
+    #   Recriadas (com os ids renumerados) se a tabela 'socio' do L2 mudou.
+    sql_socio_pessoa = r"""
+        SELECT
+            CAST(row_number() OVER (ORDER BY identificador_socio, cnpj_cpf_socio, nome_socio) AS UINTEGER) AS socio_id,
+            identificador_socio,
+            nome_socio,
+            cnpj_cpf_socio
+        FROM (SELECT DISTINCT identificador_socio, nome_socio, cnpj_cpf_socio FROM input.socio)
+        ORDER BY socio_id
+    """
+    sql_socio = r"""
+        SELECT
+            socio.cnpj_base,
+            socio_pessoa.socio_id,
+            socio.qualificacao_socio,
+            CAST(try_strptime(socio.data_entrada_sociedade, '%Y%m%d') AS DATE) AS data_entrada_sociedade,
+            TRY_CAST(socio.pais AS USMALLINT) AS pais,
+            NULLIF(socio.representante_legal, '***000000**') AS representante_legal,
+            socio.nome_representante,
+            NULLIF(socio.qualificacao_representante_legal, 0) AS qualificacao_representante_legal,
+            socio.faixa_etaria
+        FROM
+            input.socio
+            JOIN socio_pessoa
+              ON socio_pessoa.identificador_socio IS NOT DISTINCT FROM socio.identificador_socio
+             AND socio_pessoa.cnpj_cpf_socio IS NOT DISTINCT FROM socio.cnpj_cpf_socio
+             AND socio_pessoa.nome_socio IS NOT DISTINCT FROM socio.nome_socio
+        ORDER BY socio.cnpj_base, socio_pessoa.socio_id
+    """
+    sql_empresa_socios = r"""
+        SELECT cnpj_base, CAST(list_sort(list_distinct(list(socio_id))) AS UINTEGER[]) AS socio_ids
+        FROM socio
+        GROUP BY cnpj_base
+        ORDER BY cnpj_base
+    """
+    sql_socio_empresas = r"""
+        SELECT socio_id, CAST(list_sort(list_distinct(list(cnpj_base))) AS UINTEGER[]) AS cnpj_bases
+        FROM socio
+        GROUP BY socio_id
+        ORDER BY socio_id
+    """
+    create_table_from_sql(con, "socio_pessoa", sql_socio_pessoa)
+    create_table_from_sql(con, "socio", sql_socio)
+    create_table_from_sql(con, "empresa_socios", sql_empresa_socios)
+    create_table_from_sql(con, "socio_empresas", sql_socio_empresas)
+
+    # Tabelas derivadas de 'empresa' e 'estabelecimento': recriadas se alguma delas mudou (ver DEPENDENCIES). As tabelas de resumo
+    #   são agregações (uma alteração afeta contagens compartilhadas com outras chaves): sempre recalculadas por inteiro.
+
+    # Tabelas de resumo: contagem de estabelecimentos por CNAE, município, UF, situação e porte (ver queries.resumo()).
+    #   A mais detalhada de cada família é calculada a partir das tabelas do L3; as demais, a partir dela.
+    sql_resumo_cnae_municipio = r"""
+        SELECT ec.cnae, ec.primario, es.uf, es.municipio, es.situacao_cadastral, em.porte_empresa, CAST(count(*) AS UINTEGER) AS estabelecimentos
+        FROM
+            estabelecimento_cnae ec
+            JOIN estabelecimento es ON es.cnpj_base = ec.cnpj_base AND es.cnpj_ordem = ec.cnpj_ordem
+            LEFT JOIN empresa em ON em.cnpj_base = es.cnpj_base
+        GROUP BY ALL
+        ORDER BY ALL
+    """
+    sql_resumo_municipio = r"""
+        SELECT es.uf, es.municipio, es.situacao_cadastral, em.porte_empresa, CAST(count(*) AS UINTEGER) AS estabelecimentos
+        FROM
+            estabelecimento es
+            LEFT JOIN empresa em ON em.cnpj_base = es.cnpj_base
+        GROUP BY ALL
+        ORDER BY ALL
+    """
+    create_table_from_sql(con, "resumo_cnae_municipio", sql_resumo_cnae_municipio)
+    create_table_from_sql(con, "resumo_municipio", sql_resumo_municipio)
+    for table_name, dimensions in RESUMOS.items():
+        if table_name not in ("resumo_cnae_municipio", "resumo_municipio"):
+            source = "resumo_cnae_municipio" if "cnae" in dimensions else "resumo_municipio"
+            columns = ", ".join(dimensions)
+            sql = f"SELECT {columns}, CAST(sum(estabelecimentos) AS UINTEGER) AS estabelecimentos FROM {source} GROUP BY ALL ORDER BY ALL"
+            create_table_from_sql(con, table_name, sql)
+
+    # Índice de busca por nome (opcional): tokens normalizados da razão social e dos nomes fantasia de cada empresa,
+    #   ordenados por token, e a quantidade de empresas com cada token (para a relevância). Ver queries.search_nome().
+    #   Um índice existente é sempre mantido atualizado.
+    if search_index or has_table(con, "nome_token"):
+        sql_nome_token = rf"""
+            SELECT DISTINCT token, cnpj_base
+            FROM (
+                SELECT cnpj_base, unnest({NOME_TOKENS.format("razao_social")}) AS token
+                FROM empresa
+                UNION ALL
+                SELECT cnpj_base, unnest({NOME_TOKENS.format("nome_fantasia")}) AS token
+                FROM estabelecimento
+                WHERE nome_fantasia IS NOT NULL
+            )
+            WHERE length(token) >= {NOME_TOKEN_MIN_LENGTH}
+            ORDER BY token, cnpj_base
+        """
+        sql_nome_token_df = "SELECT token, CAST(count(*) AS UINTEGER) AS empresas FROM nome_token GROUP BY token ORDER BY token"
+
+        if incremental:
+            refresh_derived_table_from_sql(con, "nome_token", sql_nome_token, ["cnpj_base"], previous_fingerprints)
+        else:
+            create_table_from_sql(con, "nome_token", sql_nome_token)
+        create_table_from_sql(con, "nome_token_df", sql_nome_token_df)
 
     con.sql(f"DETACH input")
 
+    # Estatísticas por row group das tabelas do L3 (sempre recalculadas).
+    create_row_group_stats(con)
+
+    if parquet:
+        makedirs(PARQUET_FOLDER, exist_ok=True)
+        table_to_parquet(con, "empresa", ["faixa_cnpj_base"])
+        table_to_parquet(con, "estabelecimento", ["uf", "faixa_cnpj_base"])
+
+    con.close()
+    replace_database(temp_db_file, db_file)
+
+    if history:
+        update_history(db_file, join(OUTPUT_FOLDER, HISTORY_DB_FILE), release or release_date())
+
     print(f"L3: Database ready.")
 
 
+def main():
+    parser = ArgumentParser(description="L3: Consolida e refina informações em um novo banco DuckDB.")
+    parser.add_argument("--incremental", action="store_true", help="atualiza um banco existente aplicando apenas as linhas alteradas")
+    parser.add_argument("--parquet", action="store_true", help=f"exporta 'empresa' e 'estabelecimento' em Parquet particionado para '{PARQUET_FOLDER}'")
+    parser.add_argument("--passes", type=int, help="processa 'empresa' e 'estabelecimento' em N faixas de cnpj_base (reduz o pico de memória)")
+    parser.add_argument("--search-index", action="store_true", help="cria o índice de busca por nome (razão social e nome fantasia)")
+    parser.add_argument("--history", action="store_true", help=f"acrescenta as alterações desta release ao histórico ('{HISTORY_DB_FILE}')")
+    parser.add_argument("--release", type=date.fromisoformat, help="data da release (AAAA-MM-DD) no histórico; padrão: data dos arquivos .zip do L0")
+    args = parser.parse_args()
+
+    refine(args.incremental, args.parquet, args.passes, args.search_index, args.history, args.release)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,47 @@
+#
+# Exemplo de consulta em lote: dados dos estabelecimentos para um arquivo (.csv ou .parquet) de CNPJs.
+#
+
+INPUT_FOLDER = ".data/L3-gold"
+OUTPUT_FOLDER = ".data/queries"
+
+
+#
+# Functions
+#
+
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import basename, join, splitext
+
+from rfb_cnpj_etl.config import connect
+from rfb_cnpj_etl.exporter import export
+from rfb_cnpj_etl.queries import by_cnpj_file
+
+
+#
+# Main
+#
+
+
+def main():
+    parser = ArgumentParser(description="Dados dos estabelecimentos para um arquivo de CNPJs (completos ou apenas a base).")
+    parser.add_argument("input_file", help="arquivo .csv ou .parquet com os CNPJs")
+    parser.add_argument("--column", help="coluna com os CNPJs (padrão: a primeira)")
+    parser.add_argument("--output", help="arquivo de saída (.parquet, .csv, .arrow ou .xlsx)")
+    args = parser.parse_args()
+
+    makedirs(OUTPUT_FOLDER, exist_ok=True)
+    print("Querying database...")
+
+    db_file = join(INPUT_FOLDER, "rfb-cnpj.duckdb")
+    out_file = args.output or join(OUTPUT_FOLDER, f"Q3_{splitext(basename(args.input_file))[0]}.parquet")
+
+    con = connect(db_file, read_only=True)
+    row_count = export(by_cnpj_file(con, args.input_file, args.column), out_file)
+
+    print(f"  Done. {row_count} rows. Output file is '{out_file}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#
+# Exemplo de consulta: busca de estabelecimentos por razão social ou nome fantasia (requer L3 --search-index).
+#
+
+INPUT_FOLDER = ".data/L3-gold"
+OUTPUT_FOLDER = ".data/queries"
+
+
+#
+# Functions
+#
+
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import join
+
+from rfb_cnpj_etl.config import connect
+from rfb_cnpj_etl.exporter import export
+from rfb_cnpj_etl.queries import by_nome
+
+
+#
+# Main
+#
+
+
+def main():
+    parser = ArgumentParser(description="Busca estabelecimentos por razão social ou nome fantasia (sem acentos e sem diferenciar maiúsculas).")
+    parser.add_argument("nome", help="termos pesquisados (todos devem estar presentes; termos com 3+ letras também valem como prefixo)")
+    parser.add_argument("--limit", type=int, default=100, help="quantidade máxima de empresas")
+    parser.add_argument("--output", help="arquivo de saída (.parquet, .csv, .arrow ou .xlsx)")
+    args = parser.parse_args()
+
+    makedirs(OUTPUT_FOLDER, exist_ok=True)
+    print("Querying database...")
+
+    db_file = join(INPUT_FOLDER, "rfb-cnpj.duckdb")
+    out_file = args.output or join(OUTPUT_FOLDER, "Q4_by_nome.xlsx")
+
+    con = connect(db_file, read_only=True)
+    row_count = export(by_nome(con, args.nome, args.limit), out_file)
+
+    print(f"  Done. {row_count} rows. Output file is '{out_file}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#
+# Exemplo de consulta: empresas ligadas por sócios em comum (rede de sócios), até N saltos.
+#
+
+INPUT_FOLDER = ".data/L3-gold"
+OUTPUT_FOLDER = ".data/queries"
+
+
+#
+# Functions
+#
+
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import join
+
+from rfb_cnpj_etl.cnpj import cnpj_base
+from rfb_cnpj_etl.config import connect
+from rfb_cnpj_etl.exporter import export
+from rfb_cnpj_etl.queries import REDE_MAX_EMPRESAS, by_rede_socios
+
+
+#
+# Main
+#
+
+
+def main():
+    parser = ArgumentParser(description="Empresas ligadas às empresas informadas por sócios em comum (empresa -> sócio -> empresa).")
+    parser.add_argument("cnpj", nargs="+", help="CNPJs (14 dígitos, formatados ou não) ou bases (8 dígitos)")
+    parser.add_argument("--saltos", type=int, default=2, help="quantidade máxima de saltos (empresa -> sócio -> empresa)")
+    parser.add_argument("--max-empresas", type=int, default=REDE_MAX_EMPRESAS, help="quantidade máxima de empresas na rede")
+    parser.add_argument("--output", help="arquivo de saída (.parquet, .csv, .arrow ou .xlsx)")
+    args = parser.parse_args()
+
+    makedirs(OUTPUT_FOLDER, exist_ok=True)
+    print("Querying database...")
+
+    db_file = join(INPUT_FOLDER, "rfb-cnpj.duckdb")
+    out_file = args.output or join(OUTPUT_FOLDER, "Q5_rede_socios.xlsx")
+
+    cnpjs_base = [cnpj_base(cnpj) for cnpj in args.cnpj]
+
+    con = connect(db_file, read_only=True)
+    row_count = export(by_rede_socios(con, cnpjs_base, args.saltos, args.max_empresas), out_file)
+
+    print(f"  Done. {row_count} rows. Output file is '{out_file}'.")
+
+
+if __name__ == "__main__":
+    main()
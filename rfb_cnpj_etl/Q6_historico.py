@@ -0,0 +1,58 @@
+#
+# Exemplo de consulta ao histórico (L3 --history): dados de CNPJs numa data, ou alterações entre duas releases.
+#
+
+INPUT_FOLDER = ".data/L3-gold"
+OUTPUT_FOLDER = ".data/queries"
+
+
+#
+# Functions
+#
+
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import join
+
+from rfb_cnpj_etl.cnpj import cnpj_base
+from rfb_cnpj_etl.config import connect
+from rfb_cnpj_etl.exporter import export
+from rfb_cnpj_etl.queries import HISTORY_COLUMNS, alteracoes, historico_as_of
+
+
+#
+# Main
+#
+
+
+def main():
+    parser = ArgumentParser(description="Consultas ao histórico das releases da RFB.")
+    parser.add_argument("cnpj", nargs="*", help="CNPJs (14 dígitos, formatados ou não) ou bases (8 dígitos)")
+    parser.add_argument("--data", help="data (AAAA-MM-DD) da consulta; padrão: todas as versões")
+    parser.add_argument("--alteracoes", nargs=2, metavar=("DE", "ATE"), help="alterações nas releases posteriores a DE até ATE (AAAA-MM-DD)")
+    parser.add_argument("--tabela", default="estabelecimento", choices=list(HISTORY_COLUMNS), help="tabela das alterações")
+    parser.add_argument("--output", help="arquivo de saída (.parquet, .csv, .arrow ou .xlsx)")
+    args = parser.parse_args()
+    if not args.cnpj and not args.alteracoes:
+        parser.error("informe CNPJs ou --alteracoes")
+
+    makedirs(OUTPUT_FOLDER, exist_ok=True)
+    print("Querying database...")
+
+    db_file = join(INPUT_FOLDER, "rfb-cnpj-historico.duckdb")
+    con = connect(db_file, read_only=True)
+
+    if args.alteracoes:
+        out_file = args.output or join(OUTPUT_FOLDER, "Q6_alteracoes.parquet")
+        rel = alteracoes(con, *args.alteracoes, args.tabela)
+    else:
+        cnpjs_base = [cnpj_base(cnpj) for cnpj in args.cnpj]
+        out_file = args.output or join(OUTPUT_FOLDER, "Q6_historico.xlsx")
+        rel = historico_as_of(con, cnpjs_base, args.data)
+
+    row_count = export(rel, out_file)
+    print(f"  Done. {row_count} rows. Output file is '{out_file}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#
+# Consultas à base de CNPJ da RFB (ver api.py).
+#
+#   Os módulos (e o duckdb) são importados apenas no primeiro uso de cada nome: 'import rfb_cnpj_etl' não abre o banco.
+#
+
+# Nome -> módulo que o define.
+API = {
+    "by_cnae": "api",
+    "by_cnpj": "api",
+    "by_cnpj_file": "api",
+    "search_nome": "api",
+    "by_nome": "api",
+    "socios_by_cnpj": "api",
+    "rede_socios": "api",
+    "by_rede_socios": "api",
+    "resumo": "api",
+    "historico_as_of": "api",
+    "alteracoes": "api",
+    "connection": "api",
+    "set_database": "api",
+    "close": "api",
+    "export": "exporter",
+}
+
+__all__ = list(API)
+
+
+def __getattr__(name: str):
+    if name not in API:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from importlib import import_module
+
+    value = getattr(import_module(f"{__name__}.{API[name]}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,160 @@
+#
+# API para uso das consultas em outras aplicações Python (as mesmas consultas dos scripts Q* e do serviço HTTP).
+#
+#   Todas as funções usam uma única conexão somente leitura ao banco L3, aberta no primeiro uso e mantida pelo processo
+#   (cada thread recebe seu próprio cursor). A conexão é reaberta quando o arquivo do banco é substituído.
+#
+#   As consultas retornam relações do DuckDB: nada é lido até que o resultado seja solicitado. O resultado pode ser
+#   filtrado antes disso, e os filtros são aplicados na própria consulta:
+#
+#     from rfb_cnpj_etl import by_cnae
+#
+#     rel = by_cnae(4711302).filter("uf = 'SP'").project("cnpj, razao_social")
+#     rel.arrow()            # pyarrow.Table
+#     rel.pl()               # polars.DataFrame
+#     rel.record_batch()     # pyarrow.RecordBatchReader (em lotes, memória constante)
+#
+#   O banco padrão é '.data/L3-gold/rfb-cnpj.duckdb' (relativo à pasta atual); use RFB_DB_FILE ou set_database().
+#   As consultas ao histórico (historico_as_of, alteracoes) usam o banco do histórico na mesma pasta (L3 --history).
+#
+
+DB_FILE = ".data/L3-gold/rfb-cnpj.duckdb"
+HISTORY_DB_FILE = "rfb-cnpj-historico.duckdb"
+
+
+#
+# Functions
+#
+
+from contextlib import contextmanager
+from datetime import date
+from os import environ, stat
+from os.path import dirname, join
+from threading import Condition, local
+
+import duckdb
+
+from rfb_cnpj_etl import queries
+from rfb_cnpj_etl.cnpj import register_macros
+from rfb_cnpj_etl.config import connect
+
+
+class SharedConnection:
+    # Conexão somente leitura compartilhada pelo processo; um cursor por thread (todos compartilham o cache de buffers).
+    #   O L3 grava o banco numa cópia e substitui o arquivo ao final: a conexão é reaberta quando o arquivo muda.
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.condition = Condition()
+        self.threads = local()
+        self.con = None
+        self.current_version = None
+        self.generation = 0
+        self.active = 0
+
+    def version(self):
+        st = stat(self.db_file)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def cursor(self):
+        if self.con is None or self.version() != self.current_version:
+            with self.condition:
+                # Aguarda as consultas em andamento (lease). A conexão anterior precisa ser fechada antes de abrir a nova:
+                #   o DuckDB reaproveita o banco já aberto no processo para o mesmo caminho. Relações ainda não lidas da
+                #   versão anterior (fora de um lease) são perdidas.
+                self.condition.wait_for(lambda: self.active == 0)
+                if self.con is None or self.version() != self.current_version:
+                    if self.con is not None:
+                        self.con.close()
+                    self.current_version = self.version()
+                    self.con = connect(self.db_file, read_only=True)
+                    self.generation += 1
+
+        if getattr(self.threads, "generation", None) != self.generation:
+            self.threads.cursor = register_macros(self.con.cursor())
+            self.threads.generation = self.generation
+        return self.threads.cursor
+
+    @contextmanager
+    def lease(self):
+        # Cursor para uma consulta completa: a conexão não é reaberta enquanto a consulta estiver em andamento.
+        with self.condition:
+            cursor = self.cursor()
+            self.active += 1
+        try:
+            yield cursor
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+
+
+shared = SharedConnection(environ.get("RFB_DB_FILE") or DB_FILE)
+shared_history = SharedConnection(join(dirname(shared.db_file), HISTORY_DB_FILE))
+
+
+def set_database(db_file: str):
+    # Usa outro arquivo de banco L3 (e o histórico da mesma pasta); fecha as conexões atuais.
+    global shared, shared_history
+    close()
+    shared = SharedConnection(db_file)
+    shared_history = SharedConnection(join(dirname(db_file), HISTORY_DB_FILE))
+
+
+def connection() -> duckdb.DuckDBPyConnection:
+    # Cursor da conexão compartilhada para a thread atual (para consultas SQL próprias).
+    return shared.cursor()
+
+
+def close():
+    shared.close()
+    shared_history.close()
+
+
+def by_cnae(cnae: int | str):
+    return queries.by_cnae(connection(), cnae)
+
+
+def by_cnpj(cnpjs_base: list[int]):
+    return queries.by_cnpj(connection(), cnpjs_base)
+
+
+def by_cnpj_file(input_file: str, column: str = None):
+    return queries.by_cnpj_file(connection(), input_file, column)
+
+
+def search_nome(nome: str, limit: int = 100):
+    return queries.search_nome(connection(), nome, limit)
+
+
+def by_nome(nome: str, limit: int = 100):
+    return queries.by_nome(connection(), nome, limit)
+
+
+def socios_by_cnpj(cnpjs_base: list[int]):
+    return queries.socios_by_cnpj(connection(), cnpjs_base)
+
+
+def rede_socios(cnpjs_base: list[int], saltos: int = 2, max_empresas: int = queries.REDE_MAX_EMPRESAS):
+    return queries.rede_socios(connection(), cnpjs_base, saltos, max_empresas)
+
+
+def by_rede_socios(cnpjs_base: list[int], saltos: int = 2, max_empresas: int = queries.REDE_MAX_EMPRESAS):
+    return queries.by_rede_socios(connection(), cnpjs_base, saltos, max_empresas)
+
+
+def resumo(group_by: list[str], **filters):
+    return queries.resumo(connection(), group_by, **filters)
+
+
+def historico_as_of(cnpjs_base: list[int], data: date | str = None):
+    return queries.historico_as_of(shared_history.cursor(), cnpjs_base, data)
+
+
+def alteracoes(de: date | str, ate: date | str, tabela: str = "estabelecimento"):
+    return queries.alteracoes(shared_history.cursor(), de, ate, tabela)
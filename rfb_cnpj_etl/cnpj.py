@@ -0,0 +1,82 @@
+#
+# Funções (macros do DuckDB) para CNPJs: chave numérica, formatação, leitura de texto e dígitos verificadores.
+#
+#   Registradas em todas as conexões (config.connect()). São expressões sobre inteiros, avaliadas em vetores pelo DuckDB.
+#   Chave numérica: os 14 dígitos do CNPJ como inteiro (cnpj_base * 10^6 + cnpj_ordem * 100 + cnpj_dv).
+#
+#     cnpj_key(cnpj_base, cnpj_ordem, cnpj_dv)        chave numérica
+#     cnpj_format(cnpj_base, cnpj_ordem, cnpj_dv)     '00.000.000/0000-00'
+#     cnpj_format_key(chave)                          '00.000.000/0000-00'
+#     cnpj_parse(texto)                               chave numérica de um CNPJ em texto (formatado ou não); NULL se inválido
+#     cnpj_check_digits(cnpj_base, cnpj_ordem)        dígitos verificadores (0 a 99)
+#     cnpj_is_valid(cnpj_base, cnpj_ordem, cnpj_dv)   dígitos verificadores conferem
+#
+#   Em Python, para os argumentos das consultas (linha de comando e serviço HTTP):
+#
+#     cnpj_digits(texto)                              dígitos de um CNPJ (14, com zeros à esquerda) ou base (até 8)
+#     cnpj_base(texto)                                cnpj_base de um CNPJ completo ou base, formatados ou não
+#
+
+# Pesos dos dígitos verificadores (módulo 11), separados entre cnpj_base (8 dígitos) e cnpj_ordem (4 dígitos).
+#   O segundo dígito também usa o primeiro (peso 2).
+DV1_WEIGHTS = ([5, 4, 3, 2, 9, 8, 7, 6], [5, 4, 3, 2])
+DV2_WEIGHTS = ([6, 5, 4, 3, 2, 9, 8, 7], [6, 5, 4, 3])
+
+
+#
+# Functions
+#
+
+import duckdb
+import re
+
+
+def weighted_sum(number: str, weights: list[int]):
+    # Soma dos dígitos de 'number' (inteiro com len(weights) dígitos) multiplicados pelos pesos.
+    n = len(weights)
+    return " + ".join(f"{w} * ({number} // {10 ** (n - 1 - i)} % 10)" for i, w in enumerate(weights))
+
+
+# Macros: nome -> (parâmetros, expressão). Cada macro pode usar as anteriores.
+MACROS = {
+    "cnpj_key": (["b", "o", "d"], "CAST(b AS UBIGINT) * 1000000 + CAST(o AS UBIGINT) * 100 + d"),
+    # A conversão para texto (com um dígito extra à esquerda, para manter os zeros) é feita uma única vez por linha.
+    "cnpj_format_key": (
+        ["k"],
+        "concat(CAST(100000000000000 + k AS VARCHAR)[2:3], '.', CAST(100000000000000 + k AS VARCHAR)[4:6], '.', CAST(100000000000000 + k AS VARCHAR)[7:9], "
+        "'/', CAST(100000000000000 + k AS VARCHAR)[10:13], '-', CAST(100000000000000 + k AS VARCHAR)[14:15])",
+    ),
+    "cnpj_format": (["b", "o", "d"], "cnpj_format_key(cnpj_key(b, o, d))"),
+    "cnpj_parse": (
+        ["t"],
+        "CASE WHEN length(regexp_replace(t, '[^0-9]', '', 'g')) BETWEEN 1 AND 14 THEN CAST(regexp_replace(t, '[^0-9]', '', 'g') AS UBIGINT) END",
+    ),
+    # Dígito verificador a partir da soma ponderada: resto 0 ou 1 -> 0; senão, 11 - resto.
+    "cnpj_dv_digit": (["s"], "(11 - s % 11) % 11 % 10"),
+    # Os dígitos são extraídos de cnpj_base e cnpj_ordem separadamente (divisões em 32 bits, e não sobre a chave de 64 bits).
+    "cnpj_dv1": (["b", "o"], f"cnpj_dv_digit({weighted_sum('b', DV1_WEIGHTS[0])} + {weighted_sum('o', DV1_WEIGHTS[1])})"),
+    "cnpj_check_digits": (
+        ["b", "o"],
+        f"CAST(cnpj_dv1(b, o) * 10 + cnpj_dv_digit({weighted_sum('b', DV2_WEIGHTS[0])} + {weighted_sum('o', DV2_WEIGHTS[1])} + 2 * cnpj_dv1(b, o)) AS UTINYINT)",
+    ),
+    "cnpj_is_valid": (["b", "o", "d"], "cnpj_check_digits(b, o) = d"),
+}
+
+
+def register_macros(con: duckdb.DuckDBPyConnection):
+    # Macros temporárias: existem apenas nesta conexão (cada cursor precisa registrá-las), inclusive em bancos somente leitura.
+    for name, (params, expression) in MACROS.items():
+        con.sql(f"CREATE OR REPLACE TEMP MACRO {name}({', '.join(params)}) AS {expression}")
+    return con
+
+
+def cnpj_digits(cnpj: str):
+    # Até 8 dígitos: base; mais de 8: CNPJ completo (com os zeros à esquerda omitidos).
+    digits = re.sub(r"[^0-9]", "", cnpj)
+    if not digits or len(digits) > 14:
+        raise ValueError(f"Invalid CNPJ '{cnpj}'.")
+    return digits if len(digits) <= 8 else digits.zfill(14)
+
+
+def cnpj_base(cnpj: str):
+    return int(cnpj_digits(cnpj)[:8])
@@ -0,0 +1,65 @@
+#
+# Perfil de recursos do DuckDB, aplicado a todas as conexões (etapas L2 e L3, pipeline, consultas e serviço).
+#
+#   O perfil é escolhido pela variável de ambiente RFB_PROFILE (padrão: 'default'). Cada valor pode ser sobrescrito
+#   por RFB_MEMORY_LIMIT, RFB_THREADS, RFB_TEMP_DIRECTORY, RFB_MAX_TEMP_DIRECTORY_SIZE e RFB_PASSES.
+#
+#   'passes': quantidade de passadas (faixas de cnpj_base) em que o L3 processa as tabelas grandes.
+#
+#   Todas as conexões também recebem as funções de CNPJ (cnpj.py).
+#
+
+PROFILES = {
+    # Configuração padrão do DuckDB (80% da RAM, todos os núcleos): máquinas com 32 GB.
+    "default": {"passes": 1},
+    "16gb": {"memory_limit": "10GB", "threads": 8, "temp_directory": ".data/tmp", "passes": 4},
+    "8gb": {"memory_limit": "5GB", "threads": 4, "temp_directory": ".data/tmp", "max_temp_directory_size": "100GB", "passes": 10},
+}
+
+# Configurações do DuckDB (https://duckdb.org/docs/configuration/overview).
+SETTINGS = ["memory_limit", "threads", "temp_directory", "max_temp_directory_size"]
+
+
+#
+# Functions
+#
+
+from os import environ
+
+import duckdb
+
+from rfb_cnpj_etl.cnpj import register_macros
+
+
+def load_profile(name: str = None):
+    name = name or environ.get("RFB_PROFILE") or "default"
+    if name not in PROFILES:
+        raise ValueError(f"Unknown resource profile '{name}' (use {', '.join(PROFILES)}).")
+
+    profile = dict(PROFILES[name])
+    for key in SETTINGS + ["passes"]:
+        value = environ.get(f"RFB_{key.upper()}")
+        if value:
+            profile[key] = value
+
+    profile["passes"] = int(profile.get("passes", 1))
+    return profile
+
+
+PROFILE = load_profile()
+
+
+def apply_profile(con: duckdb.DuckDBPyConnection, profile: dict = None):
+    profile = PROFILE if profile is None else profile
+
+    # Configurações inexistentes na versão instalada do DuckDB são ignoradas (ex.: max_temp_directory_size, DuckDB >= 1.0).
+    supported = {r[0] for r in con.sql("SELECT name FROM duckdb_settings()").fetchall()}
+    for key in SETTINGS:
+        if key in profile and key in supported:
+            value = str(profile[key]).replace("'", "''")
+            con.sql(f"SET {key} = '{value}'")
+    return con
+
+
+def connect(db_file: str, read_only: bool = False, profile: dict = None):
+    return register_macros(apply_profile(duckdb.connect(db_file, read_only=read_only), profile))
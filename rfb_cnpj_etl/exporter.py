@@ -0,0 +1,101 @@
+#
+# Exportação dos resultados das consultas em lotes (memória constante, independente do tamanho do resultado).
+#
+#   Formatos (pela extensão do arquivo): .parquet, .csv, .arrow (Arrow IPC) e .xlsx.
+#
+
+BATCH_SIZE = 100_000
+
+# Limite de linhas por planilha do Excel (já descontado o cabeçalho).
+XLSX_MAX_ROWS = 1_048_576 - 1
+
+
+#
+# Functions
+#
+
+from os.path import splitext
+
+import duckdb
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import xlsxwriter
+
+
+def to_reader(data, batch_size: int = BATCH_SIZE) -> pa.RecordBatchReader:
+    if isinstance(data, duckdb.DuckDBPyRelation):
+        return data.record_batch(batch_size)
+    return data
+
+
+def write_parquet(reader: pa.RecordBatchReader, out_file: str):
+    with pq.ParquetWriter(out_file, reader.schema, compression="zstd") as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            yield batch.num_rows
+
+
+def write_csv(reader: pa.RecordBatchReader, out_file: str):
+    with pyarrow.csv.CSVWriter(out_file, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            yield batch.num_rows
+
+
+def write_arrow(reader: pa.RecordBatchReader, out_file: str):
+    with pa.ipc.new_file(out_file, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            yield batch.num_rows
+
+
+def write_xlsx(reader: pa.RecordBatchReader, out_file: str):
+    # Modo 'constant_memory': cada linha é gravada em disco assim que a próxima é iniciada.
+    #   Ao atingir o limite de linhas do Excel, continua numa nova planilha.
+    names = reader.schema.names
+    with xlsxwriter.Workbook(out_file, {"constant_memory": True, "default_date_format": "dd/mm/yyyy"}) as workbook:
+        header_format = workbook.add_format({"bold": True})
+        worksheet, row = None, XLSX_MAX_ROWS
+
+        def close_worksheet():
+            if worksheet is not None:
+                worksheet.autofilter(0, 0, row, len(names) - 1)
+
+        for batch in reader:
+            columns = [c.to_pylist() for c in batch.columns]
+            for values in zip(*columns):
+                if row == XLSX_MAX_ROWS:
+                    close_worksheet()
+                    worksheet, row = workbook.add_worksheet(), 0
+                    worksheet.freeze_panes(1, 0)
+                    worksheet.set_column(0, len(names) - 1, 18)
+                    worksheet.write_row(0, 0, names, header_format)
+
+                row += 1
+                worksheet.write_row(row, 0, values)
+
+            yield batch.num_rows
+
+        if worksheet is None:
+            worksheet, row = workbook.add_worksheet(), 0
+            worksheet.write_row(0, 0, names, header_format)
+        close_worksheet()
+
+
+WRITERS = {
+    ".parquet": write_parquet,
+    ".csv": write_csv,
+    ".arrow": write_arrow,
+    ".xlsx": write_xlsx,
+}
+
+
+def export(data, out_file: str, batch_size: int = BATCH_SIZE):
+    # Grava o resultado de uma consulta (relação DuckDB ou RecordBatchReader) em 'out_file'. Retorna o número de linhas.
+    extension = splitext(out_file)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Unsupported output format '{extension}' (use {', '.join(WRITERS)}).")
+
+    return sum(WRITERS[extension](to_reader(data, batch_size), out_file))
@@ -0,0 +1,143 @@
+#
+# Manifesto das etapas: impressão digital (hash) das entradas de cada saída. Uma nova execução refaz apenas as saídas
+#   cujas entradas (ou a consulta que as gera) mudaram; as demais são mantidas.
+#
+#   L0: '.data/L0-zip/manifest.json' (validadores HTTP de cada .zip, ver L0_download.py).
+#   L1: um arquivo JSON por .csv, em '.data/L1-csv/.manifest/': CRC-32 e tamanho do membro de origem (lidos do índice do .zip,
+#       sem descompactar) e o tamanho do .csv gravado.
+#   L2 e L3: tabela '_manifest' em cada banco (tabela -> impressão digital e entradas), gravada na mesma transação que a tabela.
+#
+#   As saídas são gravadas de forma atômica (arquivo temporário + rename; tabelas numa transação): uma execução interrompida
+#   nunca deixa uma saída incompleta com o nome final.
+#
+#   Os bancos do L3 são atualizados numa cópia que substitui o arquivo original ao final (database_copy / replace_database):
+#   conexões somente leitura abertas no banco (serviço HTTP, API) não bloqueiam o L3 e passam a ler a nova versão ao reabrir.
+#
+
+MANIFEST_FOLDER = ".manifest"
+MANIFEST_TABLE = "_manifest"
+
+
+#
+# Functions
+#
+
+from contextlib import contextmanager
+from hashlib import sha256
+from os import makedirs, remove, replace
+from os.path import basename, dirname, isfile, join
+from shutil import copyfile
+
+import duckdb
+import json
+
+
+def fingerprint(*values):
+    # Hash de valores serializáveis em JSON (consultas, schemas e impressões digitais das entradas).
+    return sha256(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+
+def temp_file_name(target_file: str):
+    # Arquivo oculto na mesma pasta (o rename é atômico; os padrões dos glob, ex. '*.csv', não encontram arquivos ocultos).
+    return join(dirname(target_file), f".{basename(target_file)}.tmp")
+
+
+@contextmanager
+def atomic_write(target_file: str, mode: str = "wb", **kwargs):
+    temp_file = temp_file_name(target_file)
+    try:
+        with open(temp_file, mode, **kwargs) as f:
+            yield f
+        replace(temp_file, target_file)
+    finally:
+        if isfile(temp_file):
+            remove(temp_file)
+
+
+def wal_file_name(db_file: str):
+    return f"{db_file}.wal"
+
+
+def remove_database(db_file: str):
+    for f in (db_file, wal_file_name(db_file)):
+        if isfile(f):
+            remove(f)
+
+
+def database_copy(db_file: str):
+    # Cópia do banco (se existir) num arquivo temporário da mesma pasta; restos de uma execução interrompida são descartados.
+    temp_file = temp_file_name(db_file)
+    remove_database(temp_file)
+    for source, target in ((db_file, temp_file), (wal_file_name(db_file), wal_file_name(temp_file))):
+        if isfile(source):
+            copyfile(source, target)
+    return temp_file
+
+
+def replace_database(temp_file: str, db_file: str):
+    # A conexão com 'temp_file' precisa estar fechada (o DuckDB grava o WAL no banco ao fechar).
+    if isfile(wal_file_name(temp_file)):
+        replace(wal_file_name(temp_file), wal_file_name(db_file))
+    elif isfile(wal_file_name(db_file)):
+        remove(wal_file_name(db_file))
+    replace(temp_file, db_file)
+
+
+#
+# L1: arquivos
+#
+
+
+def file_manifest_name(target_file: str):
+    return join(dirname(target_file), MANIFEST_FOLDER, f"{basename(target_file)}.json")
+
+
+def read_file_manifest(target_file: str):
+    manifest_file = file_manifest_name(target_file)
+    if not isfile(manifest_file):
+        return None
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_file_manifest(target_file: str, entry: dict):
+    manifest_file = file_manifest_name(target_file)
+    makedirs(dirname(manifest_file), exist_ok=True)
+    with atomic_write(manifest_file, "w", encoding="utf-8") as f:
+        json.dump(entry, f, indent=2, sort_keys=True)
+
+
+#
+# L2 e L3: tabelas
+#
+
+
+def create_manifest_table(con: duckdb.DuckDBPyConnection):
+    con.sql(f"CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (tabela VARCHAR, fingerprint VARCHAR, entradas JSON, atualizado_em TIMESTAMP)")
+
+
+def table_fingerprint(con: duckdb.DuckDBPyConnection, table_name: str, database: str = None):
+    # Impressão digital registrada para a tabela ('database': banco anexado, ex. 'input'); None se não houver.
+    database = database or con.sql("SELECT current_database()").fetchone()[0]
+    exists = con.sql("SELECT 1 FROM duckdb_tables WHERE database_name = ? AND schema_name = 'main' AND table_name = ?", params=[database, MANIFEST_TABLE])
+    if exists.fetchone() is None:
+        return None
+    r = con.sql(f'SELECT fingerprint FROM "{database}".{MANIFEST_TABLE} WHERE tabela = ?', params=[table_name]).fetchone()
+    return r[0] if r else None
+
+
+def table_inputs(con: duckdb.DuckDBPyConnection, table_name: str):
+    # Entradas registradas com a impressão digital da tabela (ex. impressões digitais das dependências); None se não houver.
+    r = con.sql(f"SELECT entradas FROM {MANIFEST_TABLE} WHERE tabela = ?", params=[table_name]).fetchone()
+    return json.loads(r[0]) if r else None
+
+
+def set_table_fingerprint(con: duckdb.DuckDBPyConnection, table_name: str, digest: str, inputs):
+    # Deve ser executado na mesma transação que cria a tabela.
+    con.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE tabela = ?", [table_name])
+    con.execute(f"INSERT INTO {MANIFEST_TABLE} VALUES (?, ?, ?, current_timestamp)", [table_name, digest, json.dumps(inputs, sort_keys=True, default=str)])
+
+
+def remove_table_fingerprint(con: duckdb.DuckDBPyConnection, table_name: str):
+    # Deve ser executado na mesma transação que exclui a tabela.
+    con.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE tabela = ?", [table_name])
@@ -0,0 +1,135 @@
+#
+# Instrumentação das etapas: tempo, linhas, bytes, pico de memória e perfil (JSON) das consultas do DuckDB.
+#
+#   Cada passo acrescenta uma linha JSON ao arquivo '.data/reports/report.jsonl'.
+#   Passos de uma mesma execução compartilham o mesmo 'run' (variável de ambiente RFB_RUN_ID, se definida).
+#
+
+REPORT_FOLDER = ".data/reports"
+REPORT_FILE = "report.jsonl"
+
+
+#
+# Functions
+#
+
+from contextlib import contextmanager
+from datetime import datetime
+from os import close, environ, getpid, makedirs, remove, walk
+from os.path import getsize, isfile, join
+from tempfile import mkstemp
+from time import perf_counter
+
+import duckdb
+import json
+import sys
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+RUN_ID = environ.get("RFB_RUN_ID") or datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def reset_peak_rss():
+    # Linux: zera o pico de memória do processo (VmHWM), permitindo medir o pico de cada passo.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    # Pico de memória (bytes) do processo: desde o último reset_peak_rss(), ou desde o início do processo.
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if resource is not None:
+        # ru_maxrss: KB no Linux, bytes no macOS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return None
+
+
+def file_size(*files: str):
+    return sum(getsize(f) for f in files if isfile(f))
+
+
+def folder_size(path: str):
+    if isfile(path):
+        return getsize(path)
+    return sum(getsize(join(root, f)) for root, _, files in walk(path) for f in files)
+
+
+def write_record(record: dict):
+    makedirs(REPORT_FOLDER, exist_ok=True)
+    with open(join(REPORT_FOLDER, REPORT_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+@contextmanager
+def step(stage: str, name: str, concurrent: bool = False, **fields):
+    # Mede um passo de uma etapa. O chamador pode preencher 'rows', 'input_bytes', 'output_bytes' etc. no dicionário retornado.
+    #   Em passos executados concorrentemente no mesmo processo (concurrent=True) o pico de memória não é zerado.
+    record = {"run": RUN_ID, "stage": stage, "step": name, "pid": getpid(), "started": datetime.now().isoformat(timespec="seconds"), **fields}
+    if not concurrent:
+        reset_peak_rss()
+
+    started = perf_counter()
+    try:
+        yield record
+        record["status"] = "ok"
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = repr(e)
+        raise
+    finally:
+        record["seconds"] = round(perf_counter() - started, 3)
+        record["peak_rss"] = peak_rss()
+        # Passos pulados ('skipped'): 'rows' é o tamanho da saída existente, não o que foi processado; sem vazão.
+        if record.get("rows") and record["seconds"] and not record.get("skipped"):
+            record["rows_per_second"] = round(record["rows"] / record["seconds"])
+        if record.get("input_bytes") and record["seconds"] and not record.get("skipped"):
+            record["input_bytes_per_second"] = round(record["input_bytes"] / record["seconds"])
+        write_record(record)
+
+
+@contextmanager
+def profiling(con: duckdb.DuckDBPyConnection, record: dict):
+    # Habilita o profiling do DuckDB e anexa o perfil (JSON) da última consulta executada no bloco ao registro do passo.
+    #   (as consultas devem ser executadas no próprio bloco do chamador, para que as variáveis Python continuem visíveis ao DuckDB)
+    handle, profile_file = mkstemp(suffix=".json")
+    close(handle)
+    try:
+        con.sql("PRAGMA enable_profiling = 'json'")
+        con.sql(f"PRAGMA profiling_output = '{profile_file}'")
+        try:
+            yield
+        finally:
+            con.sql("PRAGMA disable_profiling")
+
+        with open(profile_file, "r", encoding="utf-8") as f:
+            content = f.read()
+        if content:
+            record.setdefault("profiles", []).append(json.loads(content))
+    finally:
+        remove(profile_file)
+
+
+def database_size(con: duckdb.DuckDBPyConnection):
+    # Tamanho do arquivo do banco atual (incluindo o WAL).
+    path = con.sql("SELECT path FROM duckdb_databases() WHERE database_name = current_database()").fetchone()[0]
+    return file_size(path, f"{path}.wal") if path else 0
+
+
+def table_rows(con: duckdb.DuckDBPyConnection, table_name: str):
+    return con.sql(f"SELECT count(*) FROM {table_name}").fetchone()[0]
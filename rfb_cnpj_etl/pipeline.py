@@ -0,0 +1,176 @@
+#
+# Pipeline: executa as etapas L0 -> L3 como um grafo de dependências por arquivo.
+#
+#   Cada .zip é extraído assim que termina de baixar e cada .csv é carregado assim que é extraído
+#   (ex.: 'Estabelecimentos0.zip' é extraído e carregado enquanto 'Estabelecimentos1..9' ainda estão baixando).
+#   Rede, CPU e disco trabalham ao mesmo tempo; a etapa L3 começa quando todas as tabelas do L2 estão prontas.
+#
+
+#
+# Functions
+#
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fnmatch import fnmatch
+from os import cpu_count, makedirs
+from os.path import basename, join
+from zipfile import ZipFile
+
+import asyncio
+import duckdb
+
+from tqdm import tqdm
+
+from rfb_cnpj_etl import L0_download, L1_extract, L2_load, L3_refine
+from rfb_cnpj_etl.cnpj import register_macros
+from rfb_cnpj_etl.config import connect
+from rfb_cnpj_etl.manifest import create_manifest_table, set_table_fingerprint
+from rfb_cnpj_etl.metrics import file_size, step
+
+
+# Concorrência por recurso: downloads (rede), extrações (processos) e cargas no DuckDB (threads).
+DOWNLOAD_WORKERS = 8
+EXTRACT_WORKERS = cpu_count()
+LOAD_WORKERS = 2
+
+
+def l2_tables():
+    # (tabela, padrão dos arquivos, schema) de todas as tabelas do L2. O schema é None para o regime de tributação.
+    return [*L2_load.TABLES, (*L2_load.REGIME_TRIBUTACAO_TABLE, None)]
+
+
+def table_for_member(member_name: str):
+    # Retorna (tabela, schema) do L2 para um membro dos .zip.
+    for table_name, glob_pattern, schema in l2_tables():
+        if fnmatch(member_name, glob_pattern):
+            return table_name, schema
+
+    return None, None
+
+
+def staging_table(table_name: str):
+    return f"{table_name}_parcial"
+
+
+def create_staging_table(con: duckdb.DuckDBPyConnection, table_name: str, schema):
+    # Tabela parcial: recebe os arquivos à medida que são extraídos e só é renomeada quando todos foram carregados.
+    #   Uma execução interrompida deixa apenas a tabela parcial, que é recriada na próxima execução.
+    staging = staging_table(table_name)
+    con.sql(f"DROP TABLE IF EXISTS {staging}")
+    if schema is None:
+        con.sql(L2_load.REGIME_TRIBUTACAO_DDL.format(table_name=staging))
+    else:
+        columns = ", ".join(f"{n} {t}" for n, t in schema.items())
+        row_hash = ", row_hash UBIGINT" if table_name in L2_load.ROW_HASH_TABLES else ""
+        con.sql(f"CREATE TABLE {staging} ({columns}{row_hash})")
+
+
+def load_file(con: duckdb.DuckDBPyConnection, table_name: str, schema, csv_file: str):
+    # Executado numa thread, com um cursor próprio: arquivos de tabelas diferentes (ou da mesma tabela) são carregados em paralelo.
+    staging = staging_table(table_name)
+    with register_macros(con.cursor()) as cursor:
+        with step("L2", f"{table_name}/{basename(csv_file)}", concurrent=True, input_bytes=file_size(csv_file)) as record:
+            if schema is None:
+                csv = L2_load.read_regime_tributacao_csv(cursor, [csv_file], L2_load.has_regime_tributacao_header(csv_file))
+                record["rows"] = cursor.execute(f"INSERT INTO {staging} {L2_load.REGIME_TRIBUTACAO_SELECT}").fetchone()[0]
+            else:
+                csv = L2_load.read_csv(cursor, csv_file, schema)
+                record["rows"] = cursor.execute(f"INSERT INTO {staging} {L2_load.table_select(table_name)}").fetchone()[0]
+
+
+async def run_pipeline_async(root_url: str, download_workers: int, extract_workers: int, load_workers: int):
+    for folder in (L0_download.OUTPUT_FOLDER, L1_extract.OUTPUT_FOLDER, L2_load.OUTPUT_FOLDER):
+        makedirs(folder, exist_ok=True)
+
+    con = connect(join(L2_load.OUTPUT_FOLDER, "rfb-cnpj.duckdb"))
+    con.sql("SET preserve_insertion_order = false")
+    create_manifest_table(con)
+
+    # Tabelas já carregadas a partir dos .zip presentes no início da execução são mantidas (como no L2, pela impressão digital).
+    pending = {
+        table_name: schema
+        for table_name, glob_pattern, schema in l2_tables()
+        if not L2_load.is_loaded(con, table_name, L2_load.load_fingerprint(schema, L2_load.zip_members_inputs(glob_pattern), L2_load.table_select(table_name)))
+    }
+    loaded_files = {table_name: [] for table_name in pending}
+    for table_name, schema in pending.items():
+        create_staging_table(con, table_name, schema)
+
+    loop = asyncio.get_running_loop()
+    downloads = asyncio.Semaphore(download_workers)
+    manifest = L0_download.load_manifest(L0_download.OUTPUT_FOLDER)
+
+    with ProcessPoolExecutor(extract_workers) as extract_pool, ThreadPoolExecutor(load_workers) as load_pool:
+        async with L0_download.create_client() as client:
+            files = await L0_download.list_files_async(client, root_url)
+
+            async def process_member(zip_file, member_name):
+                csv_file = await loop.run_in_executor(extract_pool, L1_extract.extract_member, zip_file, member_name, L1_extract.OUTPUT_FOLDER)
+                table_name, schema = table_for_member(member_name)
+                if table_name in pending:
+                    await loop.run_in_executor(load_pool, load_file, con, table_name, schema, csv_file)
+                    loaded_files[table_name].append(csv_file)
+                tqdm.write(f"    {csv_file}" + (f" -> {table_name}" if table_name in pending else ""))
+
+            async def process_zip(position, file_name):
+                async with downloads:
+                    await L0_download.download_file_async(client, root_url, file_name, L0_download.OUTPUT_FOLDER, position, manifest)
+
+                zip_file = join(L0_download.OUTPUT_FOLDER, basename(file_name))
+                with ZipFile(zip_file, "r") as zip_ref:
+                    members = [m.filename for m in zip_ref.infolist()]
+                await asyncio.gather(*(process_member(zip_file, member_name) for member_name in members))
+
+            await asyncio.gather(*(process_zip(i, file_name) for i, file_name in enumerate(files)))
+
+    # Todas as tabelas completas: separa as linhas com CNPJ inválido e publica as tabelas parciais (substituindo as anteriores),
+    #   com a impressão digital dos arquivos carregados.
+    for table_name, schema in pending.items():
+        inputs = L2_load.csv_files_inputs(loaded_files[table_name])
+        con.begin()
+        if table_name in L2_load.CNPJ_TABLES:
+            L2_load.reject_invalid_cnpj(con, table_name, staging_table(table_name))
+        con.sql(f"DROP TABLE IF EXISTS {table_name}")
+        con.sql(f"ALTER TABLE {staging_table(table_name)} RENAME TO {table_name}")
+        set_table_fingerprint(con, table_name, L2_load.load_fingerprint(schema, inputs, L2_load.table_select(table_name)), inputs)
+        con.commit()
+
+    # Tabelas mantidas cujos .zip mudaram durante esta execução (novo download): recarregadas a partir dos .csv do L1.
+    for table_name, glob_pattern, schema in l2_tables():
+        if table_name not in pending:
+            if schema is None:
+                L2_load.regime_tributacao_csv_to_duckdb(con, table_name, glob_pattern)
+            else:
+                L2_load.csv_to_duckdb(con, table_name, glob_pattern, schema)
+            print(f"    {table_name}")
+    con.close()
+
+    return len(files), list(pending)
+
+
+#
+# Main
+#
+
+
+def main():
+    parser = ArgumentParser(description="Pipeline: baixa, extrai, carrega e refina os arquivos da RFB, sobrepondo as etapas por arquivo.")
+    parser.add_argument("--root-url", default=L0_download.ROOT_URL)
+    parser.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS, help="downloads simultâneos")
+    parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS, help="processos de extração")
+    parser.add_argument("--load-workers", type=int, default=LOAD_WORKERS, help="cargas simultâneas no DuckDB")
+    parser.add_argument("--parquet", action="store_true", help="exporta 'empresa' e 'estabelecimento' em Parquet particionado (L3 --parquet)")
+    args = parser.parse_args()
+
+    print("Pipeline: Downloading, extracting and loading files...")
+    with step("pipeline", "L0-L2") as record:
+        file_count, loaded = asyncio.run(run_pipeline_async(args.root_url, args.download_workers, args.extract_workers, args.load_workers))
+        record.update(files=file_count, tables=loaded)
+    print(f"Pipeline: {file_count} files ready, {len(loaded)} tables loaded.")
+
+    L3_refine.refine(parquet=args.parquet)
+
+
+if __name__ == "__main__":
+    main()
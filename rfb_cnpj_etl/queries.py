@@ -0,0 +1,430 @@
+#
+# Consultas sobre o banco L3 (compartilhadas pelos scripts Q*).
+#
+
+#
+# Functions
+#
+
+from datetime import date
+
+import duckdb
+
+
+# Colunas retornadas pelas consultas de estabelecimentos. Requer os aliases 'es', 'em' e 'mun'.
+#   As consultas ordenam pela chave numérica (mesma ordem do CNPJ formatado, sem comparar textos).
+ESTABELECIMENTO_COLUMNS = r"""
+        cnpj_format(es.cnpj_base, es.cnpj_ordem, es.cnpj_dv) AS cnpj,
+        em.razao_social,
+        es.nome_fantasia,
+        es.matriz,
+
+        -- Contato
+        es.ddd1 || ' ' || es.telefone1 telefone1,
+        es.ddd2 || ' ' || es.telefone2 telefone2,
+        es.ddd_fax || ' ' || es.fax fax,
+        correio_eletronico email,
+        mun.descricao municipio,
+        es.uf,
+
+        -- Cadastro
+        em.capital_social,
+        em.porte_empresa,
+        es.cnae,
+        array_to_string(es.cnae_secundario, ',') AS cnae_secundario,
+        es.situacao_cadastral,
+        es.data_situacao_cadastral,
+        es.motivo_situacao_cadastral,
+        es.data_inicio_atividades,
+        REPLACE(REPLACE(CAST(es.regime_tributacao AS VARCHAR), 'LUCRO ', ''), ' DO IRPJ', '') AS regime_tributacao,
+
+        -- SIMPLES
+        em.opcao_simples,
+        em.data_opcao_simples,
+        em.data_exclusao_simples,
+
+        -- MEI
+        em.opcao_mei,
+        em.data_opcao_mei,
+        em.data_exclusao_mei
+"""
+
+
+# Índice de busca por nome (L3 --search-index): tokens em minúsculas, sem acentos, apenas letras e dígitos.
+#   A mesma expressão normaliza os nomes (na criação do índice) e o texto pesquisado.
+NOME_TOKENS = r"regexp_extract_all(strip_accents(lower({})), '[a-z0-9]+')"
+NOME_TOKEN_MIN_LENGTH = 2
+
+# Termos com pelo menos 3 caracteres também encontram tokens que começam com eles ('padar' -> 'padaria'), com peso menor.
+NOME_PREFIX_MIN_LENGTH = 3
+NOME_PREFIX_WEIGHT = 0.8
+
+
+# Tabelas de resumo (L3): contagem de estabelecimentos para cada combinação das dimensões.
+#   Nas tabelas com 'cnae', cada estabelecimento é contado uma vez por CNAE (primário e secundários, distinguidos por 'primario').
+RESUMOS = {
+    "resumo_cnae_municipio": ["cnae", "primario", "uf", "municipio", "situacao_cadastral", "porte_empresa"],
+    "resumo_cnae_uf": ["cnae", "primario", "uf", "situacao_cadastral", "porte_empresa"],
+    "resumo_cnae": ["cnae", "primario", "situacao_cadastral", "porte_empresa"],
+    "resumo_municipio": ["uf", "municipio", "situacao_cadastral", "porte_empresa"],
+    "resumo_uf": ["uf", "situacao_cadastral", "porte_empresa"],
+}
+
+# Rede de sócios: sócios com mais empresas que o limite (ex.: entes públicos, fundos) não são expandidos,
+#   e a busca para ao atingir a quantidade máxima de empresas.
+REDE_MAX_EMPRESAS_POR_SOCIO = 1000
+REDE_MAX_EMPRESAS = 10_000
+
+# Histórico (L3 --history): chave e colunas acompanhadas de cada tabela. Alterações em outras colunas não geram novas versões.
+HISTORY_KEYS = {
+    "empresa": ["cnpj_base"],
+    "estabelecimento": ["cnpj_base", "cnpj_ordem", "cnpj_dv"],
+}
+HISTORY_COLUMNS = {
+    "empresa": ["razao_social", "natureza_juridica", "capital_social", "porte_empresa", "opcao_simples", "opcao_mei"],
+    "estabelecimento": [
+        "nome_fantasia",
+        "situacao_cadastral",
+        "data_situacao_cadastral",
+        "motivo_situacao_cadastral",
+        "situacao_especial",
+        "data_situacao_especial",
+        "cnae",
+        "cnae_secundario",
+        "tipo_logradouro",
+        "logradouro",
+        "numero",
+        "complemento",
+        "bairro",
+        "cep",
+        "uf",
+        "municipio",
+        "regime_tributacao",
+    ],
+}
+
+
+def by_cnae(con: duckdb.DuckDBPyConnection, cnae: str):
+    # Todos estabelecimentos com determinado CNAE (primario ou secundario)
+    query = rf"""
+        SELECT {ESTABELECIMENTO_COLUMNS}
+        FROM
+            estabelecimento_cnae ec
+            JOIN estabelecimento es ON es.cnpj_base = ec.cnpj_base AND es.cnpj_ordem = ec.cnpj_ordem
+            JOIN empresa em ON em.cnpj_base = es.cnpj_base
+            JOIN municipio mun ON mun.codigo = es.municipio
+        WHERE
+            ec.cnae = {int(cnae)}
+        ORDER BY es.cnpj_base, es.cnpj_ordem, es.cnpj_dv
+    """
+    # Constante (e não um parâmetro): permite que o filtro seja aplicado já na leitura da tabela.
+    return con.sql(query)
+
+
+def by_cnpj(con: duckdb.DuckDBPyConnection, cnpjs_base: list[int]):
+    # Dados dos estabelecimentos por CNPJ.
+    query = rf"""
+        SELECT {ESTABELECIMENTO_COLUMNS}
+        FROM
+            estabelecimento es
+            JOIN empresa em ON em.cnpj_base = es.cnpj_base
+            JOIN municipio mun ON mun.codigo = es.municipio
+        WHERE
+            es.cnpj_base IN ({", ".join(str(int(c)) for c in cnpjs_base)})
+        ORDER BY es.cnpj_base, es.cnpj_ordem, es.cnpj_dv
+    """
+    # Lista de constantes (e não um parâmetro): permite que o filtro seja aplicado já na leitura da tabela.
+    return con.sql(query)
+
+
+def read_cnpj_file(con: duckdb.DuckDBPyConnection, input_file: str, column: str = None):
+    # Lê um arquivo .csv ou .parquet com CNPJs completos (14 dígitos, formatados ou não) ou apenas a base (8 dígitos).
+    if input_file.lower().endswith(".parquet"):
+        rel = con.read_parquet(input_file)
+    else:
+        # Todas as colunas como texto, para não perder zeros à esquerda. Cabeçalho = primeira linha sem dígitos.
+        with open(input_file, "r", encoding="utf-8") as f:
+            first_line = f.readline()
+        rel = con.read_csv(input_file, header=not any(c.isdigit() for c in first_line), all_varchar=True)
+
+    column = rel.columns[0] if column is None else column
+    input_cnpjs = rel.select(f"""regexp_replace(CAST("{column}" AS VARCHAR), '[^0-9]', '', 'g') AS digits""")
+
+    # Chave numérica (cnpj_parse): a base, a ordem e os dígitos verificadores são extraídos por divisões inteiras.
+    #   Materializado (Arrow) para cada chamada: relações retornadas por chamadas anteriores continuam com os seus próprios CNPJs.
+    return con.sql(
+        r"""
+        SELECT DISTINCT
+            CAST(CASE WHEN len(digits) <= 8 THEN cnpj_key ELSE cnpj_key // 1000000 END AS UINTEGER) AS cnpj_base,
+            CASE WHEN len(digits) > 8 THEN CAST(cnpj_key // 100 % 10000 AS USMALLINT) END AS cnpj_ordem,
+            CASE WHEN len(digits) > 8 THEN CAST(cnpj_key % 100 AS UTINYINT) END AS cnpj_dv
+        FROM (SELECT digits, cnpj_parse(digits) AS cnpj_key FROM input_cnpjs)
+        WHERE cnpj_key IS NOT NULL
+    """
+    ).arrow()
+
+
+def by_cnpj_file(con: duckdb.DuckDBPyConnection, input_file: str, column: str = None):
+    # Dados dos estabelecimentos para uma lista (potencialmente grande) de CNPJs: um único join pela base do CNPJ.
+    #   CNPJs completos retornam o estabelecimento; bases retornam todos os estabelecimentos da empresa.
+    #   O join é feito com a relação dos CNPJs lidos (e não com uma tabela de nome fixo, que a chamada seguinte substituiria).
+    input_cnpj = con.from_arrow(read_cnpj_file(con, input_file, column)).set_alias("ic")
+    return (
+        input_cnpj.join(
+            con.table("estabelecimento").set_alias("es"),
+            "es.cnpj_base = ic.cnpj_base AND (ic.cnpj_ordem IS NULL OR (es.cnpj_ordem = ic.cnpj_ordem AND es.cnpj_dv = ic.cnpj_dv))",
+        )
+        .join(con.table("empresa").set_alias("em"), "em.cnpj_base = es.cnpj_base")
+        .join(con.table("municipio").set_alias("mun"), "mun.codigo = es.municipio")
+        .select(ESTABELECIMENTO_COLUMNS)
+    )
+
+
+def nome_tokens(con: duckdb.DuckDBPyConnection, text: str):
+    tokens = con.sql(f"SELECT {NOME_TOKENS.format('?')}", params=[text]).fetchone()[0] or []
+    return [t for t in dict.fromkeys(tokens) if len(t) >= NOME_TOKEN_MIN_LENGTH]
+
+
+def search_nome(con: duckdb.DuckDBPyConnection, nome: str, limit: int = 100):
+    # Empresas (cnpj_base) cuja razão social ou nome fantasia contém todos os termos pesquisados, das mais relevantes
+    #   para as menos relevantes. Relevância: soma do idf (log(empresas / empresas com o token)) de cada termo.
+    tokens = nome_tokens(con, nome)
+    if not tokens:
+        raise ValueError(f"No search terms in '{nome}'.")
+
+    # Os tokens contêm apenas [a-z0-9]: podem ser usados como constantes. O índice é ordenado por token,
+    #   então o filtro por faixa usa as estatísticas (min/max) da tabela e lê apenas os blocos necessários.
+    terms = []
+    for i, token in enumerate(tokens):
+        if len(token) >= NOME_PREFIX_MIN_LENGTH:
+            end = token[:-1] + chr(ord(token[-1]) + 1)
+            where = f"t.token >= '{token}' AND t.token < '{end}' AND df.token >= '{token}' AND df.token < '{end}'"
+        else:
+            where = f"t.token = '{token}' AND df.token = '{token}'"
+        terms.append(
+            f"""
+            t{i} AS (
+                SELECT t.cnpj_base, max(ln(n.empresas / df.empresas) * CASE WHEN t.token = '{token}' THEN 1.0 ELSE {NOME_PREFIX_WEIGHT} END) AS score
+                FROM nome_token t JOIN nome_token_df df ON df.token = t.token, n
+                WHERE {where}
+                GROUP BY t.cnpj_base
+            )"""
+        )
+
+    query = rf"""
+        WITH
+            n AS (SELECT count(*) AS empresas FROM empresa),
+            {",".join(terms)}
+        SELECT t0.cnpj_base, {" + ".join(f"t{i}.score" for i in range(len(tokens)))} AS relevancia
+        FROM t0 {" ".join(f"JOIN t{i} USING (cnpj_base)" for i in range(1, len(tokens)))}
+        ORDER BY relevancia DESC, cnpj_base
+        LIMIT {int(limit)}
+    """
+    return con.sql(query)
+
+
+def by_nome(con: duckdb.DuckDBPyConnection, nome: str, limit: int = 100):
+    # Estabelecimentos das empresas encontradas pela busca por nome, da mais relevante para a menos relevante.
+    #   Duas consultas: as empresas encontradas entram como constantes, o que permite filtrar 'estabelecimento' já na leitura.
+    found = search_nome(con, nome, limit).fetchall()
+    values = ", ".join(f"({int(cnpj_base)}, {relevancia})" for cnpj_base, relevancia in found) or "(NULL, NULL)"
+    query = rf"""
+        SELECT {ESTABELECIMENTO_COLUMNS},
+            round(CAST(d.relevancia AS DOUBLE), 3) AS relevancia
+        FROM
+            (VALUES {values}) d(cnpj_base, relevancia)
+            JOIN estabelecimento es ON es.cnpj_base = d.cnpj_base
+            JOIN empresa em ON em.cnpj_base = es.cnpj_base
+            JOIN municipio mun ON mun.codigo = es.municipio
+        WHERE
+            es.cnpj_base IN ({", ".join(str(int(cnpj_base)) for cnpj_base, _ in found) or "NULL"})
+        ORDER BY d.relevancia DESC, es.cnpj_base, es.cnpj_ordem, es.cnpj_dv
+    """
+    return con.sql(query)
+
+
+def socios_by_cnpj(con: duckdb.DuckDBPyConnection, cnpjs_base: list[int]):
+    # Sócios das empresas.
+    query = rf"""
+        SELECT
+            lpad(CAST(s.cnpj_base AS VARCHAR), 8, '0') AS cnpj_base,
+            sp.nome_socio,
+            sp.cnpj_cpf_socio,
+            CASE sp.identificador_socio WHEN 1 THEN 'Pessoa jurídica' WHEN 2 THEN 'Pessoa física' WHEN 3 THEN 'Estrangeiro' END AS tipo_socio,
+            q.descricao AS qualificacao_socio,
+            s.data_entrada_sociedade,
+            s.faixa_etaria,
+            s.nome_representante,
+            s.socio_id
+        FROM
+            socio s
+            JOIN socio_pessoa sp ON sp.socio_id = s.socio_id
+            LEFT JOIN qualificacao q ON q.codigo = s.qualificacao_socio
+        WHERE
+            s.cnpj_base IN ({", ".join(str(int(c)) for c in cnpjs_base) or "NULL"})
+        ORDER BY s.cnpj_base, sp.nome_socio
+    """
+    return con.sql(query)
+
+
+def rede_socios(
+    con: duckdb.DuckDBPyConnection,
+    cnpjs_base: list[int],
+    saltos: int = 2,
+    max_empresas: int = REDE_MAX_EMPRESAS,
+    max_empresas_por_socio: int = REDE_MAX_EMPRESAS_POR_SOCIO,
+):
+    # Empresas ligadas a 'cnpjs_base' por sócios em comum, até 'saltos' saltos (empresa -> sócio -> empresa).
+    #   Busca em largura sobre as listas de adjacência do L3: cada salto é uma única consulta que expande apenas a fronteira
+    #   do salto anterior (as empresas entram como constantes e filtram as tabelas já na leitura); empresas já visitadas
+    #   são descartadas. Retorna {cnpj_base: distância}.
+    distancias = {int(c): 0 for c in cnpjs_base}
+    fronteira = sorted(distancias)
+    for salto in range(1, saltos + 1):
+        if not fronteira or len(distancias) >= max_empresas:
+            break
+
+        query = rf"""
+            SELECT DISTINCT unnest(se.cnpj_bases) AS cnpj_base
+            FROM socio_empresas se
+            WHERE
+                se.socio_id IN (
+                    SELECT unnest(es.socio_ids) FROM empresa_socios es WHERE es.cnpj_base IN ({", ".join(str(c) for c in fronteira)})
+                )
+                AND len(se.cnpj_bases) <= {int(max_empresas_por_socio)}
+            ORDER BY cnpj_base
+        """
+        fronteira = [c for (c,) in con.sql(query).fetchall() if c not in distancias][: max_empresas - len(distancias)]
+        distancias.update((c, salto) for c in fronteira)
+
+    return distancias
+
+
+def by_rede_socios(con: duckdb.DuckDBPyConnection, cnpjs_base: list[int], saltos: int = 2, max_empresas: int = REDE_MAX_EMPRESAS):
+    # Empresas da rede de sócios (ver rede_socios()), das mais próximas para as mais distantes.
+    #   As empresas encontradas entram como constantes, o que permite filtrar 'empresa' e 'empresa_socios' já na leitura.
+    found = rede_socios(con, cnpjs_base, saltos, max_empresas)
+    values = ", ".join(f"({cnpj_base}, {distancia})" for cnpj_base, distancia in found.items()) or "(NULL, NULL)"
+    in_list = ", ".join(str(cnpj_base) for cnpj_base in found) or "NULL"
+    query = rf"""
+        SELECT
+            d.distancia,
+            lpad(CAST(d.cnpj_base AS VARCHAR), 8, '0') AS cnpj_base,
+            em.razao_social,
+            em.porte_empresa,
+            em.capital_social,
+            len(es.socio_ids) AS socios
+        FROM
+            (VALUES {values}) d(cnpj_base, distancia)
+            LEFT JOIN (SELECT * FROM empresa WHERE cnpj_base IN ({in_list})) em ON em.cnpj_base = d.cnpj_base
+            LEFT JOIN (SELECT * FROM empresa_socios WHERE cnpj_base IN ({in_list})) es ON es.cnpj_base = d.cnpj_base
+        WHERE
+            d.cnpj_base IS NOT NULL
+        ORDER BY d.distancia, d.cnpj_base
+    """
+    return con.sql(query)
+
+
+def sql_literal(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def choose_resumo(con: duckdb.DuckDBPyConnection, dimensions: set[str]):
+    # Menor tabela de resumo (em linhas) que contém todas as dimensões. Sem 'cnae' nem 'primario', apenas as tabelas
+    #   sem 'cnae' servem (nas demais, um estabelecimento com vários CNAEs seria contado várias vezes).
+    per_cnae = bool(dimensions & {"cnae", "primario"})
+    candidates = [t for t, d in RESUMOS.items() if dimensions <= set(d) and ("cnae" in d) == per_cnae]
+    if not candidates:
+        raise ValueError(f"Unknown dimensions: {', '.join(sorted(dimensions - {d for ds in RESUMOS.values() for d in ds}))}.")
+
+    sizes = dict(con.sql("SELECT table_name, estimated_size FROM duckdb_tables WHERE table_name LIKE 'resumo_%'").fetchall())
+    candidates = [t for t in candidates if t in sizes]
+    if not candidates:
+        raise ValueError("Summary tables not found (run L3_refine.py).")
+    return min(candidates, key=lambda t: (sizes[t], len(RESUMOS[t])))
+
+
+def resumo(con: duckdb.DuckDBPyConnection, group_by: list[str], **filters):
+    # Quantidade de estabelecimentos agrupada por 'group_by' (ex.: ['uf', 'situacao_cadastral']), respondida pela menor
+    #   tabela de resumo que contém as dimensões necessárias. Filtros: dimensão=valor ou dimensão=[valores].
+    #   Ex.: resumo(con, ["municipio"], cnae=4711302, uf="SP", situacao_cadastral="Ativa")
+    table_name = choose_resumo(con, set(group_by) | set(filters))
+
+    conditions = []
+    for dimension, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(f"{dimension} IN ({', '.join(sql_literal(v) for v in value)})")
+        else:
+            conditions.append(f"{dimension} = {sql_literal(value)}")
+
+    columns = "".join(f"{d}, " for d in group_by)
+    query = f"""
+        SELECT {columns}CAST(sum(estabelecimentos) AS UBIGINT) AS estabelecimentos
+        FROM {table_name}
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        {"GROUP BY ALL ORDER BY ALL" if group_by else ""}
+    """
+    return con.sql(query)
+
+
+def date_literal(value: date | str):
+    return f"DATE '{date.fromisoformat(str(value))}'"
+
+
+def historico_as_of(con: duckdb.DuckDBPyConnection, cnpjs_base: list[int], data: date | str = None):
+    # Estabelecimentos das empresas, com os dados vigentes na data 'data' (banco do histórico, L3 --history).
+    #   Sem 'data': todas as versões, da mais antiga para a mais recente ('valid_to' NULL = versão atual).
+    in_list = ", ".join(str(int(c)) for c in cnpjs_base) or "NULL"
+    vigente = f"valid_from <= {date_literal(data)} AND (valid_to IS NULL OR valid_to > {date_literal(data)}) AND NOT excluido" if data else "true"
+    query = rf"""
+        SELECT
+            cnpj_format(es.cnpj_base, es.cnpj_ordem, es.cnpj_dv) AS cnpj,
+            em.razao_social,
+            es.* EXCLUDE (cnpj_base, cnpj_ordem, cnpj_dv, valid_from, valid_to) REPLACE (array_to_string(es.cnae_secundario, ',') AS cnae_secundario),
+            em.natureza_juridica,
+            em.capital_social,
+            em.porte_empresa,
+            em.opcao_simples,
+            em.opcao_mei,
+            greatest(es.valid_from, em.valid_from) AS valid_from,
+            least(es.valid_to, em.valid_to) AS valid_to
+        FROM
+            (SELECT * FROM estabelecimento_historico WHERE cnpj_base IN ({in_list}) AND {vigente}) es
+            LEFT JOIN (SELECT * FROM empresa_historico WHERE cnpj_base IN ({in_list}) AND {vigente}) em
+              ON em.cnpj_base = es.cnpj_base
+             AND em.valid_from < coalesce(es.valid_to, DATE '9999-12-31')
+             AND coalesce(em.valid_to, DATE '9999-12-31') > es.valid_from
+        ORDER BY es.cnpj_base, es.cnpj_ordem, es.cnpj_dv, valid_from
+    """
+    # As empresas entram como constantes: o filtro é aplicado já na leitura das tabelas do histórico.
+    return con.sql(query)
+
+
+def alteracoes(con: duckdb.DuckDBPyConnection, de: date | str, ate: date | str, tabela: str = "estabelecimento"):
+    # Inclusões, alterações e exclusões de 'tabela' nas releases posteriores a 'de' até 'ate' (inclusive), com as colunas alteradas.
+    #   As versões de cada release ficam juntas no histórico: o filtro por 'valid_from' lê apenas os row groups das releases pedidas.
+    if tabela not in HISTORY_COLUMNS:
+        raise ValueError(f"Unknown table '{tabela}' (use {', '.join(HISTORY_COLUMNS)}).")
+
+    keys = HISTORY_KEYS[tabela]
+    columns = HISTORY_COLUMNS[tabela]
+    cnpj = f"cnpj_format({', '.join(f'n.{k}' for k in keys)})" if len(keys) == 3 else "lpad(CAST(n.cnpj_base AS VARCHAR), 8, '0')"
+    changed = ", ".join(f"CASE WHEN n.{c} IS DISTINCT FROM o.{c} THEN '{c}' END" for c in columns)
+    query = rf"""
+        SELECT
+            n.valid_from AS release,
+            CASE WHEN n.excluido THEN 'Exclusão' WHEN o.valid_from IS NULL OR o.excluido THEN 'Inclusão' ELSE 'Alteração' END AS tipo,
+            {cnpj} AS cnpj,
+            CASE WHEN NOT n.excluido AND NOT o.excluido THEN concat_ws(',', {changed}) END AS colunas_alteradas,
+            {", ".join(f"array_to_string(n.{c}, ',') AS {c}" if c == "cnae_secundario" else f"n.{c}" for c in columns)}
+        FROM
+            (SELECT * FROM {tabela}_historico WHERE valid_from > {date_literal(de)} AND valid_from <= {date_literal(ate)}) n
+            LEFT JOIN (SELECT * FROM {tabela}_historico WHERE valid_to > {date_literal(de)} AND valid_to <= {date_literal(ate)}) o
+              ON {" AND ".join(f"o.{k} = n.{k}" for k in keys)} AND o.valid_to = n.valid_from
+        ORDER BY n.valid_from, {", ".join(f"n.{k}" for k in keys)}
+    """
+    return con.sql(query)
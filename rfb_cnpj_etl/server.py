@@ -0,0 +1,212 @@
+#
+# Serviço HTTP/JSON local para consultas ao banco L3 (mantém conexões e cache abertos entre consultas).
+#
+#   Usa a conexão compartilhada da API (api.SharedConnection): quando o L3 substitui o banco, as consultas em andamento
+#   terminam na versão anterior, a conexão é reaberta e o cache é descartado.
+#
+#   GET /cnpj/<cnpj>                     CNPJ completo (14 dígitos) ou apenas a base (8 dígitos)
+#   GET /cnae/<cnae>?limit=100&offset=0  Estabelecimentos com o CNAE (primário ou secundário)
+#   GET /nome/<texto>?limit=100          Busca por razão social ou nome fantasia (requer L3 --search-index)
+#   GET /resumo?por=uf,municipio&cnae=4711302&situacao_cadastral=Ativa,Inapta
+#                                        Quantidade de estabelecimentos (tabelas de resumo do L3)
+#   GET /socios/<cnpj>                   Sócios da empresa
+#   GET /rede/<cnpj>?saltos=2            Empresas ligadas por sócios em comum
+#
+
+INPUT_FOLDER = ".data/L3-gold"
+
+HOST = "127.0.0.1"
+PORT = 8000
+
+POOL_SIZE = 8
+CACHE_SIZE = 10_000
+DEFAULT_LIMIT = 1000
+DEFAULT_SEARCH_LIMIT = 100
+MAX_SALTOS = 4
+
+
+#
+# Functions
+#
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+from threading import BoundedSemaphore, Lock
+from urllib.parse import parse_qs, unquote, urlparse
+
+import duckdb
+import json
+
+from rfb_cnpj_etl.api import SharedConnection
+from rfb_cnpj_etl.cnpj import cnpj_base, cnpj_digits
+from rfb_cnpj_etl.queries import by_cnae, by_cnpj, by_nome, by_rede_socios, resumo, socios_by_cnpj
+
+
+class LruCache:
+    # 'generation': geração da conexão (api.SharedConnection) cujos resultados estão no cache.
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = Lock()
+        self.items = OrderedDict()
+        self.generation = None
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self, generation=None):
+        with self.lock:
+            self.items.clear()
+            self.generation = generation
+
+
+def to_records(rel: duckdb.DuckDBPyRelation):
+    columns = rel.columns
+    return [dict(zip(columns, row)) for row in rel.fetchall()]
+
+
+def query_cnpj(con: duckdb.DuckDBPyConnection, cnpj: str):
+    digits = cnpj_digits(cnpj)
+    if len(digits) <= 8:
+        return to_records(by_cnpj(con, [int(digits)]))
+
+    formatted = f"{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}"
+    return to_records(by_cnpj(con, [int(digits[:8])]).filter(f"cnpj = '{formatted}'"))
+
+
+def query_socios(con: duckdb.DuckDBPyConnection, cnpj: str):
+    return to_records(socios_by_cnpj(con, [cnpj_base(cnpj)]))
+
+
+def query_rede(con: duckdb.DuckDBPyConnection, cnpj: str, saltos: int):
+    if not 1 <= saltos <= MAX_SALTOS:
+        raise ValueError(f"'saltos' must be between 1 and {MAX_SALTOS}.")
+    return to_records(by_rede_socios(con, [cnpj_base(cnpj)], saltos))
+
+
+def query_cnae(con: duckdb.DuckDBPyConnection, cnae: str, limit: int, offset: int):
+    if not cnae.isdigit():
+        raise ValueError(f"Invalid CNAE '{cnae}'.")
+    return to_records(by_cnae(con, cnae).limit(limit, offset))
+
+
+def query_nome(con: duckdb.DuckDBPyConnection, nome: str, limit: int):
+    return to_records(by_nome(con, nome, limit))
+
+
+def query_resumo(con: duckdb.DuckDBPyConnection, params: dict):
+    # 'por': dimensões do agrupamento; demais parâmetros: filtros (valores separados por vírgula).
+    group_by = [d for d in params.get("por", [""])[0].split(",") if d]
+    filters = {}
+    for dimension, values in params.items():
+        if dimension != "por":
+            values = [int(v) if v.isdigit() else v for v in values[0].split(",")]
+            filters[dimension] = values if len(values) > 1 else values[0]
+    return to_records(resumo(con, group_by, **filters))
+
+
+def create_handler(shared: SharedConnection, cache: LruCache):
+    # Consultas simultâneas ao DuckDB (cada consulta já usa todas as threads do perfil de recursos).
+    slots = BoundedSemaphore(POOL_SIZE)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            parts = url.path.strip("/").split("/", 1)
+
+            try:
+                if len(parts) == 2 and parts[0] == "cnpj":
+                    key = ("cnpj", parts[1])
+                    run = lambda con: query_cnpj(con, parts[1])
+                elif len(parts) == 2 and parts[0] == "cnae":
+                    limit = int(params.get("limit", [DEFAULT_LIMIT])[0])
+                    offset = int(params.get("offset", [0])[0])
+                    key = ("cnae", parts[1], limit, offset)
+                    run = lambda con: query_cnae(con, parts[1], limit, offset)
+                elif len(parts) == 2 and parts[0] == "nome":
+                    nome = unquote(parts[1])
+                    limit = int(params.get("limit", [DEFAULT_SEARCH_LIMIT])[0])
+                    key = ("nome", nome, limit)
+                    run = lambda con: query_nome(con, nome, limit)
+                elif len(parts) == 2 and parts[0] == "socios":
+                    key = ("socios", parts[1])
+                    run = lambda con: query_socios(con, parts[1])
+                elif len(parts) == 2 and parts[0] == "rede":
+                    saltos = int(params.get("saltos", [2])[0])
+                    key = ("rede", parts[1], saltos)
+                    run = lambda con: query_rede(con, parts[1], saltos)
+                elif parts == ["resumo"]:
+                    key = ("resumo", url.query)
+                    run = lambda con: query_resumo(con, params)
+                else:
+                    self.send_json(404, {"error": "Not found."})
+                    return
+
+                # Banco L3 substituído (conexão reaberta): descarta o cache.
+                with shared.lease() as con:
+                    if cache.generation != shared.generation:
+                        cache.clear(shared.generation)
+
+                    rows = cache.get(key)
+                    if rows is None:
+                        with slots:
+                            rows = run(con)
+                        cache.put(key, rows)
+
+                self.send_json(200, {"rows": rows})
+            except (ValueError, duckdb.ConversionException, duckdb.InvalidInputException) as e:
+                # Parâmetros inválidos (ex. texto onde se espera um código numérico).
+                self.send_json(400, {"error": str(e)})
+            except Exception as e:
+                self.log_error("%s: %s", type(e).__name__, e)
+                self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def send_json(self, status: int, body):
+            data = json.dumps(body, default=str, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+#
+# Main
+#
+
+
+def main():
+    parser = ArgumentParser(description="Serviço HTTP/JSON para consultas ao banco L3.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    shared = SharedConnection(join(INPUT_FOLDER, "rfb-cnpj.duckdb"))
+    shared.cursor()
+    cache = LruCache(CACHE_SIZE)
+
+    server = ThreadingHTTPServer((args.host, args.port), create_handler(shared, cache))
+    print(f"Listening on http://{args.host}:{args.port}/ ...")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
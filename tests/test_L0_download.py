@@ -0,0 +1,153 @@
+#
+# L0: downloads em partes (HTTP Range), retomada de arquivos .part e manifesto de validadores (ETag/tamanho).
+#   Um servidor HTTP local com suporte a Range substitui o site da RFB.
+#
+
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import listdir, makedirs
+from os.path import join
+from threading import Thread
+from urllib.parse import unquote, urlparse
+
+import asyncio
+import pytest
+import re
+
+from rfb_cnpj_etl import L0_download
+
+FILE_NAME = "Empresas0.zip"
+FILE_SIZE = 10_000
+SEGMENT_SIZE = 1024
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    # Serve 'server.files' ({nome: bytes}) e registra (método, nome, Range) de cada requisição em 'server.requests'.
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def do_GET(self):
+        self.respond(True)
+
+    def respond(self, body: bool):
+        name = unquote(urlparse(self.path).path.lstrip("/"))
+        self.server.requests.append((self.command, name, self.headers.get("Range")))
+        if name not in self.server.files:
+            self.send_error(404)
+            return
+
+        data = self.server.files[name]
+        start, end, status = 0, len(data) - 1, 200
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+        if match:
+            start, end, status = int(match[1]), int(match[2] or end), 206
+
+        self.send_response(status)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{sha256(data).hexdigest()[:16]}"')
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if body:
+            self.wfile.write(data[start : end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.files = {FILE_NAME: bytes(i % 251 for i in range(FILE_SIZE))}
+    httpd.requests = []
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def output_path(tmp_path, monkeypatch):
+    # Relatórios (metrics.step) em 'tmp_path/.data/reports'; partes de 1 KB: o arquivo de teste é baixado em 4 partes.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(L0_download, "MIN_SEGMENT_SIZE", SEGMENT_SIZE)
+    output_path = str(tmp_path / "L0-zip")
+    makedirs(output_path)
+    return output_path
+
+
+def download(server, output_path, files=None):
+    server.requests.clear()
+    root_url = f"http://127.0.0.1:{server.server_port}/"
+    return asyncio.run(L0_download.download_files_async(root_url, files or [FILE_NAME], output_path))
+
+
+def ranges(server):
+    return sorted(r for method, _, r in server.requests if method == "GET")
+
+
+def read(output_path, file_name=FILE_NAME):
+    with open(join(output_path, file_name), "rb") as f:
+        return f.read()
+
+
+def test_download_in_segments(server, output_path):
+    assert download(server, output_path) == (1, 1)
+
+    assert read(output_path) == server.files[FILE_NAME]
+    assert ranges(server) == ["bytes=0-2499", "bytes=2500-4999", "bytes=5000-7499", "bytes=7500-9999"]
+    assert sorted(listdir(output_path)) == [FILE_NAME, L0_download.MANIFEST_FILE]
+
+
+def test_skip_unchanged_file(server, output_path):
+    download(server, output_path)
+
+    assert download(server, output_path) == (1, 0)
+    assert [method for method, _, _ in server.requests] == ["HEAD"]
+
+
+def test_download_changed_file(server, output_path):
+    download(server, output_path)
+    server.files[FILE_NAME] = bytes(reversed(server.files[FILE_NAME]))
+
+    assert download(server, output_path) == (1, 1)
+    assert read(output_path) == server.files[FILE_NAME]
+
+
+def test_resume_part_files(server, output_path):
+    # Download interrompido: primeira parte incompleta, terceira completa, demais ausentes.
+    data = server.files[FILE_NAME]
+    target_file = join(output_path, FILE_NAME)
+    with open(L0_download.part_file_name(target_file, 0), "wb") as f:
+        f.write(data[:1000])
+    with open(L0_download.part_file_name(target_file, 2), "wb") as f:
+        f.write(data[5000:7500])
+    etag = f'"{sha256(data).hexdigest()[:16]}"'
+    manifest = {FILE_NAME: {"etag": etag, "last_modified": None, "content_length": FILE_SIZE, "accept_ranges": True, "complete": False}}
+    L0_download.save_manifest(output_path, manifest)
+
+    assert download(server, output_path) == (1, 1)
+
+    assert read(output_path) == data
+    assert ranges(server) == ["bytes=1000-2499", "bytes=2500-4999", "bytes=7500-9999"]
+
+
+def test_discard_part_files_of_changed_file(server, output_path):
+    target_file = join(output_path, FILE_NAME)
+    with open(L0_download.part_file_name(target_file, 0), "wb") as f:
+        f.write(b"x" * 1000)
+    manifest = {FILE_NAME: {"etag": '"old"', "last_modified": None, "content_length": FILE_SIZE, "accept_ranges": True, "complete": False}}
+    L0_download.save_manifest(output_path, manifest)
+
+    download(server, output_path)
+
+    assert read(output_path) == server.files[FILE_NAME]
+    assert "bytes=0-2499" in ranges(server)
+
+
+def test_reject_duplicate_local_names(server, output_path):
+    with pytest.raises(ValueError, match="would both be saved"):
+        download(server, output_path, [FILE_NAME, f"regime_tributario/{FILE_NAME}"])
@@ -0,0 +1,112 @@
+#
+# L3 --incremental: depois de alterar algumas linhas dos arquivos do L1 (base sintética do B0), o banco atualizado
+#   incrementalmente deve ser igual a um banco recriado do zero, e apenas as chaves alteradas devem ser refeitas.
+#
+
+from os import remove
+from os.path import join
+from shutil import copytree
+
+import duckdb
+import json
+import sys
+
+from rfb_cnpj_etl import B0_synthetic, L1_extract, L2_load, L3_refine
+
+SCALE = 0.0001
+DB_FILE = join(L3_refine.OUTPUT_FOLDER, "rfb-cnpj.duckdb")
+
+
+def run_l2(root, monkeypatch):
+    monkeypatch.chdir(root)
+    monkeypatch.setattr(sys, "argv", ["L2_load"])
+    L2_load.main()
+
+
+def edit_csv(root, member_name: str, edit):
+    # 'edit' recebe e altera a lista de linhas (campos já separados) do arquivo extraído pelo L1.
+    csv_file = join(root, L1_extract.OUTPUT_FOLDER, member_name)
+    with open(csv_file, "r", encoding="utf-8") as f:
+        rows = [line.split(";") for line in f.read().splitlines()]
+    edit(rows)
+    with open(csv_file, "w", encoding="utf-8") as f:
+        f.write("".join(";".join(row) + "\n" for row in rows))
+
+
+def edit_estabelecimentos(rows):
+    rows[0][4] = '"NOME FANTASIA ALTERADO"'
+    del rows[1]
+    # Nova filial (com dígitos verificadores válidos) de uma empresa existente.
+    new = list(rows[2])
+    cnpj_base = int(new[0].strip('"'))
+    new[1], new[2], new[3] = '"9999"', f'"{B0_synthetic.cnpj_dv(cnpj_base, 9999):02d}"', '"2"'
+    rows.append(new)
+
+
+def edit_empresas(rows):
+    rows[0][1] = '"RAZAO SOCIAL ALTERADA"'
+
+
+def edit_simples(rows):
+    del rows[0]
+    rows[1][1] = '"N"' if rows[1][1] == '"S"' else '"S"'
+
+
+def table_hashes(db_file: str):
+    with duckdb.connect(db_file, read_only=True) as con:
+        tables = [r[0] for r in con.sql("SELECT table_name FROM duckdb_tables WHERE schema_name = 'main' ORDER BY ALL").fetchall()]
+        return {t: con.sql(f"SELECT count(*), sum(hash(t)) FROM {t} t").fetchone() for t in tables if t not in ("_manifest", "estatistica_row_group")}
+
+
+def hashes_tables(db_file: str):
+    with duckdb.connect(db_file, read_only=True) as con:
+        return [r[0] for r in con.sql("SELECT table_name FROM duckdb_tables WHERE starts_with(table_name, 'entrada_') ORDER BY ALL").fetchall()]
+
+
+def last_record(root, stage: str, name: str):
+    with open(join(root, ".data/reports/report.jsonl"), "r", encoding="utf-8") as f:
+        return [r for r in map(json.loads, f) if r["stage"] == stage and r["step"] == name][-1]
+
+
+def test_incremental_equals_full_rebuild(tmp_path, monkeypatch):
+    incremental_root, full_root = tmp_path / "incremental", tmp_path / "full"
+    B0_synthetic.generate(str(incremental_root), SCALE)
+    monkeypatch.chdir(incremental_root)
+    L1_extract.main()
+    run_l2(incremental_root, monkeypatch)
+    # Banco criado já com --incremental: grava os hashes por CNPJ (tabelas 'entrada_*') usados na próxima atualização.
+    L3_refine.refine(incremental=True, search_index=True)
+
+    # Nova release: alterações diretamente nos arquivos do L1 (o L1 os extrairia novamente a partir dos .zip).
+    edit_csv(incremental_root, "K3241.K03200Y0.D40309.ESTABELE", edit_estabelecimentos)
+    edit_csv(incremental_root, "K3241.K03200Y1.D40309.EMPRECSV", edit_empresas)
+    edit_csv(incremental_root, "F.K03200$W.SIMPLES.CSV.D40309", edit_simples)
+    run_l2(incremental_root, monkeypatch)
+
+    # Recriação completa a partir do mesmo banco L2.
+    copytree(incremental_root, full_root)
+    monkeypatch.chdir(full_root)
+    remove(DB_FILE)
+    L3_refine.refine(search_index=True)
+
+    monkeypatch.chdir(incremental_root)
+    L3_refine.refine(incremental=True)
+
+    # O banco recriado sem --incremental não guarda os hashes por CNPJ.
+    assert hashes_tables(join(full_root, DB_FILE)) == []
+    assert hashes_tables(join(incremental_root, DB_FILE)) == ["entrada_empresa", "entrada_estabelecimento", "entrada_regime_tributacao", "entrada_simples"]
+    full_hashes = table_hashes(join(full_root, DB_FILE))
+    assert {t: h for t, h in table_hashes(join(incremental_root, DB_FILE)).items() if not t.startswith("entrada_")} == full_hashes
+
+    # Apenas as chaves cujas linhas no L2 mudaram foram refeitas.
+    empresa = last_record(incremental_root, "L3", "empresa")
+    assert (empresa["chaves_entrada"], empresa["alterados"]) == (3, 3)
+    estabelecimento = last_record(incremental_root, "L3", "estabelecimento")
+    assert estabelecimento["chaves_entrada"] == 3
+    assert (estabelecimento["incluidos"], estabelecimento["alterados"], estabelecimento["excluidos"]) == (1, 1, 1)
+    assert last_record(incremental_root, "L3", "nome_token")["mode"] == "incremental"
+
+    # Nova execução sem alterações: nada a refazer.
+    L3_refine.refine(incremental=True)
+    assert last_record(incremental_root, "L3", "empresa")["skipped"]
+    assert last_record(incremental_root, "L3", "estabelecimento")["skipped"]
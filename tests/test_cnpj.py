@@ -0,0 +1,73 @@
+#
+# Macros de CNPJ (cnpj.py): chave numérica, formatação, leitura de texto e dígitos verificadores; e cnpj_base() dos argumentos das consultas.
+#   Os dígitos verificadores são conferidos com uma implementação direta do módulo 11 sobre os 12 dígitos.
+#
+
+import duckdb
+import pytest
+import random
+
+from rfb_cnpj_etl.cnpj import cnpj_base, cnpj_digits, register_macros
+
+
+def check_digits(cnpj_base: int, cnpj_ordem: int):
+    digits = [int(c) for c in f"{cnpj_base:08d}{cnpj_ordem:04d}"]
+    for weights in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        r = sum(d * w for d, w in zip(digits, weights)) % 11
+        digits.append(0 if r < 2 else 11 - r)
+    return digits[-2] * 10 + digits[-1]
+
+
+@pytest.fixture
+def con():
+    with register_macros(duckdb.connect()) as con:
+        yield con
+
+
+def value(con: duckdb.DuckDBPyConnection, expression: str, *params):
+    return con.execute(f"SELECT {expression}", list(params)).fetchone()[0]
+
+
+@pytest.mark.parametrize("cnpj", ["00.000.000/0001-91", "11.222.333/0001-81", "33.000.167/0001-01", "60.746.948/0001-12"])
+def test_valid_cnpj(con, cnpj):
+    key = value(con, "cnpj_parse(?)", cnpj)
+    b, o, d = key // 1_000_000, key // 100 % 10_000, key % 100
+
+    assert value(con, "cnpj_is_valid(?, ?, ?)", b, o, d)
+    assert value(con, "cnpj_format(?, ?, ?)", b, o, d) == cnpj
+    assert value(con, "cnpj_format_key(cnpj_key(?, ?, ?))", b, o, d) == cnpj
+
+
+def test_check_digits(con):
+    rng = random.Random(0)
+    pairs = [(0, 1), (99_999_999, 9_999)] + [(rng.randrange(100_000_000), rng.randrange(1, 10_000)) for _ in range(1000)]
+    con.execute("CREATE TABLE t (b UINTEGER, o USMALLINT)")
+    con.executemany("INSERT INTO t VALUES (?, ?)", pairs)
+
+    result = con.sql("SELECT b, o, cnpj_check_digits(b, o) FROM t").fetchall()
+    assert all(dv == check_digits(b, o) for b, o, dv in result)
+
+
+def test_invalid_check_digits(con):
+    assert not value(con, "cnpj_is_valid(11222333, 1, 82)")
+    assert not value(con, "cnpj_is_valid(11222333, 2, 81)")
+    assert value(con, "cnpj_is_valid(NULL, 1, 81)") is None
+
+
+@pytest.mark.parametrize("text, key", [("11222333000181", 11222333000181), ("191", 191), (" 00.000.000/0001-91 ", 191), ("", None), ("123456789012345", None)])
+def test_parse(con, text, key):
+    assert value(con, "cnpj_parse(?)", text) == key
+
+
+@pytest.mark.parametrize(
+    "text, base, digits",
+    [("40117016", 40117016, "40117016"), ("40.117.016/0001-01", 40117016, "40117016000101"), ("191", 191, "191"), ("000000000191", 0, "00000000000191")],
+)
+def test_cnpj_base(text, base, digits):
+    assert (cnpj_base(text), cnpj_digits(text)) == (base, digits)
+
+
+@pytest.mark.parametrize("text", ["", "cnpj", "123456789012345"])
+def test_cnpj_base_invalid(text):
+    with pytest.raises(ValueError, match="Invalid CNPJ"):
+        cnpj_base(text)
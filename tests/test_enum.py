@@ -0,0 +1,53 @@
+#
+# Tipos ENUM do L3 (ENUM_TYPES): rótulos de cada código da RFB; valores desconhecidos viram NULL e são registrados.
+#
+
+import duckdb
+import pytest
+
+from rfb_cnpj_etl.L3_refine import ENUM_COLUMNS, ENUM_TYPES, create_enum_types, to_enum, unknown_enum_sql
+
+
+@pytest.fixture
+def con():
+    with duckdb.connect() as con:
+        create_enum_types(con)
+        yield con
+
+
+def convert(con: duckdb.DuckDBPyConnection, type_name: str, values: list):
+    column_type = "INTEGER" if all(isinstance(v, int) for v in values if v is not None) else "VARCHAR"
+    con.execute(f"CREATE OR REPLACE TABLE t (i INTEGER, v {column_type})")
+    con.executemany("INSERT INTO t VALUES (?, ?)", list(enumerate(values)))
+    return [r[0] for r in con.sql(f"SELECT {to_enum('v', type_name)} FROM t ORDER BY i").fetchall()]
+
+
+@pytest.mark.parametrize("type_name", ENUM_TYPES)
+def test_known_values(con, type_name):
+    mapping = ENUM_TYPES[type_name]
+
+    assert convert(con, type_name, [*mapping, None]) == [*mapping.values(), None]
+    assert con.sql(f"SELECT enum_range(NULL::{type_name})").fetchone()[0] == list(mapping.values())
+
+
+@pytest.mark.parametrize("type_name, unknown", [("tipo_situacao_cadastral", 9), ("tipo_porte_empresa", 2), ("tipo_uf", "XX")])
+def test_unknown_value_is_null(con, type_name, unknown):
+    known = next(iter(ENUM_TYPES[type_name]))
+
+    assert convert(con, type_name, [known, unknown]) == [ENUM_TYPES[type_name][known], None]
+
+
+def test_unknown_values_report(con):
+    # Tabelas do L2 apenas com as colunas ENUM: um valor desconhecido em 'porte_empresa' (2 linhas) e outro em 'uf'.
+    con.sql("ATTACH ':memory:' AS input")
+    con.sql("CREATE TABLE input.empresa AS SELECT * FROM (VALUES (1), (2), (2), (NULL)) t(porte_empresa)")
+    con.sql("CREATE TABLE input.estabelecimento AS SELECT * FROM (VALUES (2, 'SP'), (8, ''), (2, 'XX')) t(situacao_cadastral, uf)")
+
+    assert con.sql(unknown_enum_sql()).fetchall() == [("empresa", "porte_empresa", "2", 2), ("estabelecimento", "uf", "XX", 1)]
+    assert {type_name for _, _, type_name in ENUM_COLUMNS} == set(ENUM_TYPES)
+
+
+def test_create_enum_types_is_idempotent(con):
+    create_enum_types(con)
+
+    assert con.sql("SELECT count(*) FROM duckdb_types() WHERE type_name LIKE 'tipo_%'").fetchone()[0] == len(ENUM_TYPES)
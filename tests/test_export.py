@@ -0,0 +1,91 @@
+#
+# Exportação em lotes (exporter.py): leitura de volta dos formatos Arrow e divisão das planilhas .xlsx no limite de linhas.
+#   Os .xlsx são conferidos diretamente no XML das planilhas (sem depender de um leitor de Excel).
+#
+
+from zipfile import ZipFile
+
+import duckdb
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import pytest
+import re
+
+from rfb_cnpj_etl import exporter
+from rfb_cnpj_etl.exporter import export
+
+import rfb_cnpj_etl
+
+ROWS = 10
+
+
+@pytest.fixture
+def relation():
+    con = duckdb.connect()
+    yield con.sql(f"SELECT i AS cnpj_base, 'nome ' || i AS nome, DATE '2024-01-01' + CAST(i AS INTEGER) AS data FROM range({ROWS}) t(i) ORDER BY i")
+    con.close()
+
+
+def read_sheets(xlsx_file: str):
+    # Linhas (valores das células, em texto) de cada planilha, na ordem das planilhas. No modo 'constant_memory', os textos
+    #   ficam na própria célula ('inlineStr').
+    with ZipFile(xlsx_file) as z:
+        sheets = sorted((n for n in z.namelist() if re.fullmatch(r"xl/worksheets/sheet\d+\.xml", n)), key=lambda n: int(re.findall(r"\d+", n)[0]))
+        return [
+            [
+                [number or text for number, text in re.findall(r"<c [^>]*>(?:<v>([^<]*)</v>|<is><t>([^<]*)</t></is>)</c>", row)]
+                for row in re.findall(r"<row [^>]*>(.*?)</row>", z.read(sheet).decode())
+            ]
+            for sheet in sheets
+        ]
+
+
+@pytest.mark.parametrize(
+    "extension, read",
+    [
+        (".parquet", pq.read_table),
+        (".csv", pyarrow.csv.read_csv),
+        (".arrow", lambda f: pyarrow.ipc.open_file(f).read_all()),
+    ],
+)
+def test_export_formats(tmp_path, relation, extension, read):
+    out_file = str(tmp_path / f"result{extension}")
+
+    assert export(relation, out_file, batch_size=3) == ROWS
+
+    table = read(out_file)
+    assert table.column_names == ["cnpj_base", "nome", "data"]
+    assert table.column("cnpj_base").to_pylist() == list(range(ROWS))
+    assert table.column("nome").to_pylist() == [f"nome {i}" for i in range(ROWS)]
+
+
+def test_xlsx_split_sheets(tmp_path, relation, monkeypatch):
+    # Limite de 4 linhas por planilha: 10 linhas em 3 planilhas (4, 4 e 2), cada uma com o cabeçalho.
+    monkeypatch.setattr(exporter, "XLSX_MAX_ROWS", 4)
+    out_file = str(tmp_path / "result.xlsx")
+
+    assert export(relation, out_file, batch_size=3) == ROWS
+
+    sheets = read_sheets(out_file)
+    assert [len(rows) for rows in sheets] == [5, 5, 3]
+    assert all(rows[0] == ["cnpj_base", "nome", "data"] for rows in sheets)
+    assert [int(rows[1][0]) for rows in sheets] == [0, 4, 8]
+    assert sheets[-1][-1][:2] == ["9", "nome 9"]
+
+
+def test_xlsx_empty_result(tmp_path, relation):
+    out_file = str(tmp_path / "result.xlsx")
+
+    assert export(relation.filter("cnpj_base < 0"), out_file) == 0
+    assert read_sheets(out_file) == [[["cnpj_base", "nome", "data"]]]
+
+
+def test_unsupported_format(tmp_path, relation):
+    with pytest.raises(ValueError, match="Unsupported output format '.json'"):
+        export(relation, str(tmp_path / "result.json"))
+
+
+def test_public_export_is_the_function():
+    # 'rfb_cnpj_etl.export' é a função, mesmo depois de o módulo exporter ter sido importado.
+    assert rfb_cnpj_etl.export is export
@@ -0,0 +1,53 @@
+#
+# Consultas (queries.py) sobre um banco L3 criado a partir da base sintética do B0.
+#
+
+from os import chdir, getcwd
+
+import duckdb
+import pytest
+import sys
+
+from rfb_cnpj_etl import B0_synthetic, L1_extract, L2_load, L3_refine, queries
+from rfb_cnpj_etl.config import connect
+
+
+@pytest.fixture(scope="module")
+def db_file(tmp_path_factory):
+    root = tmp_path_factory.mktemp("gold")
+    B0_synthetic.generate(str(root), 0.0001)
+    cwd, argv = getcwd(), sys.argv
+    try:
+        chdir(root)
+        sys.argv = ["L2_load"]
+        L1_extract.main()
+        L2_load.main()
+        L3_refine.refine()
+    finally:
+        chdir(cwd)
+        sys.argv = argv
+    return str(root / L3_refine.OUTPUT_FOLDER / "rfb-cnpj.duckdb")
+
+
+@pytest.fixture
+def con(db_file):
+    with connect(db_file, read_only=True) as con:
+        yield con
+
+
+def sample_cnpjs(con: duckdb.DuckDBPyConnection, offset: int, limit: int):
+    sql = f"SELECT cnpj_format(cnpj_base, cnpj_ordem, cnpj_dv) FROM estabelecimento ORDER BY ALL LIMIT {limit} OFFSET {offset}"
+    return [r[0] for r in con.sql(sql).fetchall()]
+
+
+def test_by_cnpj_file_relations_are_independent(con, tmp_path):
+    # Duas chamadas na mesma conexão: a relação da primeira continua com os CNPJs do seu arquivo.
+    first, second = sample_cnpjs(con, 0, 2), sample_cnpjs(con, 10, 3)
+    for name, cnpjs in (("a.csv", first), ("b.csv", second)):
+        (tmp_path / name).write_text("cnpj\n" + "".join(f"{c}\n" for c in cnpjs), encoding="utf-8")
+
+    a = queries.by_cnpj_file(con, str(tmp_path / "a.csv"))
+    b = queries.by_cnpj_file(con, str(tmp_path / "b.csv"))
+
+    assert sorted(r[0] for r in b.fetchall()) == second
+    assert sorted(r[0] for r in a.fetchall()) == first